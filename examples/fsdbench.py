@@ -0,0 +1,56 @@
+# FSD footer lookup benchmark - compares key lookups in FSD tables with and
+# without the footer acceleration structures.
+#
+# usage: python fsdbench.py
+#
+# This script is freeware. Do whatever you want with it
+# Disclaimer: Use at your own risk
+
+evePath = "E:/EVE"
+
+import random
+import time
+
+from reverence import blue, fsd
+
+# (cfg attribute, static name) of the tables to test with.
+tables = (
+	("fsdTypeOverrides", "typeIDs"),
+	("graphics", "graphicIDs"),
+	("icons", "iconIDs"),
+)
+
+rounds = 5
+
+eve = blue.EVE(evePath)
+cfg = eve.getconfigmgr()
+
+def bench(func, keys):
+	best = None
+	for i in xrange(rounds):
+		start = time.clock()
+		for key in keys:
+			func(key)
+		t = time.clock() - start
+		best = t if best is None else min(best, t)
+	return best
+
+print "%-20s %-8s %8s %12s %12s" % ("static", "mode", "keys", "footer (us)", "get (us)")
+
+for attr, staticName in tables:
+	keys = None
+	for accelerate in (False, True):
+		fsd.accelerateFooters = accelerate
+
+		# force a reload of the table with the current setting
+		cfg.__dict__.pop(attr, None)
+		table = getattr(cfg, attr)
+
+		if keys is None:
+			keys = list(table.iterkeys())
+			random.shuffle(keys)
+
+		footer = bench(table.footer.Get, keys)
+		get = bench(table.get, keys)
+
+		print "%-20s %-8s %8d %12.3f %12.3f" % (staticName, ("accel" if accelerate else "plain"), len(keys), footer*1e6/len(keys), get*1e6/len(keys))
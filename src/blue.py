@@ -186,6 +186,9 @@ class EVE(object):
 		self.paths._set_known_paths(cache=cachepath, sharedcache=sharedcachepath, wineprefix=wineprefix)
 		self.protocol = self.paths._discover(self.server_name, self.server_ip, protocol)
 
+		# arguments to create an identical instance with in another process.
+		self._initargs = dict(root=root, server=server, protocol=self.protocol, languageID=languageID, cachepath=cachepath, sharedcachepath=sharedcachepath, wineprefix=wineprefix)
+
 		# default cache
 		self.cache = cache.CacheMgr(self)
 
@@ -231,12 +234,13 @@ def _readstringstable():
 	from . import strings
 
 	marshal._stringtable[:] = strings.stringTable
-	#marshal._stringtable_rev.clear()
+	marshal._stringtable_rev.clear()
 
-	#c = 1
-	#for line in strings.stringsTable:
-	#	marshal._stringtable_rev[line] = c
-	#	c+=1
+	# reverse lookup for marshal.Save. index 0 is None, not a string.
+	c = 1
+	for line in strings.stringTable[1:]:
+		marshal._stringtable_rev[line] = c
+		c += 1
 
 
 
@@ -271,9 +275,77 @@ def dbrow_str(row):
 _blue.dbrow_str = dbrow_str
 
 
+# Lazily decoded list-like objects. marshal.lazyload hands a list subclass
+# instance built by NEWOBJ/REDUCE (e.g. a CRowset) to _lazylist along with
+# the lazy sequence of its items. The instance is switched to a subclass of
+# its own class that reads the items from the sequence, until anything else
+# is done with it. At that point the items are put in the list proper and
+# the instance reverts to its own class.
+
+class _LazyList(object):
+	# methods of the subclass. it must not add to the instance layout.
+	__slots__ = ()
+
+	def _materialize(self):
+		items = self.__dict__.pop("_lazyitems")
+		self.__class__ = self.__class__.__base__
+		list.extend(self, items)
+
+	def __len__(self):
+		return len(self._lazyitems)
+
+	def __getitem__(self, index):
+		return self._lazyitems[index]
+
+	def __getslice__(self, i, j):
+		return self._lazyitems[max(i, 0):max(j, 0)]
+
+	def __iter__(self):
+		return iter(self._lazyitems)
+
+	def __reversed__(self):
+		return reversed(self._lazyitems)
+
+	def __contains__(self, item):
+		return item in self._lazyitems
+
+def _materializing(name):
+	def method(self, *args, **kw):
+		self._materialize()
+		return getattr(self, name)(*args, **kw)
+	method.__name__ = name
+	return method
+
+for _name in ("append", "extend", "insert", "pop", "remove", "reverse", "sort", "index", "count",
+	"__setitem__", "__delitem__", "__setslice__", "__delslice__", "__iadd__", "__imul__",
+	"__add__", "__mul__", "__rmul__", "__eq__", "__ne__", "__lt__", "__le__", "__gt__", "__ge__",
+	"__repr__", "__reduce__", "__reduce_ex__", "__sizeof__"):
+	setattr(_LazyList, _name, _materializing(_name))
+
+_lazyclasses = {}
+
+def _lazylist(obj, items):
+	if not hasattr(obj, "__dict__"):
+		# nowhere to keep the items.
+		list.extend(obj, items)
+		return obj
+
+	cls = obj.__class__
+	try:
+		lazycls = _lazyclasses[cls]
+	except KeyError:
+		attrs = dict(vars(_LazyList), __module__=cls.__module__)
+		lazycls = _lazyclasses[cls] = type(cls.__name__, (cls,), attrs)
+
+	obj.__dict__["_lazyitems"] = items
+	obj.__class__ = lazycls
+	return obj
+
+
 # set the helper functions in the marshaller and init strings table
 marshal._set_find_global_func(_find_global)
 marshal._set_debug_func(_debug)
+marshal._set_lazylist_func(_lazylist)
 _readstringstable()
 
 # hack to make CCP zip libs accept our not-exactly-the-same environment
@@ -264,20 +264,12 @@ setToCD(PyDBRowObject *row, ColumnDescriptor *cd, PyObject *obj)
 }
 
 
-__inline ColumnDescriptor *
-findCD(PyDBRowObject *self, char *name)
+__inline int
+findColumn(PyDBRowObject *self, PyObject *name)
 {
-	ColumnDescriptor *cd;
-	int i;
-
-	// find named column in the list...
-	for(i=0; i<self->dbrow_header->ob_size; i++)
-	{
-		cd = &self->dbrow_header->rd_cd[i];
-		if(!strcmp(cd->cd_name, name))
-			return cd;
-	}
-	return NULL;
+	// returns index of named column or property, or -1 if there is none.
+	PyObject *ix = PyDict_GetItem(self->dbrow_header->rd_lookup, name);
+	return ix ? PyInt_AS_LONG(ix) : -1;
 }
 
 
@@ -286,6 +278,49 @@ findCD(PyDBRowObject *self, char *name)
 // DBRowDescriptor
 //============================================================================
  
+static int
+rd_build_lookup(PyDBRowDescriptorObject *self)
+{
+	// (re)builds the name -> index map used to look up columns by name.
+	// Names are interned, so lookups with attribute names (which Python
+	// interns) mostly resolve on pointer identity. When names occur more
+	// than once, columns win over properties, and earlier over later.
+
+	PyObject *lookup, *name, *ix;
+	int i, result;
+
+	if(!(lookup = PyDict_New()))
+		return 0;
+
+	for(i = self->ob_size + self->rd_prop_size - 1; i >= 0; i--)
+	{
+		if(i < self->ob_size)
+			name = PyString_InternFromString(self->rd_cd[i].cd_name);
+		else
+			name = PyString_InternFromString(PyString_AS_STRING(PyTuple_GET_ITEM(PyList_GET_ITEM(self->rd_properties, i - self->ob_size), 0)));
+
+		if(!name || !(ix = PyInt_FromLong(i)))
+		{
+			Py_XDECREF(name);
+			Py_DECREF(lookup);
+			return 0;
+		}
+
+		result = PyDict_SetItem(lookup, name, ix);
+		Py_DECREF(name);
+		Py_DECREF(ix);
+		if(result)
+		{
+			Py_DECREF(lookup);
+			return 0;
+		}
+	}
+
+	Py_XDECREF(self->rd_lookup);
+	self->rd_lookup = lookup;
+	return 1;
+}
+
 
 static PyObject *
 rd_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
@@ -322,6 +357,7 @@ rd_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
 	self->rd_header = NULL;
 	self->rd_unpacked_size = 0;
 	self->rd_properties = NULL;
+	self->rd_lookup = NULL;
 	self->rd_prop_size = 0;
 
 	// fill the descriptors
@@ -439,6 +475,12 @@ rd_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
 		}
 	}
 
+	if(!rd_build_lookup(self))
+	{
+		Py_DECREF(self);
+		return NULL;
+	}
+
 	return (PyObject *)self;
 
 rdfail:
@@ -474,6 +516,7 @@ rd_dealloc(PyDBRowDescriptorObject *self)
 	Py_XDECREF(self->rd_header);
 	Py_XDECREF(self->rd_initarg);
 	Py_XDECREF(self->rd_properties);
+	Py_XDECREF(self->rd_lookup);
 
 	self->rd_header = self->rd_initarg = NULL;
 	self->ob_type->tp_free((PyObject *)self);
@@ -498,6 +541,13 @@ rd_getattr(PyDBRowDescriptorObject *self, PyObject *key)
 	if(!strcmp(attr, "__guid__"))
 		return (PyObject *)PyString_FromString("blue.DBRowDescriptor");
 
+	if(!strcmp(attr, "columns"))
+	{
+		// the ((name, type), ...) tuple the descriptor was created with.
+		Py_INCREF(self->rd_initarg);
+		return self->rd_initarg;
+	}
+
 	return PyObject_GenericGetAttr((PyObject *)self, key);
 }
 
@@ -541,6 +591,9 @@ rd_setstate(PyDBRowDescriptorObject *self, PyObject *state)
 	self->rd_properties = state;
 	Py_INCREF(self->rd_properties);
 
+	if(!rd_build_lookup(self))
+		return NULL;
+
 	Py_INCREF(Py_None);
 	return Py_None;
 }
@@ -777,15 +830,33 @@ PyDBRow_New(PyDBRowDescriptorObject *header, char *in, int in_size)
 }
 
 
-static PyObject *
-dbrow_pack(PyDBRowObject *self)
+PyObject *
+PyDBRow_Pack(PyDBRowObject *self)
 {
-	char packed[256];
+	// Return value: New Reference
+	PyObject *result;
+	int unpacked_size = self->dbrow_header->rd_unpacked_size;
 	int packed_size = 0;
 
-	rle_pack(self->dbrow_data, self->dbrow_header->rd_unpacked_size, packed, &packed_size);
+	// worst case the RLE output is 1/16th larger than the input (a nibble
+	// for every 8 bytes), plus a partial nibble byte. pack straight into
+	// the result string and shrink it afterwards.
+	if(!(result = PyString_FromStringAndSize(NULL, unpacked_size + unpacked_size/16 + 2)))
+		return NULL;
+
+	rle_pack(self->dbrow_data, unpacked_size, PyString_AS_STRING(result), &packed_size);
+
+	if(_PyString_Resize(&result, packed_size) == -1)
+		return NULL;
+
+	return result;
+}
+
 
-	return (PyObject *)PyString_FromStringAndSize(packed, packed_size);
+static PyObject *
+dbrow_pack(PyDBRowObject *self)
+{
+	return PyDBRow_Pack(self);
 }
 
 
@@ -873,29 +944,18 @@ dbrow_dealloc(PyDBRowObject *self)
 int
 dbrow_setattr(PyDBRowObject *self, PyObject *name, PyObject *value)
 {
-	int i;
-	PyObject *item;
-
 	if(PyString_Check(name))
 	{
-		char *attr = PyString_AsString(name);
-		ColumnDescriptor *cd = findCD(self, attr);
-
-		if(cd)
-			return setToCD(self, cd, value);
+		int i = findColumn(self, name);
 
-		if(self->dbrow_header->rd_properties)
+		if(i >= self->dbrow_header->ob_size)
 		{
-			for(i=0; i<self->dbrow_header->rd_prop_size; i++)
-			{
-				item = PyList_GET_ITEM(self->dbrow_header->rd_properties, i);
-				if(!strcmp(attr, PyString_AS_STRING(PyTuple_GET_ITEM(item, 0))))
-				{
-					PyErr_SetString(PyExc_AttributeError, "read only attribute");
-					return -1;
-				}
-			}
+			PyErr_SetString(PyExc_AttributeError, "read only attribute");
+			return -1;
 		}
+
+		if(i >= 0)
+			return setToCD(self, &self->dbrow_header->rd_cd[i], value);
 	}
 	return PyObject_GenericSetAttr((PyObject *)self, name, value);
 }
@@ -908,50 +968,35 @@ dbrow_getattr(PyDBRowObject *self, PyObject *name)
 
 	if(PyString_Check(name))
 	{
+		const char *attr = PyString_AS_STRING(name);
 		int i;
-		const char *attr = PyString_AsString(name);
-		ColumnDescriptor *cdi;
-		PyObject *item;
-
-		if(!strcmp("__header__", attr))
-		{
-			Py_INCREF(self->dbrow_header);
-			return (PyObject *)self->dbrow_header;
-		}
 
-		if(!strcmp("__keys__", attr))
+		if(attr[0] == '_' && attr[1] == '_')
 		{
-			return rd_Keys(self->dbrow_header);
-		}
-
-		if(!strcmp("__guid__", attr))
-		{
-			return (PyObject *)PyString_FromString("blue.DBRow");
-		}
+			if(!strcmp("__header__", attr))
+			{
+				Py_INCREF(self->dbrow_header);
+				return (PyObject *)self->dbrow_header;
+			}
 
-		// find named column in the list...
-		for(i=0; i<self->dbrow_header->ob_size; i++)
-		{
-			cdi = &self->dbrow_header->rd_cd[i];
-			if(!strcmp(cdi->cd_name, attr))
+			if(!strcmp("__keys__", attr))
 			{
-				cd = cdi;
-				break;
+				return rd_Keys(self->dbrow_header);
 			}
-		}
 
-		// see if we have properties
-		if(!cd && self->dbrow_header->rd_properties)
-		{
-			for(i=0; i<self->dbrow_header->rd_prop_size; i++)
+			if(!strcmp("__guid__", attr))
 			{
-				item = PyList_GET_ITEM(self->dbrow_header->rd_properties, i);
-				if(!strcmp(attr, PyString_AS_STRING(PyTuple_GET_ITEM(item, 0))))
-				{
-					return PyObject_CallFunction(PyTuple_GET_ITEM(item, 1), "O", self);
-				}
+				return (PyObject *)PyString_FromString("blue.DBRow");
 			}
 		}
+
+		// column or property?
+		i = findColumn(self, name);
+		if(i >= self->dbrow_header->ob_size)
+			return PyObject_CallFunction(PyTuple_GET_ITEM(PyList_GET_ITEM(self->dbrow_header->rd_properties, i - self->dbrow_header->ob_size), 1), "O", self);
+
+		if(i >= 0)
+			cd = &self->dbrow_header->rd_cd[i];
 	}
 	else if(PyInt_Check(name))
 	{
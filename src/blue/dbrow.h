@@ -77,6 +77,8 @@ typedef struct {
 	PyObject *rd_properties;			// List with properties or NULL
 	int rd_prop_size;					// number of properties
 
+	PyObject *rd_lookup;				// Dict of interned name -> column index (properties follow columns)
+
 	// ob_size will be the number of columns (not counting properties)
 	int rd_num_objects;					// number of non-scalar entries
 
@@ -109,6 +111,9 @@ extern PyObject *PyDBRow_New(PyDBRowDescriptorObject *header, char *in, int in_s
 
 extern int dbrow_append_internal(PyDBRowObject *self, PyObject *item);
 
+// used by marshal.Save
+extern PyObject *PyDBRow_Pack(PyDBRowObject *self);
+
 extern int init_dbrow(PyObject *);
 
 #ifdef __cplusplus
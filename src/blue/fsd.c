@@ -3,6 +3,10 @@
 //
 // - FsdUnsignedIntegerKeyMap
 //     efficient binary blob keymap class for FSD indices/dicts
+//     (with batch lookup support)
+//
+// - FsdList / FsdDict
+//     native versions of the FSD list and (integer keyed) dict containers
 //
 // - _uint32_from / _int32_from
 //     faster integer unpacking functions.
@@ -15,6 +19,7 @@
 */
 
 #include "Python.h"
+#include "structmember.h"
 #include "fsd.h"
 
 #include <stdio.h>
@@ -137,6 +142,136 @@ PyTypeObject PyKeyMapIterator_Type = {
 // FsdUnsignedIntegerKeyMap
 //
 
+#define KM_ENTRY(self, i) ((keymap_entry *)&(((char *)(self)->km_map->entry)[(self)->km_entrysize * (i)]))
+#define KM_LESS(self, a, b) ((self)->km_signed ? (int32_t)(a) < (int32_t)(b) : (a) < (b))
+
+// signed keys xor'ed with this sort the same as unsigned ones.
+#define KM_BIAS(self) ((self)->km_signed ? 0x80000000u : 0)
+
+#define ACCEL_NONE 0       // bsearch on the map itself
+#define ACCEL_DIRECT 1     // table of entry indices, indexed by key-km_first
+#define ACCEL_EYTZINGER 2  // keys in Eytzinger (BFS) order, followed by entry indices
+
+// maps with fewer entries are searched directly.
+#define ACCEL_MIN_COUNT 16
+
+static void
+_free_accel(PyKeyMapObject *self)
+{
+	if(self->km_accel)
+		PyMem_FREE(self->km_accel);
+	self->km_accel = NULL;
+	self->km_accel_mode = ACCEL_NONE;
+}
+
+static int
+_eytzinger_fill(PyKeyMapObject *self, uint32_t *keys, int32_t *ixs, int i, int k)
+{
+	// in-order walk of the implicit tree, assigning entries in sorted order.
+	if(k <= self->km_map->count)
+	{
+		i = _eytzinger_fill(self, keys, ixs, i, 2*k);
+		keys[k] = KM_ENTRY(self, i)->key ^ KM_BIAS(self);
+		ixs[k] = i++;
+		i = _eytzinger_fill(self, keys, ixs, i, 2*k+1);
+	}
+	return i;
+}
+
+static int
+_build_accel(PyKeyMapObject *self)
+{
+	// Builds a structure to speed up key lookups. Dense keys get a direct
+	// lookup table, others an Eytzinger layout copy of the keys, which is
+	// binary searched with far fewer cache misses than the map itself.
+	// Returns 0 on memory error.
+
+	int count = self->km_map->count;
+	uint32_t bias = KM_BIAS(self);
+	uint32_t span;
+	int i;
+
+	_free_accel(self);
+
+	if(count < ACCEL_MIN_COUNT)
+		return 1;
+
+	// both structures require ordered, unique keys.
+	for(i=1; i<count; i++)
+		if((KM_ENTRY(self, i)->key ^ bias) <= (KM_ENTRY(self, i-1)->key ^ bias))
+			return 1;
+
+	self->km_first = KM_ENTRY(self, 0)->key;
+	span = KM_ENTRY(self, count-1)->key - self->km_first + 1;
+
+	if(span && span <= (uint32_t)count * 2)
+	{
+		int32_t *table;
+		if(!(table = self->km_accel = PyMem_MALLOC(span * sizeof(int32_t))))
+			goto nomem;
+		memset(table, 0xff, span * sizeof(int32_t));
+		for(i=0; i<count; i++)
+			table[KM_ENTRY(self, i)->key - self->km_first] = i;
+		self->km_span = span;
+		self->km_accel_mode = ACCEL_DIRECT;
+	}
+	else
+	{
+		uint32_t *keys;
+		if(!(keys = self->km_accel = PyMem_MALLOC((count + 1) * (sizeof(uint32_t) + sizeof(int32_t)))))
+			goto nomem;
+		_eytzinger_fill(self, keys, (int32_t *)&keys[count+1], 0, 1);
+		self->km_accel_mode = ACCEL_EYTZINGER;
+	}
+	return 1;
+
+nomem:
+	PyErr_NoMemory();
+	return 0;
+}
+
+static int _keycmp(keymap_entry *a, keymap_entry *b)
+{
+	return a->key - b->key;
+}
+
+__inline static keymap_entry *
+_find(PyKeyMapObject *self, uint32_t k)
+{
+	// returns entry for key k, or NULL if there is none.
+	int i, count = self->km_map->count;
+
+	switch(self->km_accel_mode)
+	{
+		case ACCEL_DIRECT:
+			k -= self->km_first;
+			if(k < self->km_span && (i = ((int32_t *)self->km_accel)[k]) >= 0)
+				return KM_ENTRY(self, i);
+			return NULL;
+
+		case ACCEL_EYTZINGER:
+		{
+			uint32_t *keys = self->km_accel;
+			k ^= KM_BIAS(self);
+			i = 1;
+			while(i <= count)
+				i = 2*i + (keys[i] < k);
+			// strip the right turns taken after the last left turn.
+			while(i & 1)
+				i >>= 1;
+			i >>= 1;
+			if(i && keys[i] == k)
+				return KM_ENTRY(self, ((int32_t *)&keys[count+1])[i]);
+			return NULL;
+		}
+
+		default:
+			/* note: using &k as a keymap_entry* parameter to the _keycmp function.
+			   this works because only the first member of it (key) is accessed. */
+			return bsearch(&k, self->km_map->entry, count, self->km_entrysize, (void *)_keycmp);
+	}
+}
+
 static PyObject *
 keymap_initialize(PyKeyMapObject *self, PyObject *args)
 {
@@ -146,10 +281,11 @@ keymap_initialize(PyKeyMapObject *self, PyObject *args)
 	int offset = 0;
 	int hassize = 1;
 	int issigned = 0;
+	int accelerate = 1;
 
 	self->km_add = 0;
 
-	if(!PyArg_ParseTuple(args, "S|iiii:Initialize", &pydata, &offset, &hassize, &issigned, &self->km_add))
+	if(!PyArg_ParseTuple(args, "S|iiiii:Initialize", &pydata, &offset, &hassize, &issigned, &self->km_add, &accelerate))
 		return NULL;
 
 	PyString_AsStringAndSize((PyObject *)pydata, &data, &size);
@@ -178,9 +314,18 @@ keymap_initialize(PyKeyMapObject *self, PyObject *args)
 	}
 
 	// keep safety reference to string object
+	Py_XDECREF(self->km_ref);
 	self->km_ref = (PyObject *)pydata;
 	Py_INCREF(pydata);
 
+	if(accelerate)
+	{
+		if(!_build_accel(self))
+			return NULL;
+	}
+	else
+		_free_accel(self);
+
 	Py_INCREF(Py_None);
 
 	return Py_None;
@@ -194,12 +339,6 @@ keymap_getattr(PyKeyMapObject *self, PyObject *name)
 }
 
 
-static int _keycmp(keymap_entry *a, keymap_entry *b)
-{
-	return a->key - b->key;
-}
-
-
 __inline static PyObject *
 _internal_get(PyKeyMapObject *self, PyObject *key, int raise)
 {
@@ -217,9 +356,7 @@ _internal_get(PyKeyMapObject *self, PyObject *key, int raise)
 
 	k = PyInt_AsLong(key);
 
-	/* note: using &k as a keymap_entry* parameter to the _keycmp function.
-	   this works because only the first member of it (key) is accessed. */
-	entry = bsearch(&k, self->km_map->entry, self->km_map->count, self->km_entrysize, (void *)_keycmp);
+	entry = _find(self, k);
 	if(!entry)
 	{
 		if(raise)
@@ -242,6 +379,183 @@ keymap_get(PyKeyMapObject *self, PyObject *key)
 	return _internal_get(self, key, 0);
 }
 
+
+__inline static int
+_lower_bound(PyKeyMapObject *self, int lo, int hi, uint32_t k)
+{
+	// returns index of first entry in [lo, hi) with key not less than k.
+	int mid;
+	while(lo < hi)
+	{
+		mid = lo + (hi - lo) / 2;
+		if(KM_LESS(self, KM_ENTRY(self, mid)->key, k))
+			lo = mid + 1;
+		else
+			hi = mid;
+	}
+	return lo;
+}
+
+static PyObject *
+keymap_getmany(PyKeyMapObject *self, PyObject *keys)
+{
+	// Looks up a sequence of keys (or an array of 4-byte integers) at once.
+	// Returns (offsets, sizes) as two array('i') objects, with offset -1 for
+	// keys that are not in the map. Without an acceleration structure,
+	// sorted keys are resolved by a single merge walk over the map.
+
+	static PyObject *array_type = NULL;
+
+	PyObject *seq = NULL, *item, *offsets = NULL, *sizes = NULL;
+	const void *buffer;
+	Py_ssize_t buffer_size;
+	uint32_t *k = NULL, *k_alloc = NULL;
+	int32_t *out = NULL;
+	int count = self->km_map->count;
+	int n, i, ix, hi, step, pos = 0, sorted = 1;
+	long value;
+	keymap_entry *entry;
+
+	if(!array_type)
+	{
+		PyObject *m = PyImport_ImportModule("array");
+		if(!m)
+			return NULL;
+		array_type = PyObject_GetAttrString(m, "array");
+		Py_DECREF(m);
+		if(!array_type)
+			return NULL;
+	}
+
+	if(PyObject_TypeCheck(keys, (PyTypeObject *)array_type))
+	{
+		// read keys straight from the array if it holds integers of the
+		// right size. any other array takes the per-item path below.
+		if((item = PyObject_GetAttrString(keys, "typecode")) == NULL)
+			return NULL;
+		i = PyString_Check(item) && PyString_GET_SIZE(item) == 1 && *PyString_AS_STRING(item) && strchr("iIlL", *PyString_AS_STRING(item));
+		Py_DECREF(item);
+
+		if(i)
+		{
+			if((item = PyObject_GetAttrString(keys, "itemsize")) == NULL)
+				return NULL;
+			i = (PyInt_AsLong(item) == 4);
+			Py_DECREF(item);
+		}
+
+		if(i)
+		{
+			if(PyObject_AsReadBuffer(keys, &buffer, &buffer_size))
+				return NULL;
+			k = (uint32_t *)buffer;
+			n = buffer_size / 4;
+		}
+	}
+
+	if(!k)
+	{
+		if(!(seq = PySequence_Fast(keys, "GetMany expected a sequence of keys")))
+			return NULL;
+
+		n = PySequence_Fast_GET_SIZE(seq);
+		if(!(k = k_alloc = PyMem_MALLOC(n * sizeof(uint32_t) + 1)))
+		{
+			PyErr_NoMemory();
+			goto fail;
+		}
+
+		for(i=0; i<n; i++)
+		{
+			item = PySequence_Fast_GET_ITEM(seq, i);
+			if(!PyInt_Check(item) && !PyLong_Check(item))
+			{
+				PyErr_SetString(PyExc_ValueError, "GetMany called with non-integer key");
+				goto fail;
+			}
+			if((value = PyInt_AsLong(item)) == -1 && PyErr_Occurred())
+				goto fail;
+			k[i] = value;
+		}
+	}
+
+	if(!(out = PyMem_MALLOC(2 * n * sizeof(int32_t) + 1)))
+	{
+		PyErr_NoMemory();
+		goto fail;
+	}
+
+	if(self->km_accel)
+		sorted = 0;  // direct lookups are faster still.
+	else
+	{
+		for(i=1; i<n; i++)
+		{
+			if(KM_LESS(self, k[i], k[i-1]))
+			{
+				sorted = 0;
+				break;
+			}
+		}
+	}
+
+	for(i=0; i<n; i++)
+	{
+		if(self->km_accel)
+		{
+			entry = _find(self, k[i]);
+		}
+		else if(sorted)
+		{
+			// gallop ahead from the previous position, then binary search
+			// the range the key must be in.
+			hi = pos;
+			step = 1;
+			while(hi < count && KM_LESS(self, KM_ENTRY(self, hi)->key, k[i]))
+			{
+				pos = hi + 1;
+				hi += step;
+				step <<= 1;
+			}
+			ix = pos = _lower_bound(self, pos, (hi < count) ? hi : count, k[i]);
+			entry = (ix < count && KM_ENTRY(self, ix)->key == k[i]) ? KM_ENTRY(self, ix) : NULL;
+		}
+		else
+		{
+			ix = _lower_bound(self, 0, count, k[i]);
+			entry = (ix < count && KM_ENTRY(self, ix)->key == k[i]) ? KM_ENTRY(self, ix) : NULL;
+		}
+
+		if(entry)
+		{
+			out[i] = entry->offset + self->km_add;
+			out[n+i] = (self->km_entrysize == 12) ? entry->size : 0;
+		}
+		else
+		{
+			out[i] = -1;
+			out[n+i] = 0;
+		}
+	}
+
+	if((offsets = PyObject_CallFunction(array_type, "sN", "i", PyString_FromStringAndSize((char *)out, n * sizeof(int32_t)))))
+		sizes = PyObject_CallFunction(array_type, "sN", "i", PyString_FromStringAndSize((char *)&out[n], n * sizeof(int32_t)));
+
+fail:
+	Py_XDECREF(seq);
+	if(k_alloc)
+		PyMem_FREE(k_alloc);
+	if(out)
+		PyMem_FREE(out);
+
+	if(!sizes)
+	{
+		Py_XDECREF(offsets);
+		return NULL;
+	}
+	return Py_BuildValue("NN", offsets, sizes);
+}
+
 static PyObject *
 keymap_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
 {
@@ -256,6 +570,7 @@ static void
 keymap_dealloc(PyKeyMapObject *self)
 {
 	Py_XDECREF(self->km_ref);
+	_free_accel(self);
 	self->ob_type->tp_free((PyObject *)self);
 }
 
@@ -307,7 +622,7 @@ keymap_contains(PyKeyMapObject *self, PyObject *key)
 		return 0;
 
 	k = PyInt_AsLong(key);
-	return !!bsearch(&k, self->km_map->entry, self->km_map->count, self->km_entrysize, (void *)_keycmp);
+	return !!_find(self, k);
 }
 
 
@@ -332,6 +647,7 @@ static PyMappingMethods keymap_as_mapping = {
 static struct PyMethodDef keymap_methods[] = {
 	{"Initialize", (PyCFunction)keymap_initialize, METH_VARARGS, NULL},
 	{"Get", (PyCFunction)keymap_get, METH_O, NULL},
+	{"GetMany", (PyCFunction)keymap_getmany, METH_O, NULL},
 	{"iteritems", (PyCFunction)keymap_iteritems, METH_NOARGS, NULL},
 	{"itervalues", (PyCFunction)keymap_itervalues, METH_NOARGS, NULL},
 	{"iterkeys", (PyCFunction)keymap_iterkeys, METH_NOARGS, NULL},
@@ -532,38 +848,1005 @@ fsd_make_offsets_table(PyObject *self, PyObject *args)
 }
 
 //----------------------------------------------------------------------------
-// _pyFSD module init
+// Native FSD containers
+//
+// C versions of the list and (integer keyed) dict containers in fsd.py, and
+// of the offset table setup of FSD_Object. These read directly from the data
+// buffer, and decode scalar items themselves rather than calling the item
+// loader for each one.
 //
 
-static struct PyMethodDef fsd_methods[] = {
-	{"_uint32_from", (PyCFunction)fsd_uint32_from, METH_VARARGS, NULL},
-	{"_int32_from", (PyCFunction)fsd_int32_from, METH_VARARGS, NULL},
-	{"_float_from", (PyCFunction)fsd_float_from, METH_VARARGS, NULL},
-	{"_double_from", (PyCFunction)fsd_double_from, METH_VARARGS, NULL},
-	{"_string_from", (PyCFunction)fsd_string_from, METH_VARARGS, NULL},
-	{"_bool_from", (PyCFunction)fsd_bool_from, METH_VARARGS, NULL},
-	{"_make_offsets_table", (PyCFunction)fsd_make_offsets_table, METH_VARARGS, NULL},
-	{ NULL, NULL }
-};
+#define FSD_OTHER 0
+#define FSD_INT32 1
+#define FSD_UINT32 2
+#define FSD_FLOAT 3
+#define FSD_DOUBLE 4
+#define FSD_BOOL 5
+#define FSD_STRING 6
 
+static int
+_loader_kind(PyObject *loader)
+{
+	// returns type of scalar the loader decodes, if it is one of ours.
+	PyCFunction f;
+
+	if(!PyCFunction_Check(loader))
+		return FSD_OTHER;
+
+	f = PyCFunction_GET_FUNCTION(loader);
+	if(f == (PyCFunction)fsd_int32_from) return FSD_INT32;
+	if(f == (PyCFunction)fsd_uint32_from) return FSD_UINT32;
+	if(f == (PyCFunction)fsd_float_from) return FSD_FLOAT;
+	if(f == (PyCFunction)fsd_double_from) return FSD_DOUBLE;
+	if(f == (PyCFunction)fsd_bool_from) return FSD_BOOL;
+	if(f == (PyCFunction)fsd_string_from) return FSD_STRING;
+	return FSD_OTHER;
+}
 
-PyObject *
-init_pyFSD(void)
+__inline static int
+_getbuffer(PyObject *data, const char **buf, Py_ssize_t *size)
 {
-	PyObject *m;
+	// data is either a string or a memory map.
+	if(PyString_CheckExact(data))
+	{
+		*buf = PyString_AS_STRING(data);
+		*size = PyString_GET_SIZE(data);
+		return 0;
+	}
+	return PyObject_AsReadBuffer(data, (const void **)buf, size);
+}
 
-	PyKeyMap_Type.ob_type = &PyType_Type;
-	PyKeyMap_Type.tp_alloc = PyType_GenericAlloc;
-	PyKeyMap_Type.tp_free = PyObject_Del;
+static PyObject *
+_decode(int kind, PyObject *loader, PyObject *schema, PyObject *data, const char *buf, Py_ssize_t size, int offset)
+{
+	// decodes the item at offset in data (of which buf is the contents).
+	int32_t length;
 
-	if (PyType_Ready(&PyKeyMap_Type) < 0)
+	switch(kind)
+	{
+		case FSD_INT32:
+			if(offset >= 0 && offset <= size-4)
+				return PyInt_FromLong(*(int32_t *)&buf[offset]);
+			break;
+
+		case FSD_UINT32:
+			if(offset >= 0 && offset <= size-4)
+				return PyLong_FromUnsignedLong(*(uint32_t *)&buf[offset]);
+			break;
+
+		case FSD_FLOAT:
+			if(offset >= 0 && offset <= size-4)
+				return PyFloat_FromDouble((double)*(float *)&buf[offset]);
+			break;
+
+		case FSD_DOUBLE:
+			if(offset >= 0 && offset <= size-8)
+				return PyFloat_FromDouble(*(double *)&buf[offset]);
+			break;
+
+		case FSD_BOOL:
+			if(offset >= 0 && offset <= size-1)
+			{
+				PyObject *b = (buf[offset] == '\xff') ? Py_True : Py_False;
+				Py_INCREF(b);
+				return b;
+			}
+			break;
+
+		case FSD_STRING:
+			if(offset >= 0 && offset <= size-4)
+			{
+				length = *(int32_t *)&buf[offset];
+				if(length >= 0 && length <= size-offset-4)
+					return PyString_FromStringAndSize(&buf[offset+4], length);
+			}
+			break;
+
+		default:
+			return PyObject_CallFunction(loader, "OiO", data, offset, schema);
+	}
+
+	PyErr_Format(PyExc_ValueError, "FSD item at offset %d is out of bounds", offset);
+	return NULL;
+}
+
+static PyObject *
+_outofbounds(const char *what)
+{
+	PyErr_Format(PyExc_ValueError, "%s data is out of bounds", what);
+	return NULL;
+}
+
+
+//----------------------------------------------------------------------------
+// FsdList
+//
+
+static PyObject *
+fsdlist_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
+{
+	// FsdList(data, offset, schema) - same as fsd.FSD_List()
+	PyFsdListObject *self;
+	PyObject *data, *schema, *itemschema, *loader, *v;
+	const char *buf;
+	Py_ssize_t size;
+	int offset, start, count, itemsize = 0;
+
+	if(!PyArg_ParseTuple(args, "OiO!:FsdList", &data, &offset, &PyDict_Type, &schema))
 		return NULL;
 
-	PyKeyMapIterator_Type.ob_type = &PyType_Type;
-	PyKeyMapIterator_Type.tp_alloc = PyType_GenericAlloc;
-	PyKeyMapIterator_Type.tp_free = PyObject_Del;
+	itemschema = PyDict_GetItemString(schema, "itemTypes");
+	if(!itemschema || !PyDict_Check(itemschema) || !(loader = PyDict_GetItemString(itemschema, "loader")))
+	{
+		PyErr_SetString(PyExc_ValueError, "FsdList requires a prepared list schema");
+		return NULL;
+	}
 
-	if (PyType_Ready(&PyKeyMapIterator_Type) < 0)
+	if(PyDict_GetItemString(schema, "fixedItemSize"))
+	{
+		v = PyDict_GetItemString(itemschema, "size");
+		if(!v || (itemsize = PyInt_AsLong(v)) <= 0)
+		{
+			if(!PyErr_Occurred())
+				PyErr_SetString(PyExc_ValueError, "FsdList requires the size of fixed size items");
+			return NULL;
+		}
+	}
+
+	if(_getbuffer(data, &buf, &size))
+		return NULL;
+
+	if((v = PyDict_GetItemString(schema, "length")))
+	{
+		if((count = PyInt_AsLong(v)) == -1 && PyErr_Occurred())
+			return NULL;
+		start = offset;
+	}
+	else
+	{
+		if(offset < 0 || offset > size-4)
+			return _outofbounds("FsdList");
+		count = *(int32_t *)&buf[offset];
+		start = offset;
+		offset += 4;
+	}
+
+	// items (or offsets of items) must be in the buffer.
+	if(count < 0 || offset < 0 || (Py_ssize_t)count * (itemsize ? itemsize : 4) > size - offset)
+		return _outofbounds("FsdList");
+
+	if(!(self = (PyFsdListObject *)type->tp_alloc(type, 0)))
+		return NULL;
+
+	Py_INCREF(data);
+	self->fl_data = data;
+	Py_INCREF(itemschema);
+	self->fl_schema = itemschema;
+	Py_INCREF(loader);
+	self->fl_loader = loader;
+	self->fl_kind = _loader_kind(loader);
+	self->fl_count = count;
+	self->fl_offset = offset;
+	self->fl_start = start;
+	self->fl_itemsize = itemsize;
+
+	return (PyObject *)self;
+}
+
+static void
+fsdlist_dealloc(PyFsdListObject *self)
+{
+	Py_XDECREF(self->fl_data);
+	Py_XDECREF(self->fl_schema);
+	Py_XDECREF(self->fl_loader);
+	self->ob_type->tp_free((PyObject *)self);
+}
+
+static Py_ssize_t
+fsdlist_length(PyFsdListObject *self)
+{
+	return self->fl_count;
+}
+
+static PyObject *
+fsdlist_item(PyFsdListObject *self, Py_ssize_t i)
+{
+	const char *buf;
+	Py_ssize_t size;
+	int offset;
+
+	if(i < 0 || i >= self->fl_count)
+	{
+		PyErr_Format(PyExc_IndexError, "Invalid item index %d for list of length %d", (int)i, self->fl_count);
+		return NULL;
+	}
+
+	if(_getbuffer(self->fl_data, &buf, &size))
+		return NULL;
+
+	if(self->fl_itemsize)
+		offset = self->fl_offset + self->fl_itemsize * (int)i;
+	else
+		offset = self->fl_start + *(int32_t *)&buf[self->fl_offset + 4*i];
+
+	return _decode(self->fl_kind, self->fl_loader, self->fl_schema, self->fl_data, buf, size, offset);
+}
+
+static PyObject *
+fsdlist_subscript(PyFsdListObject *self, PyObject *key)
+{
+	// unlike a list, negative indices are not supported.
+	long i;
+
+	if(!PyInt_Check(key) && !PyLong_Check(key))
+	{
+		PyErr_SetString(PyExc_TypeError, "Invalid key type");
+		return NULL;
+	}
+
+	i = PyInt_AsLong(key);
+	if(i == -1 && PyErr_Occurred())
+		return NULL;
+
+	return fsdlist_item(self, i);
+}
+
+static PyObject *
+fsdlist_repr(PyFsdListObject *self)
+{
+	PyObject *t, *result;
+	if(!(t = PyDict_GetItemString(self->fl_schema, "type")) || !(t = PyObject_Str(t)))
+		return NULL;
+	result = PyString_FromFormat("<%s(values:%s,size:%d)>", (self->fl_itemsize ? "FixedSizeList" : "VariableSizedList"), PyString_AS_STRING(t), self->fl_count);
+	Py_DECREF(t);
+	return result;
+}
+
+
+static PySequenceMethods fsdlist_as_sequence = {
+	(lenfunc)fsdlist_length,		/* sq_length */
+	0,								/* sq_concat */
+	0,								/* sq_repeat */
+	(ssizeargfunc)fsdlist_item,		/* sq_item */
+};
+
+static PyMappingMethods fsdlist_as_mapping = {
+	(lenfunc)fsdlist_length,			/*mp_length*/
+	(binaryfunc)fsdlist_subscript,		/*mp_subscript*/
+	0,									/*mp_ass_subscript*/
+};
+
+static struct PyMemberDef fsdlist_members[] = {
+	{"data", T_OBJECT, offsetof(PyFsdListObject, fl_data), READONLY, NULL},
+	{"itemSchema", T_OBJECT, offsetof(PyFsdListObject, fl_schema), READONLY, NULL},
+	{"count", T_INT, offsetof(PyFsdListObject, fl_count), READONLY, NULL},
+	{NULL}		/* sentinel */
+};
+
+
+PyTypeObject PyFsdList_Type = {
+	PyObject_HEAD_INIT(NULL)
+	0,
+	"FsdList",
+	sizeof(PyFsdListObject),
+	0,
+	(destructor)fsdlist_dealloc,	/* tp_dealloc */
+	0,					/* tp_print */
+	0,					/* tp_getattr */
+	0,					/* tp_setattr */
+	0,					/* tp_compare */
+	(reprfunc)fsdlist_repr,	/* tp_repr */
+	0,					/* tp_as_number */
+	&fsdlist_as_sequence,	/* tp_as_sequence */
+	&fsdlist_as_mapping,	/* tp_as_mapping */
+	0,					/* tp_hash */
+	0,					/* tp_call */
+	0,					/* tp_str */
+	PyObject_GenericGetAttr,	/* tp_getattro */
+	0,					/* tp_setattro */
+	0,					/* tp_as_buffer */
+	Py_TPFLAGS_DEFAULT,	/* tp_flags */
+	0,					/* tp_doc */
+	0,					/* tp_traverse */
+	0,					/* tp_clear */
+	0,					/* tp_richcompare */
+	0,					/* tp_weaklistoffset */
+	PySeqIter_New,		/* tp_iter */
+	0,					/* tp_iternext */
+	0,					/* tp_methods */
+	fsdlist_members,	/* tp_members */
+	0,					/* tp_getset */
+	0,					/* tp_base */
+	0,					/* tp_dict */
+	0,					/* tp_descr_get */
+	0,					/* tp_descr_set */
+	0,					/* tp_dictoffset */
+	0,					/* tp_init */
+	0,					/* tp_alloc */
+	fsdlist_new,		/* tp_new */
+	0,					/* tp_free */
+};
+
+
+//----------------------------------------------------------------------------
+// FsdDict
+//
+
+static PyObject *
+fsddict_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
+{
+	// FsdDict(data, offset, schema, accelerate=1) - same as fsd.FSD_Dict(),
+	// but for integer keys only.
+	PyFsdDictObject *self;
+	PyObject *data, *schema, *keytypes, *valueschema, *loader, *v, *footerdata, *result;
+	PyKeyMapObject *footer;
+	const char *buf;
+	Py_ssize_t size;
+	int offset, endOfFooter, footerOffset, hassize = 1, accelerate = 1;
+
+	if(!PyArg_ParseTuple(args, "OiO!|i:FsdDict", &data, &offset, &PyDict_Type, &schema, &accelerate))
+		return NULL;
+
+	keytypes = PyDict_GetItemString(schema, "keyTypes");
+	valueschema = PyDict_GetItemString(schema, "valueTypes");
+	if(!keytypes || !PyDict_Check(keytypes) || !valueschema || !PyDict_Check(valueschema) \
+	|| !(loader = PyDict_GetItemString(valueschema, "loader")))
+	{
+		PyErr_SetString(PyExc_ValueError, "FsdDict requires a prepared dict schema");
+		return NULL;
+	}
+
+	v = PyDict_GetItemString(keytypes, "type");
+	if(!v || !PyString_Check(v) || strcmp(PyString_AS_STRING(v), "int"))
+	{
+		PyErr_SetString(PyExc_TypeError, "FsdDict only supports integer keys");
+		return NULL;
+	}
+
+	if((v = PyDict_GetItemString(schema, "keyFooter")))
+	{
+		// footer entries only have a size if the footer schema says so.
+		if(!PyDict_Check(v) || !(v = PyDict_GetItemString(v, "itemTypes")) || !PyDict_Check(v) \
+		|| !(v = PyDict_GetItemString(v, "attributes")))
+		{
+			PyErr_SetString(PyExc_ValueError, "FsdDict requires a prepared dict schema");
+			return NULL;
+		}
+		hassize = PyMapping_HasKeyString(v, "size");
+	}
+
+	if(_getbuffer(data, &buf, &size))
+		return NULL;
+
+	if(offset < 0 || offset > size-4)
+		return _outofbounds("FsdDict");
+	endOfFooter = offset + *(int32_t *)&buf[offset];
+	if(endOfFooter < offset || endOfFooter > size-4)
+		return _outofbounds("FsdDict");
+	footerOffset = endOfFooter - *(int32_t *)&buf[endOfFooter];
+	if(footerOffset < offset || footerOffset > endOfFooter)
+		return _outofbounds("FsdDict");
+
+	if(PyString_CheckExact(data))
+	{
+		footerdata = data;
+		Py_INCREF(data);
+	}
+	else
+	{
+		// keymap needs a string. (data is memory mapped)
+		if(!(footerdata = PyString_FromStringAndSize(&buf[footerOffset], endOfFooter+4-footerOffset)))
+			return NULL;
+		footerOffset = 0;
+	}
+
+	if(!(footer = (PyKeyMapObject *)PyKeyMap_Type.tp_new(&PyKeyMap_Type, NULL, NULL)))
+	{
+		Py_DECREF(footerdata);
+		return NULL;
+	}
+
+	if(!(v = Py_BuildValue("(Niiiii)", footerdata, footerOffset, hassize, 1, 0, accelerate)))
+	{
+		Py_DECREF(footer);
+		return NULL;
+	}
+	result = keymap_initialize(footer, v);
+	Py_DECREF(v);
+	if(!result)
+	{
+		Py_DECREF(footer);
+		return NULL;
+	}
+	Py_DECREF(result);
+
+	if(!(self = (PyFsdDictObject *)type->tp_alloc(type, 0)))
+	{
+		Py_DECREF(footer);
+		return NULL;
+	}
+
+	if(!(v = PyDict_GetItemString(schema, "header")))
+		v = Py_None;
+
+	Py_INCREF(data);
+	self->fd_data = data;
+	Py_INCREF(schema);
+	self->fd_schema = schema;
+	Py_INCREF(valueschema);
+	self->fd_valueschema = valueschema;
+	Py_INCREF(loader);
+	self->fd_loader = loader;
+	Py_INCREF(v);
+	self->fd_header = v;
+	self->fd_footer = footer;
+	self->fd_kind = _loader_kind(loader);
+	self->fd_offset = offset + 4;
+
+	return (PyObject *)self;
+}
+
+static void
+fsddict_dealloc(PyFsdDictObject *self)
+{
+	Py_XDECREF(self->fd_data);
+	Py_XDECREF(self->fd_schema);
+	Py_XDECREF(self->fd_valueschema);
+	Py_XDECREF(self->fd_loader);
+	Py_XDECREF(self->fd_header);
+	Py_XDECREF(self->fd_footer);
+	self->ob_type->tp_free((PyObject *)self);
+}
+
+__inline static keymap_entry *
+_fsddict_find(PyFsdDictObject *self, PyObject *key)
+{
+	// returns entry for key, or NULL if there is none.
+	long k;
+
+	if(!PyInt_Check(key) && !PyLong_Check(key))
+		return NULL;
+
+	k = PyInt_AsLong(key);
+	if(k == -1 && PyErr_Occurred())
+	{
+		PyErr_Clear();
+		return NULL;
+	}
+
+	// keys are 32 bits
+	if(k < -2147483648L || k > 4294967295L)
+		return NULL;
+
+	return _find(self->fd_footer, (uint32_t)k);
+}
+
+static PyObject *
+_fsddict_value(PyFsdDictObject *self, keymap_entry *entry)
+{
+	const char *buf;
+	Py_ssize_t size;
+
+	if(_getbuffer(self->fd_data, &buf, &size))
+		return NULL;
+
+	return _decode(self->fd_kind, self->fd_loader, self->fd_valueschema, self->fd_data, buf, size, self->fd_offset + entry->offset + self->fd_footer->km_add);
+}
+
+static PyObject *
+fsddict_subscript(PyFsdDictObject *self, PyObject *key)
+{
+	keymap_entry *entry;
+	PyObject *s;
+
+	if((entry = _fsddict_find(self, key)))
+		return _fsddict_value(self, entry);
+
+	if((s = PyObject_Str(key)))
+	{
+		PyErr_Format(PyExc_KeyError, "key (%s) not found", PyString_AS_STRING(s));
+		Py_DECREF(s);
+	}
+	return NULL;
+}
+
+static PyObject *
+fsddict_get(PyFsdDictObject *self, PyObject *args)
+{
+	keymap_entry *entry;
+	PyObject *key, *def = Py_None;
+
+	if(!PyArg_ParseTuple(args, "O|O:get", &key, &def))
+		return NULL;
+
+	if((entry = _fsddict_find(self, key)))
+		return _fsddict_value(self, entry);
+
+	Py_INCREF(def);
+	return def;
+}
+
+static PyObject *
+fsddict_getmany(PyFsdDictObject *self, PyObject *args)
+{
+	// returns list of values for keys, with default for keys not found.
+	keymap_entry *entry;
+	PyObject *keys, *def = Py_None, *result, *v;
+	Py_ssize_t i, count;
+
+	if(!PyArg_ParseTuple(args, "O|O:get_many", &keys, &def))
+		return NULL;
+
+	if(!(keys = PySequence_Fast(keys, "get_many expects a sequence of keys")))
+		return NULL;
+
+	count = PySequence_Fast_GET_SIZE(keys);
+	if(!(result = PyList_New(count)))
+	{
+		Py_DECREF(keys);
+		return NULL;
+	}
+
+	for(i=0; i<count; i++)
+	{
+		if((entry = _fsddict_find(self, PySequence_Fast_GET_ITEM(keys, i))))
+		{
+			if(!(v = _fsddict_value(self, entry)))
+			{
+				Py_DECREF(result);
+				Py_DECREF(keys);
+				return NULL;
+			}
+		}
+		else
+		{
+			v = def;
+			Py_INCREF(v);
+		}
+		PyList_SET_ITEM(result, i, v);
+	}
+
+	Py_DECREF(keys);
+	return result;
+}
+
+static Py_ssize_t
+fsddict_length(PyFsdDictObject *self)
+{
+	return self->fd_footer->km_map->count;
+}
+
+static int
+fsddict_contains(PyFsdDictObject *self, PyObject *key)
+{
+	return !!_fsddict_find(self, key);
+}
+
+static PyObject *
+fsddict_keys(PyFsdDictObject *self)
+{
+	// same keys as iterkeys() (and FSD_Dict.keys()), so convert them the
+	// same way too.
+	PyObject *iter, *result;
+
+	if(!(iter = keymap_iterkeys(self->fd_footer)))
+		return NULL;
+	result = PySequence_List(iter);
+	Py_DECREF(iter);
+	return result;
+}
+
+static PyObject *
+fsddict_iterkeys(PyFsdDictObject *self)
+{
+	return keymap_iterkeys(self->fd_footer);
+}
+
+static PyObject *
+_fsddict_iter(PyFsdDictObject *self, int mode)
+{
+	PyFsdDictIteratorObject *iter = (PyFsdDictIteratorObject *)PyType_GenericAlloc(&PyFsdDictIterator_Type, 0);
+
+	if(!iter)
+		return NULL;
+
+	iter->fdi_dict = self;
+	iter->fdi_mode = mode;
+
+	Py_INCREF(self);
+	return (PyObject *)iter;
+}
+
+static PyObject *
+fsddict_itervalues(PyFsdDictObject *self)
+{
+	return _fsddict_iter(self, ITERVALUES);
+}
+
+static PyObject *
+fsddict_iteritems(PyFsdDictObject *self)
+{
+	return _fsddict_iter(self, ITERITEMS);
+}
+
+static PyObject *
+fsddict_repr(PyFsdDictObject *self)
+{
+	PyObject *kt, *vt, *result = NULL;
+
+	kt = PyDict_GetItemString(PyDict_GetItemString(self->fd_schema, "keyTypes"), "type");
+	vt = PyDict_GetItemString(self->fd_valueschema, "type");
+	if(!kt || !vt || !(kt = PyObject_Str(kt)))
+		return NULL;
+	if((vt = PyObject_Str(vt)))
+	{
+		result = PyString_FromFormat("<FSD_Dict(keys:%s,values:%s,size:%d)>", PyString_AS_STRING(kt), PyString_AS_STRING(vt), self->fd_footer->km_map->count);
+		Py_DECREF(vt);
+	}
+	Py_DECREF(kt);
+	return result;
+}
+
+
+static PySequenceMethods fsddict_as_sequence = {
+	(lenfunc)fsddict_length,		/* sq_length */
+	0,								/* sq_concat */
+	0,								/* sq_repeat */
+	0,								/* sq_item */
+	0,								/* sq_slice */
+	0,								/* sq_ass_item */
+	0,								/* sq_ass_slice */
+	(objobjproc)fsddict_contains,	/* sq_contains */
+};
+
+static PyMappingMethods fsddict_as_mapping = {
+	(lenfunc)fsddict_length,			/*mp_length*/
+	(binaryfunc)fsddict_subscript,		/*mp_subscript*/
+	0,									/*mp_ass_subscript*/
+};
+
+static struct PyMethodDef fsddict_methods[] = {
+	{"get", (PyCFunction)fsddict_get, METH_VARARGS, NULL},
+	{"get_many", (PyCFunction)fsddict_getmany, METH_VARARGS, NULL},
+	{"keys", (PyCFunction)fsddict_keys, METH_NOARGS, NULL},
+	{"iterkeys", (PyCFunction)fsddict_iterkeys, METH_NOARGS, NULL},
+	{"itervalues", (PyCFunction)fsddict_itervalues, METH_NOARGS, NULL},
+	{"iteritems", (PyCFunction)fsddict_iteritems, METH_NOARGS, NULL},
+
+	{"Get", (PyCFunction)fsddict_subscript, METH_O, NULL},
+	{"GetIfExists", (PyCFunction)fsddict_get, METH_VARARGS, NULL},
+	{NULL,	 NULL}		/* sentinel */
+};
+
+static struct PyMemberDef fsddict_members[] = {
+	{"data", T_OBJECT, offsetof(PyFsdDictObject, fd_data), READONLY, NULL},
+	{"schema", T_OBJECT, offsetof(PyFsdDictObject, fd_schema), READONLY, NULL},
+	{"valueSchema", T_OBJECT, offsetof(PyFsdDictObject, fd_valueschema), READONLY, NULL},
+	{"header", T_OBJECT, offsetof(PyFsdDictObject, fd_header), READONLY, NULL},
+	{"footer", T_OBJECT, offsetof(PyFsdDictObject, fd_footer), READONLY, NULL},
+	{NULL}		/* sentinel */
+};
+
+
+PyTypeObject PyFsdDict_Type = {
+	PyObject_HEAD_INIT(NULL)
+	0,
+	"FsdDict",
+	sizeof(PyFsdDictObject),
+	0,
+	(destructor)fsddict_dealloc,	/* tp_dealloc */
+	0,					/* tp_print */
+	0,					/* tp_getattr */
+	0,					/* tp_setattr */
+	0,					/* tp_compare */
+	(reprfunc)fsddict_repr,	/* tp_repr */
+	0,					/* tp_as_number */
+	&fsddict_as_sequence,	/* tp_as_sequence */
+	&fsddict_as_mapping,	/* tp_as_mapping */
+	0,					/* tp_hash */
+	0,					/* tp_call */
+	0,					/* tp_str */
+	PyObject_GenericGetAttr,	/* tp_getattro */
+	0,					/* tp_setattro */
+	0,					/* tp_as_buffer */
+	Py_TPFLAGS_DEFAULT,	/* tp_flags */
+	0,					/* tp_doc */
+	0,					/* tp_traverse */
+	0,					/* tp_clear */
+	0,					/* tp_richcompare */
+	0,					/* tp_weaklistoffset */
+	(getiterfunc)fsddict_iterkeys,	/* tp_iter */
+	0,					/* tp_iternext */
+	fsddict_methods,	/* tp_methods */
+	fsddict_members,	/* tp_members */
+	0,					/* tp_getset */
+	0,					/* tp_base */
+	0,					/* tp_dict */
+	0,					/* tp_descr_get */
+	0,					/* tp_descr_set */
+	0,					/* tp_dictoffset */
+	0,					/* tp_init */
+	0,					/* tp_alloc */
+	fsddict_new,		/* tp_new */
+	0,					/* tp_free */
+};
+
+
+//----------------------------------------------------------------------------
+// FsdDict Iterator
+//
+
+static void
+fsddictiter_dealloc(PyFsdDictIteratorObject *self)
+{
+	Py_XDECREF(self->fdi_dict);
+	self->ob_type->tp_free((PyObject *)self);
+}
+
+static PyObject *
+fsddictiter_next(PyFsdDictIteratorObject *self)
+{
+	PyKeyMapObject *km = self->fdi_dict->fd_footer;
+	keymap_entry *entry;
+	PyObject *value;
+
+	if(self->fdi_index >= km->km_map->count)
+		return NULL;
+
+	entry = KM_ENTRY(km, self->fdi_index++);
+	value = _fsddict_value(self->fdi_dict, entry);
+	if(!value || self->fdi_mode == ITERVALUES)
+		return value;
+	return Py_BuildValue("iN", entry->key, value);
+}
+
+
+PyTypeObject PyFsdDictIterator_Type = {
+	PyObject_HEAD_INIT(NULL)
+	0,
+	"FsdDictIterator",              /* tp_name */
+	sizeof(PyFsdDictIteratorObject), /* tp_basicsize */
+	0,                              /* tp_itemsize */
+	(destructor)fsddictiter_dealloc, /* tp_dealloc */
+	0,                              /* tp_print */
+	0,                              /* tp_getattr */
+	0,                              /* tp_setattr */
+	0,                              /* tp_reserved */
+	0,                              /* tp_repr */
+	0,                              /* tp_as_number */
+	0,                              /* tp_as_sequence */
+	0,                              /* tp_as_mapping */
+	0,                              /* tp_hash */
+	0,                              /* tp_call */
+	0,                              /* tp_str */
+	0,                              /* tp_getattro */
+	0,                              /* tp_setattro */
+	0,                              /* tp_as_buffer */
+	Py_TPFLAGS_DEFAULT,             /* tp_flags */
+	0,                              /* tp_doc */
+	0,                              /* tp_traverse */
+	0,                              /* tp_clear */
+	0,                              /* tp_richcompare */
+	0,                              /* tp_weaklistoffset */
+	PyObject_SelfIter,              /* tp_iter */
+	(iternextfunc)fsddictiter_next, /* tp_iternext */
+};
+
+
+//----------------------------------------------------------------------------
+// FSD_Object offset tables
+//
+
+static PyObject *
+_present_attributes(PyObject *names, PyObject *lookups, uint32_t bits)
+{
+	// returns list of the names in names that are present according to
+	// the optional attribute bits.
+	PyObject *result, *seq, *name, *v;
+	Py_ssize_t i;
+	long bit;
+
+	if(!(seq = PySequence_Fast(names, "Expected sequence of attribute names")))
+		return NULL;
+
+	if(!(result = PyList_New(0)))
+		goto fail;
+
+	for(i=0; i<PySequence_Fast_GET_SIZE(seq); i++)
+	{
+		name = PySequence_Fast_GET_ITEM(seq, i);
+		bit = (v = PyDict_GetItem(lookups, name)) ? PyInt_AsLong(v) : -1;
+		if(bit & bits)
+		{
+			if(PyList_Append(result, name) < 0)
+				goto fail;
+		}
+	}
+
+	Py_DECREF(seq);
+	return result;
+
+fail:
+	Py_XDECREF(result);
+	Py_DECREF(seq);
+	return NULL;
+}
+
+PyObject *
+fsd_object_offsets(PyObject *self, PyObject *args)
+{
+	// _object_offsets(data, offset, schema)
+	// returns dict of attribute offsets for the object at offset in data.
+	PyObject *data, *schema, *constant, *lookups, *names, *attrs, *seq, *key, *v, *result;
+	const char *buf;
+	Py_ssize_t size, i, num;
+	int offset, end, table, relative;
+	uint32_t bits;
+
+	if(!PyArg_ParseTuple(args, "OiO!:_object_offsets", &data, &offset, &PyDict_Type, &schema))
+		return NULL;
+
+	constant = PyDict_GetItemString(schema, "constantAttributeOffsets");
+	if(!constant || !PyDict_Check(constant))
+	{
+		PyErr_SetString(PyExc_ValueError, "_object_offsets requires a prepared object schema");
+		return NULL;
+	}
+
+	if(PyDict_GetItemString(schema, "size"))
+	{
+		// fixed size object. skip all the scary stuff.
+		Py_INCREF(constant);
+		return constant;
+	}
+
+	v = PyDict_GetItemString(schema, "endOfFixedSizeData");
+	lookups = PyDict_GetItemString(schema, "optionalValueLookups");
+	names = PyDict_GetItemString(schema, "attributesWithVariableOffsets");
+	if(!v || !lookups || !PyDict_Check(lookups) || !names)
+	{
+		PyErr_SetString(PyExc_ValueError, "_object_offsets requires a prepared object schema");
+		return NULL;
+	}
+	if((end = PyInt_AsLong(v)) == -1 && PyErr_Occurred())
+		return NULL;
+
+	if(_getbuffer(data, &buf, &size))
+		return NULL;
+
+	if(offset < 0 || end < 0 || offset + end > size-4)
+		return _outofbounds("FSD_Object");
+
+	if(PyDict_Size(lookups))
+	{
+		// figure out what optional attributes we have.
+		if(!(bits = *(uint32_t *)&buf[offset+end]))
+		{
+			Py_INCREF(constant);
+			return constant;
+		}
+
+		// (the attribute lists are cached in the schema)
+		if(!(key = PyLong_FromUnsignedLong(bits)))
+			return NULL;
+		attrs = PyDict_GetItem(schema, key);
+		if(attrs && PyObject_IsTrue(attrs))
+			Py_INCREF(attrs);
+		else if(!(attrs = _present_attributes(names, lookups, bits)) || PyDict_SetItem(schema, key, attrs) < 0)
+		{
+			Py_DECREF(key);
+			Py_XDECREF(attrs);
+			return NULL;
+		}
+		Py_DECREF(key);
+	}
+	else
+	{
+		// looks like there's just the required attributes.
+		attrs = names;
+		Py_INCREF(attrs);
+	}
+
+	seq = PySequence_Fast(attrs, "Expected sequence of attribute names");
+	Py_DECREF(attrs);
+	if(!seq)
+		return NULL;
+
+	num = PySequence_Fast_GET_SIZE(seq);
+	if(!num)
+	{
+		Py_DECREF(seq);
+		Py_INCREF(constant);
+		return constant;
+	}
+
+	table = offset + end + 4;
+	if(table > size || 4*num > size - table)
+	{
+		Py_DECREF(seq);
+		return _outofbounds("FSD_Object");
+	}
+
+	if(!(result = PyDict_New()))
+	{
+		Py_DECREF(seq);
+		return NULL;
+	}
+
+	// offsets in the table are relative to the end of it.
+	relative = end + 4 + 4*(int)num;
+	for(i=0; i<num; i++)
+	{
+		if(!(v = PyInt_FromLong(relative + ((int32_t *)&buf[table])[i])) \
+		|| PyDict_SetItem(result, PySequence_Fast_GET_ITEM(seq, i), v) < 0)
+		{
+			Py_XDECREF(v);
+			Py_DECREF(result);
+			Py_DECREF(seq);
+			return NULL;
+		}
+		Py_DECREF(v);
+	}
+
+	Py_DECREF(seq);
+
+	if(PyDict_Update(result, constant) < 0)
+	{
+		Py_DECREF(result);
+		return NULL;
+	}
+	return result;
+}
+
+//----------------------------------------------------------------------------
+// _pyFSD module init
+//
+
+static struct PyMethodDef fsd_methods[] = {
+	{"_uint32_from", (PyCFunction)fsd_uint32_from, METH_VARARGS, NULL},
+	{"_int32_from", (PyCFunction)fsd_int32_from, METH_VARARGS, NULL},
+	{"_float_from", (PyCFunction)fsd_float_from, METH_VARARGS, NULL},
+	{"_double_from", (PyCFunction)fsd_double_from, METH_VARARGS, NULL},
+	{"_string_from", (PyCFunction)fsd_string_from, METH_VARARGS, NULL},
+	{"_bool_from", (PyCFunction)fsd_bool_from, METH_VARARGS, NULL},
+	{"_make_offsets_table", (PyCFunction)fsd_make_offsets_table, METH_VARARGS, NULL},
+	{"_object_offsets", (PyCFunction)fsd_object_offsets, METH_VARARGS, NULL},
+	{ NULL, NULL }
+};
+
+
+PyObject *
+init_pyFSD(void)
+{
+	PyObject *m;
+
+	PyKeyMap_Type.ob_type = &PyType_Type;
+	PyKeyMap_Type.tp_alloc = PyType_GenericAlloc;
+	PyKeyMap_Type.tp_free = PyObject_Del;
+
+	if (PyType_Ready(&PyKeyMap_Type) < 0)
+		return NULL;
+
+	PyKeyMapIterator_Type.ob_type = &PyType_Type;
+	PyKeyMapIterator_Type.tp_alloc = PyType_GenericAlloc;
+	PyKeyMapIterator_Type.tp_free = PyObject_Del;
+
+	if (PyType_Ready(&PyKeyMapIterator_Type) < 0)
+		return NULL;
+
+	PyFsdList_Type.tp_alloc = PyType_GenericAlloc;
+	PyFsdList_Type.tp_free = PyObject_Del;
+	if (PyType_Ready(&PyFsdList_Type) < 0)
+		return NULL;
+
+	PyFsdDict_Type.tp_alloc = PyType_GenericAlloc;
+	PyFsdDict_Type.tp_free = PyObject_Del;
+	if (PyType_Ready(&PyFsdDict_Type) < 0)
+		return NULL;
+
+	PyFsdDictIterator_Type.tp_alloc = PyType_GenericAlloc;
+	PyFsdDictIterator_Type.tp_free = PyObject_Del;
+	if (PyType_Ready(&PyFsdDictIterator_Type) < 0)
 		return NULL;
 
 
@@ -574,6 +1857,10 @@ init_pyFSD(void)
 	Py_INCREF(m);
 	Py_INCREF((PyObject*)&PyKeyMap_Type);
 	PyModule_AddObject(m, "FsdUnsignedIntegerKeyMap", (PyObject*)&PyKeyMap_Type);
+	Py_INCREF((PyObject*)&PyFsdList_Type);
+	PyModule_AddObject(m, "FsdList", (PyObject*)&PyFsdList_Type);
+	Py_INCREF((PyObject*)&PyFsdDict_Type);
+	PyModule_AddObject(m, "FsdDict", (PyObject*)&PyFsdDict_Type);
 
 	return m;
 }
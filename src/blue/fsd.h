@@ -28,6 +28,11 @@ typedef struct {
 	int km_entrysize;
 	int km_signed;  // signed keys anyway?
 	int km_add;  // add this to every offset
+
+	void *km_accel;  // lookup acceleration structure (see _build_accel) or NULL
+	int km_accel_mode;
+	uint32_t km_first;  // key of first entry (direct mode)
+	uint32_t km_span;  // number of slots in direct table
 } PyKeyMapObject;
 
 typedef struct {
@@ -38,8 +43,43 @@ typedef struct {
 } PyKeyMapIteratorObject;
 
 
+typedef struct {
+	PyObject_HEAD
+	PyObject *fl_data;    // buffer object the list is in
+	PyObject *fl_schema;  // item schema
+	PyObject *fl_loader;  // item loader
+	int fl_kind;  // scalar item type decoded directly, or FSD_OTHER
+	int fl_count;
+	int fl_offset;  // offset of first item, or of offset table if variable sized
+	int fl_start;  // variable sized item offsets are relative to this
+	int fl_itemsize;  // 0 if variable sized
+} PyFsdListObject;
+
+typedef struct {
+	PyObject_HEAD
+	PyObject *fd_data;    // buffer object the dict is in
+	PyObject *fd_schema;
+	PyObject *fd_valueschema;
+	PyObject *fd_loader;  // value loader
+	PyObject *fd_header;
+	PyKeyMapObject *fd_footer;
+	int fd_kind;  // scalar value type decoded directly, or FSD_OTHER
+	int fd_offset;  // value offsets are relative to this
+} PyFsdDictObject;
+
+typedef struct {
+	PyObject_HEAD
+	PyFsdDictObject *fdi_dict;
+	int fdi_index;
+	int fdi_mode;  // 1 = itervalues, 2 = iteritems
+} PyFsdDictIteratorObject;
+
+
 extern PyTypeObject PyKeyMap_Type;
 extern PyTypeObject PyKeyMapIterator_Type;
+extern PyTypeObject PyFsdList_Type;
+extern PyTypeObject PyFsdDict_Type;
+extern PyTypeObject PyFsdDictIterator_Type;
 
 extern PyObject *init_fsd(void);
 
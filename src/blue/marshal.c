@@ -1,5 +1,5 @@
 /*
-// marshal.c - high-performance iterative EVE cache/bulkdata decoder
+// marshal.c - high-performance iterative EVE cache/bulkdata decoder and encoder
 //
 // Copyright (c) 2003-2013 Jamie "Entity" van den Berge <jamie@hlekkir.com>
 //
@@ -21,6 +21,13 @@ extern unsigned long adler32(unsigned long adler, const char *buf, unsigned int
 
 #define MAX_DEPTH 64  // max object hierarchy depth
 
+#define ALIGNED_PTR(x) (((x) + sizeof(void *)-1) & ~(sizeof(void *)-1))
+
+// mapped streams of at least this size are read in without the GIL (see
+// prefault_stream).
+#define PREFAULT_MIN_SIZE 65536
+#define PAGE_SIZE 4096
+
 static PyObject *constants[256] = {NULL};
 static int needlength[256] = {0};
 
@@ -33,6 +40,7 @@ static char *tokenname[256];
 PyObject *global_cache = NULL;
 PyObject *find_global_func = NULL;
 PyObject *debug_func = NULL;
+PyObject *lazylist_func = NULL;
 PyObject *string_table = NULL;
 
 PyObject *UnmarshalError = NULL;
@@ -110,7 +118,7 @@ void DEBUG(char *text)
 // immediately store object in shared object table
 #define STORE(_obj)\
 {\
-	if(shared_count > shared_mapsize)\
+	if(shared_count >= shared_mapsize)\
 	{\
 		sprintf((error = errortext), "Shared object table overflow (size:%d)", shared_mapsize);\
 		goto fail;\
@@ -349,26 +357,98 @@ set_state(PyObject *obj, PyObject *state)
 	}
 	else
 	{
+		PyObject *slotstate = NULL;
+
 		// container does not have __setstate__, see if it
 		// has a __dict__ to update instead.
 		PyErr_Clear();
-		if(!(__dict__ = PyObject_GetAttr(obj, py__dict__)))
+
+		if(PyTuple_Check(state) && PyTuple_GET_SIZE(state) == 2)
 		{
-			return 0;
+			// (state, slotstate) tuple, as produced by __reduce_ex__(2)
+			// for objects with __slots__.
+			slotstate = PyTuple_GET_ITEM(state, 1);
+			state = PyTuple_GET_ITEM(state, 0);
 		}
 
-		if(PyDict_Update(__dict__, state))
+		if(state != Py_None)
 		{
+			if(!(__dict__ = PyObject_GetAttr(obj, py__dict__)))
+			{
+				return 0;
+			}
+
+			if(PyDict_Update(__dict__, state))
+			{
+				Py_DECREF(__dict__);
+				return 0;
+			}
 			Py_DECREF(__dict__);
-			return 0;
 		}
-		Py_DECREF(__dict__);
+
+		if(slotstate && slotstate != Py_None)
+		{
+			PyObject *key, *value;
+			Py_ssize_t pos = 0;
+
+			if(!PyDict_Check(slotstate))
+			{
+				PyErr_SetString(UnmarshalError, "slot state is not a dictionary");
+				return 0;
+			}
+
+			while(PyDict_Next(slotstate, &pos, &key, &value))
+				if(PyObject_SetAttr(obj, key, value) == -1)
+					return 0;
+		}
 	}
 
 	return 1;
 }
 
 
+static PyObject *
+build_reduced(int type, PyObject *obj)
+{
+	// Return value: New Reference
+	// Creates the object described by the argument tuple of a NEWOBJ or
+	// REDUCE token, and sets its state, if there is one.
+	PyObject *cls, *args, *__new__, *result, *state = NULL;
+
+	if(type == TYPE_NEWOBJ)
+	{
+		if(!(args = PyTuple_GetItem(obj, 0)))
+			return NULL;
+		if(!(cls = PyTuple_GetItem(args, 0)))
+			return NULL;
+
+		if(!(__new__ = PyObject_GetAttr(cls, py__new__)))
+			return NULL;
+
+		result = PyObject_CallObject(__new__, args);
+		Py_DECREF(__new__);
+
+		if(PyTuple_GET_SIZE(obj) > 1)
+			state = PyTuple_GET_ITEM(obj, 1);
+	}
+	else
+	{
+		if(!(args = PyTuple_GetItem(obj, 1)))
+			return NULL;
+
+		result = PyObject_CallObject(PyTuple_GET_ITEM(obj, 0), args);
+
+		if(PyTuple_GET_SIZE(obj) > 2)
+			state = PyTuple_GET_ITEM(obj, 2);
+	}
+
+	if(result && state && !set_state(result, state))
+		Py_CLEAR(result);
+
+	return result;
+}
+
+
 // Pickle support.
 // FIXME: this is currently a single-use unpickler. make it return an unpickler
 // instance instead, for TYPE_PICKLER support (with memo preservation)
@@ -422,95 +502,363 @@ fail:
 }
 
 
-static PyObject *
-marshal_Load_internal(PyObject *py_stream, PyObject *py_callback, int skipcrc)
+// Obtains a read-only pointer to the data of a str or any object supporting
+// the (old or new) buffer protocol. mmap objects only support the old one.
+// On success, view->obj is set if the view must be released afterwards.
+//
+// Only str and new-style buffers are locked while in use. The old protocol
+// hands out a bare pointer that becomes invalid when the exporter goes away
+// (e.g. a closed mmap), so it may only be used until the caller returns. A
+// caller that keeps the pointer for longer passes copy, through which such
+// objects are copied into a new str that the pointer then refers to.
+static int
+get_stream_buffer(PyObject *py_stream, Py_buffer *view, char **stream, Py_ssize_t *size, PyObject **copy)
 {
-	// Return value: New Reference
+	const void *buf;
 
-	char *stream;
-	Py_ssize_t size;
+	view->obj = NULL;
 
-	char *s;
-	char *end;
+	if(PyString_Check(py_stream))
+	{
+		*stream = PyString_AS_STRING(py_stream);
+		*size = PyString_GET_SIZE(py_stream);
+		return 0;
+	}
 
-	int type = -1;   // current object type
-	int shared = -1; // indicates whether current object is shared
-	int i;
+	if(PyObject_CheckBuffer(py_stream))
+	{
+		if(PyObject_GetBuffer(py_stream, view, PyBUF_SIMPLE) == -1)
+		{
+			view->obj = NULL;
+			return -1;
+		}
+		*stream = view->buf;
+		*size = view->len;
+		return 0;
+	}
 
-	char *error = "NO ERROR SPECIFIED";
-	char errortext[256];
+	if(PyObject_CheckReadBuffer(py_stream))
+	{
+		if(!copy)
+			return PyObject_AsReadBuffer(py_stream, (const void **)stream, size);
+
+		if(PyObject_AsReadBuffer(py_stream, &buf, size) == -1)
+			return -1;
+		if(!(*copy = PyString_FromStringAndSize(buf, *size)))
+			return -1;
+		*stream = PyString_AS_STRING(*copy);
+		return 0;
+	}
 
-	Py_ssize_t length = 0;  // generic length value.
+	PyErr_SetString(PyExc_TypeError, "expected string or buffer argument");
+	return -1;
+}
+
+
+// where the objects that fill the shared object slots are in the stream, for
+// decoding them on demand (see lazyload).
+struct LazyIndex {
+	int32_t *offsets;  // per slot, offset of the object's type token
+	int *counts;  // per slot, shared object index counter at that token
+	int depth;  // nesting of on-demand decodes
+};
+
+// this structure holds the state of a decoder, allowing it to be suspended
+// and resumed when streaming items (see iterload).
+struct Decoder {
+	PyObject *py_stream;  // keeps the stream data alive
+	Py_buffer view;
+
+	char *stream;
+	Py_ssize_t size;
+	char *s;    // current position in stream
+	char *end;  // end of object data
+
+	int skipcrc;
 
 	int shared_mapsize;
 	int shared_count;  // shared object index counter
-	int *shared_map;  // points to shared object mapping at end of stream
-	PyObject **shared_obj = NULL;  // holds the shared objects
+	int32_t *shared_map;  // points to shared object mapping at end of stream
+	PyObject **shared_obj;  // holds the shared objects
 
-	PyObject *obj = NULL;  // currently decoded object
-	PyObject *result = NULL;  // final result
+	int ct_ix;
+	struct Container ct_stack[MAX_DEPTH+1];
 
-	int ct_ix = 0;
-	struct Container ct_stack[MAX_DEPTH];
-	struct Container *container = &ct_stack[0];
+	int streaming;  // hand out items of the root container instead of adding them
+	int streamed;  // set once an item was handed out
+	PyObject *root;  // the root object, once complete (streaming mode)
 
-	if(PyString_AsStringAndSize(py_stream, &stream, &size) == -1)
-		return NULL;
+	struct LazyIndex *lazy;  // set if shared objects may be decoded on demand
+	char *token;  // start of the current type token (header decoder)
+};
 
-	s = stream;
+// true if decoder is streaming and the current container is the root container
+#define STREAMING_ROOT (dec->streaming && ct_ix == 1)
 
-	container->obj = NULL;
-	container->type = 0;
-	container->free = -1;
-	container->index = 0;
 
-	if(size < 6 || *s++ != PROTOCOL_ID)
-	{
-		int offset = 0;
-		result = unpickle(py_stream, &offset);
-		if(!result)
-			goto cleanup;
+static void
+prefault_stream(struct Decoder *dec)
+{
+	// Touches every page of a stream that is not a string (e.g. a memory-
+	// mapped file) without the GIL, so that the file is read in while other
+	// threads run, rather than page by page under the GIL during decoding.
+	const char *p, *end = dec->stream + dec->size;
+
+	if(dec->size < PREFAULT_MIN_SIZE || PyString_Check(dec->py_stream))
+		return;
+
+	Py_BEGIN_ALLOW_THREADS
+	for(p = dec->stream; p < end; p += PAGE_SIZE)
+		(void)*(volatile const char *)p;
+	Py_END_ALLOW_THREADS
+}
 
-		return result;
-	}
+
+// decoder_init() flags
+#define DECODER_KEEP 1  // the decoder outlives the call (see get_stream_buffer)
+#define DECODER_PREFAULT 2  // all of the stream is going to be decoded (see prefault_stream)
+
+static int
+decoder_init(struct Decoder *dec, PyObject *py_stream, int skipcrc, int flags)
+{
+	// Returns 1 if the stream is ready to be decoded, 0 if it is not a
+	// marshal stream, -1 on error. decoder_free must be called in any case.
+	PyObject *copy = NULL;
+	char *s;
+	int i;
+
+	dec->py_stream = NULL;
+	dec->view.obj = NULL;
+	dec->skipcrc = skipcrc;
+	dec->shared_mapsize = 0;
+	dec->shared_count = 0;
+	dec->shared_obj = NULL;
+	dec->ct_ix = 0;
+	dec->streaming = 0;
+	dec->streamed = 0;
+	dec->root = NULL;
+	dec->lazy = NULL;
+	dec->token = NULL;
+
+	dec->ct_stack[0].obj = NULL;
+	dec->ct_stack[0].type = 0;
+	dec->ct_stack[0].free = -1;
+	dec->ct_stack[0].index = 0;
+
+	if(get_stream_buffer(py_stream, &dec->view, &dec->stream, &dec->size, (flags & DECODER_KEEP) ? &copy : NULL) == -1)
+		return -1;
+
+	if(copy)
+		py_stream = copy;
+	else
+		Py_INCREF(py_stream);
+	dec->py_stream = py_stream;
+
+	s = dec->stream;
+
+	if(dec->size < 6 || *s++ != PROTOCOL_ID)
+		return 0;
 
 	// how many shared objects in this stream?
-	shared_mapsize = *(int32_t *)s;
+	dec->shared_mapsize = *(int32_t *)s;
 	s += 4;
 
 	// Security Check: assert there is enough data for that many items.
-	if((5 + shared_mapsize*4) > size) 
+	if(dec->shared_mapsize < 0 || (5 + (Py_ssize_t)dec->shared_mapsize*4) > dec->size)
 	{
-		PyErr_Format(UnmarshalError, "Not enough room in stream for map. Wanted %d, but have only %d bytes remaining...", (shared_mapsize*4), ((int)size-5));
-		goto cleanup;
+		PyErr_Format(UnmarshalError, "Not enough room in stream for map. Wanted %d, but have only %d bytes remaining...", (dec->shared_mapsize*4), ((int)dec->size-5));
+		dec->shared_mapsize = 0;
+		return -1;
 	}
 
 	// ok, we got the map data right here...
-	shared_map = (int32_t *)&stream[size - shared_mapsize * 4];
+	dec->shared_map = (int32_t *)&dec->stream[dec->size - dec->shared_mapsize * 4];
+
+	if(flags & DECODER_PREFAULT)
+		prefault_stream(dec);
 
 	// Security Check #2: assert all map entries are between 1 and shared_mapsize
-	for(i=0; i<shared_mapsize; i++)
+	for(i=0; i<dec->shared_mapsize; i++)
 	{
-		if( (shared_map[i] > shared_mapsize) || (shared_map[i] < 1) )
+		if( (dec->shared_map[i] > dec->shared_mapsize) || (dec->shared_map[i] < 1) )
 		{
 			PyErr_SetString(UnmarshalError, "Bogus map data in marshal stream");
-			goto cleanup;
+			return -1;
 		}
 	}
 
 	// the start of which is incidentally also the end of the object data.
-	end = (char *)shared_map;
+	dec->end = (char *)dec->shared_map;
+	dec->s = s;
 
 	// create object table
-	shared_obj = PyMem_MALLOC(shared_mapsize * sizeof(PyObject *));
-	if(!shared_obj)
-		goto cleanup;
+	dec->shared_obj = PyMem_MALLOC(dec->shared_mapsize * sizeof(PyObject *));
+	if(!dec->shared_obj)
+	{
+		PyErr_NoMemory();
+		return -1;
+	}
 
 	// zero out object table
-	for(shared_count = 0; shared_count < shared_mapsize; shared_count++)
-		shared_obj[shared_count] = NULL;
-	shared_count = 0;
+	for(i=0; i<dec->shared_mapsize; i++)
+		dec->shared_obj[i] = NULL;
+
+	return 1;
+}
+
+
+static void
+decoder_unwind(struct Decoder *dec)
+{
+	struct Container *container;
+
+	// containers still on the stack were abandoned (decoding failed or was
+	// not completed), decref them.
+	while(dec->ct_ix)
+	{
+		container = &dec->ct_stack[dec->ct_ix--];
+		Py_XDECREF(container->obj);
+		// possibly unassociated object for dict entry, or append method?
+		if(container->type == TYPE_DICT || container->type == TYPE_DICT_ITERATOR || container->type == TYPE_LIST_ITERATOR)
+		{
+			Py_XDECREF(container->obj2);
+		}
+	}
+}
+
+
+static void
+decoder_free(struct Decoder *dec)
+{
+	decoder_unwind(dec);
+
+	if(dec->shared_obj)
+	{
+		/* shared object list held a safety ref to all objects, decref em */
+		int i;
+		for(i=0; i<dec->shared_mapsize; i++)
+			Py_XDECREF(dec->shared_obj[i]);
+
+		/* and free the list */
+		PyMem_FREE(dec->shared_obj);
+		dec->shared_obj = NULL;
+	}
+
+	Py_CLEAR(dec->root);
+
+	if(dec->view.obj)
+		PyBuffer_Release(&dec->view);
+
+	Py_CLEAR(dec->py_stream);
+}
+
+
+static PyObject *
+decoder_unpickle(struct Decoder *dec)
+{
+	// Return value: New Reference
+	PyObject *copy, *result;
+	int offset = 0;
 
+	if(PyString_Check(dec->py_stream))
+		return unpickle(dec->py_stream, &offset);
+
+	// cStringIO wants a string; pickles are rare, so just copy.
+	if(!(copy = PyString_FromStringAndSize(dec->stream, dec->size)))
+		return NULL;
+
+	result = unpickle(copy, &offset);
+	Py_DECREF(copy);
+	return result;
+}
+
+
+// header decoder (see LoadHeader), also used by decoder_run in lazy mode.
+#define PEEK_SKIP    0  // skip object
+#define PEEK_SMALL   1  // decode object if it is small
+#define PEEK_ANY     2  // decode object unless it is a list, dict or object
+
+#define PEEK_MAX_STRING 256  // longer strings are not small
+
+// peek_object() return values other than 1 (decoded)
+#define PEEK_SKIPPED   0
+#define PEEK_ERROR    -1
+#define PEEK_CANTSKIP -2  // stream can't be scanned, use Load() instead
+#define PEEK_MARK     -3
+
+static int peek_object(struct Decoder *dec, int depth, int mode, PyObject **out);
+static PyObject *lazy_resolve(struct Decoder *dec, int slot);
+
+static int
+uses_slot(int type)
+{
+	// true if the decoder stores objects of this type in the shared object
+	// table when they have the shared flag.
+	switch(type)
+	{
+		case TYPE_LONG:
+		case TYPE_STRINGL:
+		case TYPE_STREAM:
+		case TYPE_BUFFER:
+		case TYPE_TUPLE:
+		case TYPE_TUPLE1:
+		case TYPE_TUPLE2:
+		case TYPE_LIST0:
+		case TYPE_LIST1:
+		case TYPE_LIST:
+		case TYPE_DICT:
+		case TYPE_GLOBAL:
+		case TYPE_DBROW:
+		case TYPE_INSTANCE:
+		case TYPE_NEWOBJ:
+		case TYPE_REDUCE:
+			return 1;
+	}
+	return 0;
+}
+
+
+static PyObject *
+decoder_run(struct Decoder *dec)
+{
+	// Return value: New Reference
+	// Decodes until the root object is complete, and returns it. In streaming
+	// mode, the items of the root container are returned one at a time
+	// instead, and NULL (without exception) once the root object is complete.
+
+	char *stream = dec->stream;
+	Py_ssize_t size = dec->size;
+
+	char *s = dec->s;
+	char *end = dec->end;
+
+	int type = -1;   // current object type
+	int shared = -1; // indicates whether current object is shared
+	int skipcrc = dec->skipcrc;
+#if MARSHAL_DEBUG
+	int i;
+#endif
+
+	char *error = "NO ERROR SPECIFIED";
+	char errortext[256];
+
+	Py_ssize_t length = 0;  // generic length value.
+
+	int shared_mapsize = dec->shared_mapsize;
+	int shared_count = dec->shared_count;
+	int32_t *shared_map = dec->shared_map;
+	PyObject **shared_obj = dec->shared_obj;
+
+	PyObject *obj = NULL;  // currently decoded object
+	PyObject *result = NULL;  // final result (or next item when streaming)
+
+	int ct_ix = dec->ct_ix;
+	struct Container *ct_stack = dec->ct_stack;
+	struct Container *container = &ct_stack[ct_ix];
+
+	if(dec->root)
+		// streaming complete.
+		return NULL;
 
 	// start decoding.
 
@@ -521,10 +869,42 @@ marshal_Load_internal(PyObject *py_stream, PyObject *py_callback, int skipcrc)
 		// which adds it to the current container, or returns it to the caller.
 
 		// get type of next object to decode and check shared flag
-		type = *s++;
+		type = *(unsigned char *)s++;
 		shared = type & SHARED_FLAG;
 		type &= ~SHARED_FLAG;
 
+		if(shared && dec->lazy && uses_slot(type))
+		{
+			PyObject *dummy;
+
+			if(shared_count >= shared_mapsize)
+			{
+				sprintf((error = errortext), "Shared object table overflow (size:%d)", shared_mapsize);
+				goto fail;
+			}
+
+			if((obj = shared_obj[shared_map[shared_count]-1]))
+			{
+				// lazy decoding; the object was decoded already, because it
+				// was referenced from elsewhere. skip it.
+				dec->s = s-1;
+				dec->shared_count = shared_count;
+				obj = NULL;
+				if(peek_object(dec, ct_ix, PEEK_SKIP, &dummy) < 0)
+				{
+					error = "Unable to skip object";
+					if(PyErr_Occurred())
+						goto cleanup;
+					goto fail;
+				}
+				obj = shared_obj[shared_map[shared_count]-1];
+				Py_INCREF(obj);
+				s = dec->s;
+				shared_count = dec->shared_count;
+				goto decoded;
+			}
+		}
+
 		// if token uses a normal length value, read it now.
 		if(needlength[type])
 		{
@@ -715,11 +1095,15 @@ marshal_Load_internal(PyObject *py_stream, PyObject *py_callback, int skipcrc)
 			break;
 
 		case TYPE_LIST1:
-			NEW_SEQUENCE(TYPE_LIST, 1);
-			continue;
-
+			length = 1;
+			// fallthrough
 		case TYPE_LIST:
 			NEW_SEQUENCE(TYPE_LIST, (int)length);
+			if(STREAMING_ROOT && container->obj)
+			{
+				// the items will be handed to the caller instead.
+				Py_SIZE(container->obj) = 0;
+			}
 			continue;
 
 		case TYPE_DICT:
@@ -753,7 +1137,14 @@ marshal_Load_internal(PyObject *py_stream, PyObject *py_callback, int skipcrc)
 				goto fail;
 			}
 
-			if(!(obj = shared_obj[length-1]))
+			if(!(obj = shared_obj[length-1]) && dec->lazy)
+			{
+				// not decoded yet. do it now.
+				if(!(obj = lazy_resolve(dec, (int)length)) && PyErr_Occurred())
+					goto cleanup;
+			}
+
+			if(!obj)
 			{
 				error = "Shared reference points to invalid object";
 				goto fail;
@@ -811,7 +1202,7 @@ marshal_Load_internal(PyObject *py_stream, PyObject *py_callback, int skipcrc)
 
 
 		// object decoding and construction done!
-
+decoded:
 		if(!obj && type != TYPE_MARK)
 		{
 			// if obj is somehow NULL, whatever caused it is expected to have
@@ -868,11 +1259,21 @@ else
 */
 			switch(container->type) {
 				case TYPE_TUPLE:
+					if(STREAMING_ROOT)
+					{
+						result = obj;
+						break;
+					}
 					// tuples steal references.
 					PyTuple_SET_ITEM(container->obj, container->index++, obj);
 					break;
 
 				case TYPE_LIST:
+					if(STREAMING_ROOT)
+					{
+						result = obj;
+						break;
+					}
 					// lists steal references.
 					PyList_SET_ITEM(container->obj, container->index++, obj);
 					break;
@@ -945,70 +1346,19 @@ else
 
 
 				case TYPE_NEWOBJ:
-				{
-					PyObject *cls, *args, *__new__, *state;
-
+				case TYPE_REDUCE:
 					// instantiate the object...
-					if(!(args = PyTuple_GetItem(obj, 0)))
-						goto cleanup;
-					if(!(cls = PyTuple_GetItem(args, 0)))
-						goto cleanup;
-
-					__new__ = PyObject_GetAttr(cls, py__new__);
-					if(!__new__)
-						goto cleanup;
-
-					container->obj = PyObject_CallObject(__new__, args);
-					Py_DECREF(__new__);
-					if(!container->obj)
+					if(!(container->obj = build_reduced(container->type, obj)))
 						goto cleanup;
 
 					// add as shared object, if neccessary...
 					UPDATE_SLOT(container->index, container->obj);
 
-					// is there state data?
-					if(PyTuple_GET_SIZE(obj) > 1)
-					{
-						state = PyTuple_GET_ITEM(obj, 1);
-						if(!set_state(container->obj, state))
-							goto cleanup;
-					}
-
-					Py_DECREF(obj);
-
-					// switch to list iterator
-					LIST_ITERATOR;
-					break;
-				}
-
-
-				case TYPE_REDUCE:
-				{
-					PyObject *callable, *args, *state;
-
-					if(!(args = PyTuple_GetItem(obj, 1)))
-						goto cleanup;
-					if(!(callable = PyTuple_GET_ITEM(obj, 0)))
-						goto cleanup;
-
-					if(!(container->obj = PyObject_CallObject(callable, args)))
-						goto cleanup;
-
-					UPDATE_SLOT(container->index, container->obj);
-
-					if(PyTuple_GET_SIZE(obj) > 2)
-					{
-						state = PyTuple_GET_ITEM(obj, 2);
-						if(!set_state(container->obj, state))
-							goto cleanup;
-					}
-
 					Py_DECREF(obj);
 
 					// switch to list iterator
 					LIST_ITERATOR;
 					break;
-				}
 
 
 				case TYPE_LIST_ITERATOR:
@@ -1024,6 +1374,12 @@ else
 						break;
 					}
 
+					if(STREAMING_ROOT && PyList_Check(container->obj))
+					{
+						result = obj;
+						break;
+					}
+
 					if(!container->obj2)
 					{
 						// grab the append method from the container and keep
@@ -1064,107 +1420,2309 @@ else
 
 
 				case 0:
-					// we're at the root. return the object to caller.
-					result = obj;
-
-					// avoid decreffing this object.
+					// we're at the root.
+					if(dec->streaming)
+					{
+						// keep the root object for the caller, but return
+						// the last streamed item (if any).
+						if(result && PyTuple_Check(obj))
+						{
+							// don't leave a tuple with holes lying around.
+							Py_DECREF(obj);
+							obj = PyTuple_New(0);
+						}
+						dec->root = obj;
+						obj = NULL;
+						goto suspend;
+					}
+
+					// return the object to caller.
+					result = obj;
+
+					// avoid decreffing this object.
 					obj = NULL;
-					goto cleanup;
+					goto suspend;
+			}
+
+			container->free--;
+			if(container->free)
+				// still room in this container.
+				// break out of container handling to get next object for it.
+				break;
+
+			// this container is done, it is the next object to put into the
+			// container under it!
+			obj = container->obj;
+
+			// switch context to said older container
+			POP_CONTAINER;
+		}
+
+		// we've processed the object. clear it for next one.
+		obj = NULL;
+
+		if(result)
+		{
+			// streaming mode; hand the item to the caller.
+			dec->streamed = 1;
+			goto suspend;
+		}
+	}
+
+	// if we get here, we're out of data, but it's a "clean" eof; we ran out
+	// of data while expecting a new object...
+	error = "Not enough objects in stream";
+
+fail:
+	PyErr_Format(UnmarshalError, "%s - type:0x%02x ctype:0x%02x len:%d share:%d pos:%d size:%d", error, type, container->type, (int)length, shared, (int)(s-stream), (int)(size));
+
+cleanup:
+	// on any error the current object we were working on will be unassociated
+	// with anything, decref it. if decode was succesful or an object failed to
+	// be created, it will be NULL anyway. unfinished containers are left for
+	// decoder_free to clean up.
+	Py_XDECREF(obj);
+	Py_XDECREF(result);
+	result = NULL;
+
+suspend:
+	dec->s = s;
+	dec->shared_count = shared_count;
+	dec->ct_ix = ct_ix;
+	return result;
+}
+
+
+static PyObject *
+marshal_Load_internal(PyObject *py_stream, PyObject *py_callback, int skipcrc)
+{
+	// Return value: New Reference
+	struct Decoder dec;
+	PyObject *result = NULL;
+
+	switch(decoder_init(&dec, py_stream, skipcrc, DECODER_PREFAULT))
+	{
+		case 1:
+			result = decoder_run(&dec);
+			break;
+		case 0:
+			result = decoder_unpickle(&dec);
+			break;
+	}
+
+	decoder_free(&dec);
+	return result;
+}
+
+
+PyObject *
+marshal_Load(PyObject *self, PyObject *args, PyObject *kwds)
+{
+	PyObject *py_stream;
+	PyObject *py_callback = NULL;
+	PyObject *result;
+
+	int skipcrc = 0;
+
+	if(!PyArg_ParseTuple(args, "O|Oi:Load", &py_stream, &py_callback, &skipcrc))
+		return NULL;
+
+	if(py_callback == Py_None)
+		py_callback = NULL;
+
+	if(py_callback && !PyCallable_Check(py_callback))
+	{
+		PyErr_SetString(PyExc_TypeError, "callback argument must be callable");
+		return NULL;
+	}
+
+	result = marshal_Load_internal(py_stream, py_callback, skipcrc);
+	return result;
+}
+
+
+//============================================================================
+// Header decoder
+//============================================================================
+
+// LoadHeader() decodes just the (key, envelope) header of a cache file. The
+// key is decoded in full, but of the envelope (a class instance) only the
+// class name and the small items of its state tuple are, the others being
+// skipped and replaced by None. Skipping only has to track the shared object
+// slots the real decoder would use, so that later references still resolve.
+// Some objects can't be skipped this way; if the state holds one, the state
+// as a whole is None.
+
+#define PEEK_CHECK_SIZE(x)\
+if((dec->s+(x)) > dec->end)\
+{\
+	PyErr_Format(UnmarshalError, "Unexpected EOL - pos:%d", (int)(dec->s - dec->stream));\
+	return PEEK_ERROR;\
+}
+
+// takes the next shared object slot if the object is shared, like the real
+// decoder does for the object types that support it.
+#define PEEK_SLOT \
+if(peek_slot(dec, shared, &slot) < 0)\
+	return PEEK_ERROR;
+
+
+static int
+peek_slot(struct Decoder *dec, int shared, int *slot)
+{
+	if(shared)
+	{
+		if(dec->shared_count >= dec->shared_mapsize)
+		{
+			PyErr_Format(UnmarshalError, "Shared object table overflow, mapsize:%d", dec->shared_mapsize);
+			return PEEK_ERROR;
+		}
+		*slot = dec->shared_map[dec->shared_count];
+		if(dec->lazy)
+		{
+			// remember where the object is, should it be needed.
+			dec->lazy->offsets[*slot-1] = (int32_t)(dec->token - dec->stream);
+			dec->lazy->counts[*slot-1] = dec->shared_count;
+		}
+		dec->shared_count++;
+	}
+	return 1;
+}
+
+
+static int
+peek_token(struct Decoder *dec, int *type, int *shared, Py_ssize_t *length)
+{
+	// reads the next type token and its length value (if any).
+	do
+	{
+		PEEK_CHECK_SIZE(1);
+		dec->token = dec->s;
+		*type = *(unsigned char *)dec->s++;
+		*shared = *type & SHARED_FLAG;
+		*type &= ~SHARED_FLAG;
+
+		if(*type == TYPE_CHECKSUM)
+		{
+			// checksum of whole stream is of no use here.
+			PEEK_CHECK_SIZE(4);
+			dec->s += 4;
+		}
+	}
+	while(*type == TYPE_CHECKSUM);
+
+	*length = 0;
+	if(needlength[*type])
+	{
+		PEEK_CHECK_SIZE(1);
+		*length = *(unsigned char *)dec->s++;
+		if(*length == 255)
+		{
+			PEEK_CHECK_SIZE(4);
+			*length = *(int32_t *)dec->s;
+			dec->s += 4;
+		}
+		if(*length < 0)
+		{
+			PyErr_Format(UnmarshalError, "Invalid length - pos:%d", (int)(dec->s - dec->stream));
+			return PEEK_ERROR;
+		}
+	}
+	return 1;
+}
+
+
+static int peek_object(struct Decoder *dec, int depth, int mode, PyObject **out);
+static PyObject *decode_at(struct Decoder *dec, char **s, int *shared_count);
+
+static int
+peek_items(struct Decoder *dec, int depth, Py_ssize_t count)
+{
+	// skips specified number of objects.
+	int r;
+	PyObject *dummy;
+	while(count--)
+	{
+		if((r = peek_object(dec, depth, PEEK_SKIP, &dummy)) < 0)
+			return (r == PEEK_MARK) ? PEEK_CANTSKIP : r;
+	}
+	return 1;
+}
+
+static int
+peek_until_mark(struct Decoder *dec, int depth)
+{
+	// skips objects up to and including a TYPE_MARK.
+	int r;
+	PyObject *dummy;
+	while((r = peek_object(dec, depth, PEEK_SKIP, &dummy)) >= 0);
+	return (r == PEEK_MARK) ? 1 : r;
+}
+
+static int
+peek_tuple(struct Decoder *dec, int depth, int mode, Py_ssize_t count, int slot, int partial, PyObject **out)
+{
+	// decodes tuple of count items. if partial is set, items that can't be
+	// decoded are replaced by None, otherwise the whole tuple is skipped.
+	PyObject *tuple, *item;
+	Py_ssize_t i;
+	int r;
+
+	PEEK_CHECK_SIZE(count);
+
+	if(mode == PEEK_SKIP)
+		return ((r = peek_items(dec, depth, count)) < 0) ? r : PEEK_SKIPPED;
+
+	if(!(tuple = PyTuple_New(count)))
+		return PEEK_ERROR;
+
+	for(i=0; i<count; i++)
+	{
+		if((r = peek_object(dec, depth, mode, &item)) < 0)
+		{
+			Py_DECREF(tuple);
+			return (r == PEEK_MARK) ? PEEK_CANTSKIP : r;
+		}
+
+		if(r == PEEK_SKIPPED)
+		{
+			if(!partial)
+			{
+				// can't be decoded, skip the remainder.
+				Py_DECREF(tuple);
+				return ((r = peek_items(dec, depth, count-i-1)) < 0) ? r : PEEK_SKIPPED;
+			}
+			item = Py_None;
+			Py_INCREF(item);
+		}
+		PyTuple_SET_ITEM(tuple, i, item);
+	}
+
+	if(slot)
+	{
+		Py_INCREF(tuple);
+		dec->shared_obj[slot-1] = tuple;
+	}
+
+	*out = tuple;
+	return 1;
+}
+
+
+static int
+peek_object(struct Decoder *dec, int depth, int mode, PyObject **out)
+{
+	// decodes (or skips) the next object in the stream. Returns 1 and a new
+	// reference in *out if the object was decoded, PEEK_SKIPPED if it was
+	// skipped, or one of the other negative PEEK_ values.
+	PyObject *obj = NULL;
+	Py_ssize_t length;
+	char *s;
+	int type, shared, slot = 0, r;
+
+	if(depth > MAX_DEPTH)
+	{
+		PyErr_SetString(UnmarshalError, "object hierarchy too deep");
+		return PEEK_ERROR;
+	}
+
+	if(peek_token(dec, &type, &shared, &length) < 0)
+		return PEEK_ERROR;
+
+	s = dec->s;
+
+	switch(type)
+	{
+		case TYPE_INT8:
+			PEEK_CHECK_SIZE(1);
+			if(mode)
+				obj = PyInt_FromLong(*(int8_t *)s);
+			dec->s += 1;
+			break;
+
+		case TYPE_INT16:
+			PEEK_CHECK_SIZE(2);
+			if(mode)
+				obj = PyInt_FromLong(*(int16_t *)s);
+			dec->s += 2;
+			break;
+
+		case TYPE_INT32:
+			PEEK_CHECK_SIZE(4);
+			if(mode)
+				obj = PyInt_FromLong(*(int32_t *)s);
+			dec->s += 4;
+			break;
+
+		case TYPE_INT64:
+			PEEK_CHECK_SIZE(8);
+			if(mode)
+				obj = PyLong_FromLongLong(*(int64_t *)s);
+			dec->s += 8;
+			break;
+
+		case TYPE_FLOAT:
+			PEEK_CHECK_SIZE(8);
+			if(mode)
+				obj = PyFloat_FromDouble(*(double *)s);
+			dec->s += 8;
+			break;
+
+		case TYPE_LONG:
+			PEEK_SLOT;
+			PEEK_CHECK_SIZE(length);
+			if(mode)
+				obj = length ? _PyLong_FromByteArray((unsigned char *)s, length, 1, 1) : PyLong_FromLong(0);
+			dec->s += length;
+			break;
+
+		case TYPE_STRINGR:
+			if(mode)
+			{
+				if(length < 1 || length >= PyList_GET_SIZE(string_table))
+				{
+					PyErr_Format(UnmarshalError, "Invalid string table index %d", (int)length);
+					return PEEK_ERROR;
+				}
+				obj = PyList_GET_ITEM(string_table, length);
+				Py_INCREF(obj);
+			}
+			break;
+
+		case TYPE_STRING:
+			PEEK_CHECK_SIZE(1);
+			length = *(unsigned char *)dec->s++;
+			s = dec->s;
+			// fallthrough
+		case TYPE_STRINGL:
+		case TYPE_STREAM:
+		case TYPE_BUFFER:
+			if(type != TYPE_STRING)
+				PEEK_SLOT;
+			PEEK_CHECK_SIZE(length);
+			if(mode == PEEK_ANY || (mode && length <= PEEK_MAX_STRING))
+				obj = PyString_FromStringAndSize(s, length);
+			dec->s += length;
+			break;
+
+		case TYPE_STRING1:
+			PEEK_CHECK_SIZE(1);
+			if(mode)
+				obj = PyString_FromStringAndSize(s, 1);
+			dec->s += 1;
+			break;
+
+		case TYPE_UNICODE1:
+			length = 1;
+			// fallthrough
+		case TYPE_UNICODE:
+			PEEK_CHECK_SIZE(length*2);
+			if(mode == PEEK_ANY || (mode && length*2 <= PEEK_MAX_STRING))
+#ifdef Py_UNICODE_WIDE
+				obj = _PyUnicodeUCS4_FromUCS2((void *)s, (int)length);
+#else
+				obj = PyUnicode_FromWideChar((wchar_t *)s, length);
+#endif
+			dec->s += length*2;
+			break;
+
+		case TYPE_UTF8:
+			PEEK_CHECK_SIZE(length);
+			if(mode == PEEK_ANY || (mode && length <= PEEK_MAX_STRING))
+				obj = PyUnicode_DecodeUTF8(s, length, NULL);
+			dec->s += length;
+			break;
+
+		case TYPE_TUPLE1:
+			length = 1;
+			goto tuple;
+		case TYPE_TUPLE2:
+			length = 2;
+			// fallthrough
+		case TYPE_TUPLE:
+		tuple:
+			PEEK_SLOT;
+			return peek_tuple(dec, depth+1, mode, length, slot, 0, out);
+
+		case TYPE_LIST0:
+			PEEK_SLOT;
+			return PEEK_SKIPPED;
+
+		case TYPE_LIST1:
+			length = 1;
+			// fallthrough
+		case TYPE_LIST:
+			PEEK_SLOT;
+			PEEK_CHECK_SIZE(length);
+			return ((r = peek_items(dec, depth+1, length)) < 0) ? r : PEEK_SKIPPED;
+
+		case TYPE_DICT:
+			PEEK_SLOT;
+			PEEK_CHECK_SIZE(length*2);
+			return ((r = peek_items(dec, depth+1, length*2)) < 0) ? r : PEEK_SKIPPED;
+
+		case TYPE_REF:
+			if(length < 1 || length > dec->shared_mapsize)
+			{
+				PyErr_SetString(UnmarshalError, "Shared reference index out of range");
+				return PEEK_ERROR;
+			}
+			if(!mode || !(obj = dec->shared_obj[length-1]))
+				// referenced object was skipped.
+				return PEEK_SKIPPED;
+			Py_INCREF(obj);
+			break;
+
+		case TYPE_GLOBAL:
+			PEEK_SLOT;
+			PEEK_CHECK_SIZE(length);
+			dec->s += length;
+			return PEEK_SKIPPED;
+
+		case TYPE_INSTANCE:
+			// class name and state.
+			PEEK_SLOT;
+			return ((r = peek_items(dec, depth+1, 2)) < 0) ? r : PEEK_SKIPPED;
+
+		case TYPE_NEWOBJ:
+		case TYPE_REDUCE:
+			// arguments, then list and dict iterator items.
+			PEEK_SLOT;
+			if((r = peek_items(dec, depth+1, 1)) < 0
+			|| (r = peek_until_mark(dec, depth+1)) < 0
+			|| (r = peek_until_mark(dec, depth+1)) < 0)
+				return r;
+			return PEEK_SKIPPED;
+
+		case TYPE_MARK:
+			return PEEK_MARK;
+
+		case TYPE_DBROW:
+		{
+			// the number of objects that follow depends on the descriptor,
+			// which is decoded for this in lazy mode.
+			PyObject *desc;
+
+			if(!dec->lazy)
+				return PEEK_CANTSKIP;
+
+			PEEK_SLOT;
+			if(!(desc = decode_at(dec, &dec->s, &dec->shared_count)))
+				return PEEK_ERROR;
+			if(!PyDBRowDescriptor_Check(desc))
+			{
+				Py_DECREF(desc);
+				PyErr_SetString(UnmarshalError, "DBRow has no descriptor");
+				return PEEK_ERROR;
+			}
+			length = ((PyDBRowDescriptorObject *)desc)->rd_num_objects;
+			Py_DECREF(desc);
+
+			// skip the row data and the objects.
+			PEEK_CHECK_SIZE(1);
+			r = *(unsigned char *)dec->s++;
+			if(r == 255)
+			{
+				PEEK_CHECK_SIZE(4);
+				r = *(int32_t *)dec->s;
+				dec->s += 4;
+			}
+			if(r < 0)
+			{
+				PyErr_SetString(UnmarshalError, "Invalid DBRow data length");
+				return PEEK_ERROR;
+			}
+			PEEK_CHECK_SIZE(r);
+			dec->s += r;
+			return ((r = peek_items(dec, depth+1, length)) < 0) ? r : PEEK_SKIPPED;
+		}
+
+		default:
+			if(!constants[type])
+			{
+				PyErr_Format(UnmarshalError, "Unsupported type - type:0x%02x pos:%d", type, (int)(dec->s - dec->stream));
+				return PEEK_ERROR;
+			}
+			if(mode)
+			{
+				obj = constants[type];
+				Py_INCREF(obj);
 			}
+			break;
+	}
+
+	if(!obj)
+		return (mode && PyErr_Occurred()) ? PEEK_ERROR : PEEK_SKIPPED;
+
+	if(slot)
+	{
+		Py_INCREF(obj);
+		dec->shared_obj[slot-1] = obj;
+	}
+
+	*out = obj;
+	return 1;
+}
+
+
+static PyObject *
+peek_header(struct Decoder *dec, int withstate)
+{
+	// Return value: New Reference
+	PyObject *key = NULL, *name = NULL, *state = NULL, *result = NULL;
+	Py_ssize_t length;
+	int type, shared, slot = 0;
+
+	// root must be a 2-tuple
+	if(peek_token(dec, &type, &shared, &length) < 0)
+		goto done;
+	if(type == TYPE_TUPLE2)
+		length = 2;
+	if((type != TYPE_TUPLE && type != TYPE_TUPLE2) || length != 2)
+		goto done;
+	if(peek_slot(dec, shared, &slot) < 0)
+		goto done;
+
+	if(peek_object(dec, 1, PEEK_ANY, &key) != 1)
+		goto done;
+
+	// the object must be a class instance...
+	if(peek_token(dec, &type, &shared, &length) < 0 || type != TYPE_INSTANCE)
+		goto done;
+	if(peek_slot(dec, shared, &slot) < 0)
+		goto done;
+
+	if(peek_object(dec, 2, PEEK_ANY, &name) != 1)
+		goto done;
+
+	// ... with a state tuple, which may not be scannable (e.g. a DBRow in
+	// it), in which case the key and class name are returned with it.
+	if(withstate && peek_token(dec, &type, &shared, &length) == 1)
+	{
+		if(type == TYPE_TUPLE1)
+			length = 1;
+		else if(type == TYPE_TUPLE2)
+			length = 2;
+
+		slot = 0;
+		if((type == TYPE_TUPLE || type == TYPE_TUPLE1 || type == TYPE_TUPLE2) && peek_slot(dec, shared, &slot) == 1)
+			peek_tuple(dec, 3, PEEK_SMALL, length, slot, 1, &state);
+	}
+
+	if(!PyErr_Occurred())
+		result = PyTuple_Pack(3, key, name, state ? state : Py_None);
+
+done:
+	Py_XDECREF(key);
+	Py_XDECREF(name);
+	Py_XDECREF(state);
+
+	if(!result && !PyErr_Occurred())
+	{
+		// not a stream this works for.
+		result = Py_None;
+		Py_INCREF(result);
+	}
+	return result;
+}
+
+
+PyObject *
+marshal_LoadHeader(PyObject *self, PyObject *args)
+{
+	// Returns (key, className, state) of a cache file's (key, object) stream,
+	// with only the small items of the object's state decoded, or None if the
+	// stream can not be scanned this way. state is None if it can't be
+	// scanned, or withstate is false.
+	struct Decoder dec;
+	PyObject *py_stream;
+	PyObject *result = NULL;
+	int withstate = 1;
+
+	if(!PyArg_ParseTuple(args, "O|i:LoadHeader", &py_stream, &withstate))
+		return NULL;
+
+	switch(decoder_init(&dec, py_stream, 1, 0))
+	{
+		case 1:
+			result = peek_header(&dec, withstate);
+			break;
+		case 0:
+			// pickle.
+			result = Py_None;
+			Py_INCREF(result);
+			break;
+	}
+
+	decoder_free(&dec);
+	return result;
+}
+
+
+//============================================================================
+// Lazy decoder
+//============================================================================
+
+// lazyload() returns a sequence in place of a list or tuple at the root of a
+// stream, the items of which are decoded when they are accessed. The stream
+// is scanned once up front to find the items, and where the objects that
+// fill the shared object slots are. Objects that are referenced by an item
+// are then decoded along with it, unless they were already.
+//
+// A list-like object built by NEWOBJ/REDUCE (e.g. a CRowset) is created
+// without its items. The function set with _set_lazylist_func() is given
+// the object and the sequence of its items, and returns the object to hand
+// out in their place (see blue._lazylist). Without that function, or if the
+// object is not a list, the items are added to it as decoder_run would.
+// Any other root object is decoded in full.
+
+static PyObject *
+decode_at(struct Decoder *dec, char **s, int *shared_count)
+{
+	// Return value: New Reference
+	// Decodes a single object at *s with the shared object table of dec,
+	// and advances *s and *shared_count past it.
+	struct Decoder sub;
+	PyObject *result;
+
+	if(dec->lazy->depth >= MAX_DEPTH)
+	{
+		PyErr_SetString(UnmarshalError, "shared object references nested too deeply");
+		return NULL;
+	}
+
+	sub = *dec;
+	sub.s = *s;
+	sub.shared_count = *shared_count;
+	sub.ct_ix = 0;
+	sub.ct_stack[0].obj = NULL;
+	sub.ct_stack[0].type = 0;
+	sub.ct_stack[0].free = -1;
+	sub.ct_stack[0].index = 0;
+	sub.streaming = 0;
+	sub.root = NULL;
+
+	dec->lazy->depth++;
+	result = decoder_run(&sub);
+	dec->lazy->depth--;
+
+	decoder_unwind(&sub);
+
+	*s = sub.s;
+	*shared_count = sub.shared_count;
+	return result;
+}
+
+
+static PyObject *
+lazy_resolve(struct Decoder *dec, int slot)
+{
+	// Return value: Borrowed Reference
+	// Decodes the object for the specified shared object slot. Returns NULL
+	// without exception if the stream does not have one.
+	struct LazyIndex *lazy = dec->lazy;
+	PyObject *obj;
+	char *s;
+	int count;
+
+	if(lazy->offsets[slot-1] < 0)
+		return NULL;
+
+	s = dec->stream + lazy->offsets[slot-1];
+	count = lazy->counts[slot-1];
+
+	if(!(obj = decode_at(dec, &s, &count)))
+		return NULL;
+
+	// the table has its own reference.
+	Py_DECREF(obj);
+	return dec->shared_obj[slot-1];
+}
+
+
+typedef struct {
+	PyObject_HEAD
+	struct Decoder dec;
+	struct LazyIndex lazy;
+	Py_ssize_t count;
+	int32_t *offsets;  // offset of each item
+	int *counts;  // shared object index counter at each item
+	PyObject **items;  // the items decoded so far
+	int istuple;
+	int broken;  // set if decoding failed, leaving the shared objects in disarray
+} LazySequenceObject;
+
+
+static int
+ls_traverse(LazySequenceObject *self, visitproc visit, void *arg)
+{
+	// the root object of a NEWOBJ/REDUCE stream may hold on to the sequence
+	// and also be in the shared objects.
+	Py_ssize_t i;
+
+	if(self->items)
+		for(i=0; i<self->count; i++)
+			Py_VISIT(self->items[i]);
+	if(self->dec.shared_obj)
+		for(i=0; i<self->dec.shared_mapsize; i++)
+			Py_VISIT(self->dec.shared_obj[i]);
+	return 0;
+}
+
+
+static int
+ls_clear(LazySequenceObject *self)
+{
+	Py_ssize_t i;
+
+	if(self->items)
+		for(i=0; i<self->count; i++)
+			Py_CLEAR(self->items[i]);
+	if(self->dec.shared_obj)
+		for(i=0; i<self->dec.shared_mapsize; i++)
+			Py_CLEAR(self->dec.shared_obj[i]);
+
+	// nothing can be decoded without the shared objects.
+	self->broken = 1;
+	return 0;
+}
+
+
+static void
+ls_dealloc(LazySequenceObject *self)
+{
+	PyObject_GC_UnTrack(self);
+	ls_clear(self);
+	PyMem_FREE(self->items);
+	PyMem_FREE(self->offsets);
+	PyMem_FREE(self->counts);
+	PyMem_FREE(self->lazy.offsets);
+	PyMem_FREE(self->lazy.counts);
+	decoder_free(&self->dec);
+	PyObject_GC_Del(self);
+}
+
+
+static Py_ssize_t
+ls_length(LazySequenceObject *self)
+{
+	return self->count;
+}
+
+
+static PyObject *
+ls_item(LazySequenceObject *self, Py_ssize_t i)
+{
+	PyObject *obj;
+	char *s;
+	int count;
+
+	if(i < 0 || i >= self->count)
+	{
+		PyErr_SetString(PyExc_IndexError, "lazy sequence index out of range");
+		return NULL;
+	}
+
+	if(!(obj = self->items[i]))
+	{
+		if(self->broken)
+		{
+			PyErr_SetString(UnmarshalError, "lazy sequence is unusable after an earlier decoding error");
+			return NULL;
+		}
+
+		s = self->dec.stream + self->offsets[i];
+		count = self->counts[i];
+		if(!(obj = decode_at(&self->dec, &s, &count)))
+		{
+			self->broken = 1;
+			return NULL;
+		}
+		self->items[i] = obj;
+	}
+
+	Py_INCREF(obj);
+	return obj;
+}
+
+
+static PyObject *
+ls_subscript(LazySequenceObject *self, PyObject *item)
+{
+	Py_ssize_t i, start, stop, step, slicelength;
+	PyObject *result, *obj;
+
+	if(PyIndex_Check(item))
+	{
+		if((i = PyNumber_AsSsize_t(item, PyExc_IndexError)) == -1 && PyErr_Occurred())
+			return NULL;
+		if(i < 0)
+			i += self->count;
+		return ls_item(self, i);
+	}
+
+	if(!PySlice_Check(item))
+	{
+		PyErr_Format(PyExc_TypeError, "lazy sequence indices must be integers, not %.200s", item->ob_type->tp_name);
+		return NULL;
+	}
+
+	if(PySlice_GetIndicesEx((PySliceObject *)item, self->count, &start, &stop, &step, &slicelength) < 0)
+		return NULL;
+
+	if(!(result = self->istuple ? PyTuple_New(slicelength) : PyList_New(slicelength)))
+		return NULL;
+
+	for(i=0; i<slicelength; i++, start += step)
+	{
+		if(!(obj = ls_item(self, start)))
+		{
+			Py_DECREF(result);
+			return NULL;
+		}
+		if(self->istuple)
+			PyTuple_SET_ITEM(result, i, obj);
+		else
+			PyList_SET_ITEM(result, i, obj);
+	}
+	return result;
+}
+
+
+static PyObject *
+ls_repr(LazySequenceObject *self)
+{
+	return PyString_FromFormat("<lazy %s of %zd items>", self->istuple ? "tuple" : "list", self->count);
+}
+
+
+static PySequenceMethods ls_as_sequence = {
+	(lenfunc)ls_length,			/* sq_length */
+	0,							/* sq_concat */
+	0,							/* sq_repeat */
+	(ssizeargfunc)ls_item,		/* sq_item */
+};
+
+static PyMappingMethods ls_as_mapping = {
+	(lenfunc)ls_length,			/* mp_length */
+	(binaryfunc)ls_subscript,	/* mp_subscript */
+	0,							/* mp_ass_subscript */
+};
+
+
+PyTypeObject LazySequence_Type = {
+	PyObject_HEAD_INIT(NULL)
+	0,
+	"blue.marshal.lazysequence",
+	sizeof(LazySequenceObject),
+	0,
+	(destructor)ls_dealloc,	/* tp_dealloc */
+	0,					/* tp_print */
+	0,					/* tp_getattr */
+	0,					/* tp_setattr */
+	0,					/* tp_compare */
+	(reprfunc)ls_repr,	/* tp_repr */
+	0,					/* tp_as_number */
+	&ls_as_sequence,	/* tp_as_sequence */
+	&ls_as_mapping,		/* tp_as_mapping */
+	0,					/* tp_hash */
+	0,					/* tp_call */
+	0,					/* tp_str */
+	0,					/* tp_getattro */
+	0,					/* tp_setattro */
+	0,					/* tp_as_buffer */
+	Py_TPFLAGS_DEFAULT|Py_TPFLAGS_HAVE_GC,	/* tp_flags */
+	0,					/* tp_doc */
+	(traverseproc)ls_traverse,	/* tp_traverse */
+	(inquiry)ls_clear,	/* tp_clear */
+};
+
+
+static int
+ls_index(LazySequenceObject *self)
+{
+	// sets up the decoder for lazy decoding.
+	int i, mapsize = self->dec.shared_mapsize;
+
+	self->lazy.offsets = PyMem_MALLOC((mapsize+1) * sizeof(int32_t));
+	self->lazy.counts = PyMem_MALLOC((mapsize+1) * sizeof(int));
+	self->lazy.depth = 0;
+
+	if(!self->lazy.offsets || !self->lazy.counts)
+	{
+		PyErr_NoMemory();
+		return -1;
+	}
+
+	for(i=0; i<mapsize; i++)
+		self->lazy.offsets[i] = -1;
+
+	self->dec.lazy = &self->lazy;
+	return 0;
+}
+
+
+static int
+ls_scan(LazySequenceObject *self, Py_ssize_t count)
+{
+	// finds the items of the root container, and where the shared objects
+	// they use are. if count is -1, the items run up to a MARK.
+	struct Decoder *dec = &self->dec;
+	PyObject *dummy;
+	void *p;
+	Py_ssize_t i, size = (count < 0) ? 64 : count;
+	int r;
+
+	self->offsets = PyMem_MALLOC((size+1) * sizeof(int32_t));
+	self->counts = PyMem_MALLOC((size+1) * sizeof(int));
+	if(!self->offsets || !self->counts)
+		goto nomem;
+
+	for(i=0; count < 0 || i < count; i++)
+	{
+		if(i == size)
+		{
+			size *= 2;
+			if(!(p = PyMem_REALLOC(self->offsets, (size+1) * sizeof(int32_t))))
+				goto nomem;
+			self->offsets = p;
+			if(!(p = PyMem_REALLOC(self->counts, (size+1) * sizeof(int))))
+				goto nomem;
+			self->counts = p;
+		}
+
+		self->offsets[i] = (int32_t)(dec->s - dec->stream);
+		self->counts[i] = dec->shared_count;
+		if((r = peek_object(dec, 1, PEEK_SKIP, &dummy)) < 0)
+		{
+			if(r == PEEK_MARK && count < 0)
+				break;
+			if(r != PEEK_ERROR)
+				PyErr_Format(UnmarshalError, "Unexpected marker in stream - pos:%d", (int)(dec->s - dec->stream));
+			return -1;
+		}
+	}
+
+	if(!(self->items = PyMem_MALLOC((i+1) * sizeof(PyObject *))))
+		goto nomem;
+	self->count = i;
+	for(i=0; i<self->count; i++)
+		self->items[i] = NULL;
+	return 0;
+
+nomem:
+	PyErr_NoMemory();
+	return -1;
+}
+
+
+static PyObject *
+ls_reduce(LazySequenceObject *self, int type, int slot)
+{
+	// Return value: New Reference
+	// creates the object of a NEWOBJ/REDUCE root, then finds its items and
+	// sets its dict items, which run up to a MARK each.
+	struct Decoder *dec = &self->dec;
+	PyObject *obj, *args, *key, *value;
+	int r;
+
+	if(!(args = decode_at(dec, &dec->s, &dec->shared_count)))
+		return NULL;
+	obj = build_reduced(type, args);
+	Py_DECREF(args);
+	if(!obj)
+		return NULL;
+
+	if(slot)
+	{
+		Py_INCREF(obj);
+		dec->shared_obj[slot-1] = obj;
+	}
+
+	if(ls_scan(self, -1) < 0)
+		goto fail;
+
+	for(;;)
+	{
+		// a MARK ends the dict items.
+		if(dec->s >= dec->end)
+		{
+			PyErr_Format(UnmarshalError, "Unexpected EOL - pos:%d", (int)(dec->s - dec->stream));
+			goto fail;
+		}
+		if(*dec->s == TYPE_MARK)
+		{
+			dec->s++;
+			return obj;
+		}
+
+		if(!(key = decode_at(dec, &dec->s, &dec->shared_count)))
+			goto fail;
+		if(!(value = decode_at(dec, &dec->s, &dec->shared_count)))
+		{
+			Py_DECREF(key);
+			goto fail;
+		}
+		r = PyObject_SetItem(obj, key, value);
+		Py_DECREF(key);
+		Py_DECREF(value);
+		if(r == -1)
+			goto fail;
+	}
+
+fail:
+	Py_DECREF(obj);
+	return NULL;
+}
+
+
+static int
+ls_fill(LazySequenceObject *self, PyObject *obj)
+{
+	// adds the items to obj with its append method, like decoder_run does.
+	PyObject *append, *item, *r;
+	Py_ssize_t i;
+
+	if(!(append = PyObject_GetAttr(obj, pyappend)))
+		return -1;
+
+	for(i=0; i<self->count; i++)
+	{
+		if(!(item = ls_item(self, i)))
+			break;
+		r = PyObject_CallFunctionObjArgs(append, item, NULL);
+		Py_DECREF(item);
+		if(!r)
+			break;
+		Py_DECREF(r);
+	}
+
+	Py_DECREF(append);
+	return (i < self->count) ? -1 : 0;
+}
+
+
+PyObject *
+marshal_lazyload(PyObject *self, PyObject *args, PyObject *kwds)
+{
+	PyObject *py_stream;
+	PyObject *py_callback = NULL;
+	PyObject *result = NULL, *obj = NULL;
+	LazySequenceObject *ls;
+	struct Decoder *dec;
+	Py_ssize_t length;
+	char *start;
+	int type, shared, slot = 0;
+
+	int skipcrc = 0;
+
+	if(!PyArg_ParseTuple(args, "O|Oi:lazyload", &py_stream, &py_callback, &skipcrc))
+		return NULL;
+
+	if(!(ls = PyObject_GC_New(LazySequenceObject, &LazySequence_Type)))
+		return NULL;
+
+	ls->count = 0;
+	ls->offsets = NULL;
+	ls->counts = NULL;
+	ls->items = NULL;
+	ls->lazy.offsets = NULL;
+	ls->lazy.counts = NULL;
+	ls->broken = 0;
+
+	dec = &ls->dec;
+
+	switch(decoder_init(dec, py_stream, skipcrc, DECODER_KEEP))
+	{
+		case 1:
+			break;
+		case 0:
+			result = decoder_unpickle(dec);
+			// fallthrough
+		default:
+			Py_DECREF(ls);
+			return result;
+	}
+
+	// the scan skips most of the stream, so verify the checksum up front.
+	if(dec->s + 5 <= dec->end && *dec->s == TYPE_CHECKSUM)
+	{
+		if(!skipcrc && *(uint32_t *)(dec->s+1) != (uint32_t)adler32(1, dec->s+1, (unsigned long)(dec->end-(dec->s+1))))
+		{
+			PyErr_SetString(UnmarshalError, "checksum error");
+			Py_DECREF(ls);
+			return NULL;
+		}
+		dec->s += 5;
+	}
+
+	start = dec->s;
+
+	if(peek_token(dec, &type, &shared, &length) < 0)
+	{
+		Py_DECREF(ls);
+		return NULL;
+	}
+
+	switch(type)
+	{
+		case TYPE_TUPLE1:
+		case TYPE_LIST1:
+			length = 1;
+			break;
+		case TYPE_TUPLE2:
+			length = 2;
+			break;
+		case TYPE_TUPLE:
+		case TYPE_LIST:
+			if(dec->s + length > dec->end)
+			{
+				PyErr_SetString(UnmarshalError, "Not enough data in stream for items");
+				Py_DECREF(ls);
+				return NULL;
+			}
+			break;
+		case TYPE_NEWOBJ:
+		case TYPE_REDUCE:
+			length = -1;
+			break;
+		default:
+			// nothing to be lazy about, decode it all.
+			dec->s = start;
+			result = decoder_run(dec);
+			Py_DECREF(ls);
+			return result;
+	}
+
+	ls->istuple = (type != TYPE_LIST && type != TYPE_LIST1 && length >= 0);
+
+	if(ls_index(ls) < 0 || peek_slot(dec, shared, &slot) < 0)
+	{
+		Py_DECREF(ls);
+		return NULL;
+	}
+
+	// the root itself can't be decoded on demand.
+	if(slot)
+		ls->lazy.offsets[slot-1] = -1;
+
+	if((length < 0) ? !(obj = ls_reduce(ls, type, slot)) : ls_scan(ls, length) < 0)
+	{
+		Py_DECREF(ls);
+		return NULL;
+	}
+
+	PyObject_GC_Track(ls);
+	if(!obj)
+		return (PyObject *)ls;
+
+	if(ls->count && lazylist_func && PyList_Check(obj) && !PyList_GET_SIZE(obj))
+		result = PyObject_CallFunctionObjArgs(lazylist_func, obj, ls, NULL);
+	else if(!ls->count || ls_fill(ls, obj) == 0)
+	{
+		// complete as it is (e.g. a dict), or given its items now.
+		result = obj;
+		Py_INCREF(result);
+	}
+
+	Py_DECREF(obj);
+	Py_DECREF(ls);
+	return result;
+}
+
+
+//============================================================================
+// Streaming decoder
+//============================================================================
+
+// Iterator returned by iterload(). If the root object of the stream is a
+// tuple, list, or list-like object built by NEWOBJ/REDUCE (e.g. a CRowset),
+// its items are decoded and handed out one at a time without the container
+// ever holding them. Any other root object is decoded in full and iterated
+// over instead. Streams that can go away under the iterator (mmap and other
+// old-style buffers) are copied first.
+
+typedef struct {
+	PyObject_HEAD
+	struct Decoder dec;
+	int decoding;  // decoder is active
+	PyObject *root;  // root object, once decoding is complete
+	PyObject *iter;  // iterator over root object
+} MarshalIteratorObject;
+
+
+static void
+mi_dealloc(MarshalIteratorObject *self)
+{
+	if(self->decoding)
+		decoder_free(&self->dec);
+
+	Py_XDECREF(self->root);
+	Py_XDECREF(self->iter);
+	PyObject_Del(self);
+}
+
+
+static PyObject *
+mi_iternext(MarshalIteratorObject *self)
+{
+	PyObject *item;
+
+	if(self->decoding)
+	{
+		if((item = decoder_run(&self->dec)))
+			return item;
+
+		// decoding failed or is complete. either way we're done with the
+		// decoder now.
+		self->decoding = 0;
+		self->root = self->dec.root;
+		self->dec.root = NULL;
+		decoder_free(&self->dec);
+	}
+
+	if(!self->root)
+		return NULL;
+
+	if(!self->iter && !(self->iter = PyObject_GetIter(self->root)))
+		return NULL;
+
+	return PyIter_Next(self->iter);
+}
+
+
+static PyObject *
+mi_get_container(MarshalIteratorObject *self, void *closure)
+{
+	// the root object. when streaming, this is available as soon as it is
+	// created, but it will not contain the streamed items.
+	PyObject *obj = self->root;
+
+	if(!obj && self->decoding && self->dec.ct_ix)
+		obj = self->dec.ct_stack[1].obj;
+
+	if(!obj)
+		obj = Py_None;
+
+	Py_INCREF(obj);
+	return obj;
+}
+
+
+static PyGetSetDef mi_getset[] = {
+	{"container", (getter)mi_get_container, NULL, NULL},
+	{NULL}  /* sentinel */
+};
+
+
+PyTypeObject MarshalIterator_Type = {
+	PyObject_HEAD_INIT(NULL)
+	0,
+	"blue.marshal.iterator",
+	sizeof(MarshalIteratorObject),
+	0,
+	(destructor)mi_dealloc,	/* tp_dealloc */
+	0,					/* tp_print */
+	0,					/* tp_getattr */
+	0,					/* tp_setattr */
+	0,					/* tp_compare */
+	0,					/* tp_repr */
+	0,					/* tp_as_number */
+	0,					/* tp_as_sequence */
+	0,					/* tp_as_mapping */
+	0,					/* tp_hash */
+	0,					/* tp_call */
+	0,					/* tp_str */
+	0,					/* tp_getattro */
+	0,					/* tp_setattro */
+	0,					/* tp_as_buffer */
+	Py_TPFLAGS_DEFAULT,	/* tp_flags */
+	0,					/* tp_doc */
+	0,					/* tp_traverse */
+	0,					/* tp_clear */
+	0,					/* tp_richcompare */
+	0,					/* tp_weaklistoffset */
+	PyObject_SelfIter,	/* tp_iter */
+	(iternextfunc)mi_iternext,	/* tp_iternext */
+	0,					/* tp_methods */
+	0,					/* tp_members */
+	mi_getset,			/* tp_getset */
+};
+
+
+PyObject *
+marshal_iterload(PyObject *self, PyObject *args, PyObject *kwds)
+{
+	PyObject *py_stream;
+	PyObject *py_callback = NULL;
+	MarshalIteratorObject *it;
+
+	int skipcrc = 0;
+
+	if(!PyArg_ParseTuple(args, "O|Oi:iterload", &py_stream, &py_callback, &skipcrc))
+		return NULL;
+
+	if(!(it = PyObject_New(MarshalIteratorObject, &MarshalIterator_Type)))
+		return NULL;
+
+	it->decoding = 0;
+	it->root = NULL;
+	it->iter = NULL;
+
+	switch(decoder_init(&it->dec, py_stream, skipcrc, DECODER_KEEP|DECODER_PREFAULT))
+	{
+		case 1:
+			it->dec.streaming = 1;
+			it->decoding = 1;
+			return (PyObject *)it;
+
+		case 0:
+			if((it->root = decoder_unpickle(&it->dec)))
+				break;
+			// fallthrough
+		default:
+			decoder_free(&it->dec);
+			Py_DECREF(it);
+			return NULL;
+	}
+
+	decoder_free(&it->dec);
+	return (PyObject *)it;
+}
+
+
+//============================================================================
+// Encoder
+//============================================================================
+
+// Objects are written in a single pass. Every object that can be tagged as
+// shared is remembered (by identity) along with the position of its type
+// token. When the same object is encountered again, the shared flag is set
+// on that token retroactively and a TYPE_REF is written instead. Because
+// the tokens are recorded in stream order, the shared object map at the
+// end of the stream is simply the list of assigned slots in record order.
+
+struct SharedRecord {
+	Py_ssize_t offset;  // position of type token in output buffer
+	int slot;           // assigned shared object slot (0 = not shared yet)
+	int ready;          // set once the decoder would have stored the object
+};
+
+struct Encoder {
+	char *buf;
+	Py_ssize_t size;
+	Py_ssize_t allocated;
+
+	PyObject *memo;       // object id -> index into records
+	PyObject *keepalive;  // keeps memoized objects alive (ids must stay unique)
+
+	struct SharedRecord *records;
+	int num_records;
+	int allocated_records;
+	int shared_count;
+
+	int depth;
+};
+
+static PyObject *string_table_rev = NULL;  // string -> index in string_table
+static PyObject *global_names = NULL;  // object -> name, for TYPE_GLOBAL
+static PyObject *copyreg_newobj = NULL;
+
+#define MIN_SHARED_STRING 4  // shorter strings are cheaper to repeat than to reference
+
+static int encode_object(struct Encoder *enc, PyObject *obj);
+
+
+static int
+enc_reserve(struct Encoder *enc, Py_ssize_t n)
+{
+	char *buf;
+	Py_ssize_t allocated;
+
+	if(enc->size + n <= enc->allocated)
+		return 0;
+
+	allocated = enc->allocated;
+	while(enc->size + n > allocated)
+		allocated *= 2;
+
+	if(!(buf = PyMem_REALLOC(enc->buf, allocated)))
+	{
+		PyErr_NoMemory();
+		return -1;
+	}
+
+	enc->buf = buf;
+	enc->allocated = allocated;
+	return 0;
+}
+
+#define WRITE_BYTE(_b)\
+{\
+	if(enc_reserve(enc, 1) == -1)\
+		return -1;\
+	enc->buf[enc->size++] = (char)(_b);\
+}
+
+#define WRITE_BYTES(_p, _n)\
+{\
+	if(enc_reserve(enc, (_n)) == -1)\
+		return -1;\
+	memcpy(enc->buf + enc->size, (_p), (_n));\
+	enc->size += (_n);\
+}
+
+#define WRITE_VALUE(_ctype, _v)\
+{\
+	_ctype _tmp = (_ctype)(_v);\
+	WRITE_BYTES(&_tmp, sizeof(_ctype));\
+}
+
+// counterpart of READ_LENGTH
+#define WRITE_LENGTH(_length)\
+{\
+	if((_length) < 255)\
+	{\
+		WRITE_BYTE(_length);\
+	}\
+	else\
+	{\
+		WRITE_BYTE(255);\
+		WRITE_VALUE(int32_t, _length);\
+	}\
+}
+
+#define ENTER_CONTAINER \
+{\
+	if(++enc->depth >= MAX_DEPTH)\
+	{\
+		PyErr_SetString(PyExc_ValueError, "object hierarchy too deep");\
+		return -1;\
+	}\
+}
+
+#define LEAVE_CONTAINER enc->depth--
+
+
+// Looks up obj in the memo. Returns -1 on error, 1 if a reference to the
+// object was written, or 0 if the object was recorded and its type token
+// must be written next. In the last case *record is set to its record index.
+static int
+memoize(struct Encoder *enc, PyObject *obj, int *record)
+{
+	PyObject *key, *value;
+	struct SharedRecord *rec;
+
+	if(!(key = PyLong_FromVoidPtr(obj)))
+		return -1;
+
+	if((value = PyDict_GetItem(enc->memo, key)))
+	{
+		Py_DECREF(key);
+		rec = &enc->records[PyInt_AS_LONG(value)];
+		if(!rec->ready)
+		{
+			PyErr_Format(PyExc_ValueError, "cannot marshal recursive reference to %.100s object", obj->ob_type->tp_name);
+			return -1;
+		}
+
+		if(!rec->slot)
+		{
+			rec->slot = ++enc->shared_count;
+			enc->buf[rec->offset] |= SHARED_FLAG;
+		}
+
+		WRITE_BYTE(TYPE_REF);
+		WRITE_LENGTH(rec->slot);
+		return 1;
+	}
+
+	if(enc->num_records == enc->allocated_records)
+	{
+		int allocated = enc->allocated_records * 2;
+		if(!(rec = PyMem_REALLOC(enc->records, allocated * sizeof(struct SharedRecord))))
+		{
+			Py_DECREF(key);
+			PyErr_NoMemory();
+			return -1;
+		}
+		enc->records = rec;
+		enc->allocated_records = allocated;
+	}
+
+	*record = enc->num_records;
+	if(!(value = PyInt_FromLong(enc->num_records)))
+	{
+		Py_DECREF(key);
+		return -1;
+	}
+
+	if(PyDict_SetItem(enc->memo, key, value) == -1 || PyList_Append(enc->keepalive, obj) == -1)
+	{
+		Py_DECREF(key);
+		Py_DECREF(value);
+		return -1;
+	}
+	Py_DECREF(key);
+	Py_DECREF(value);
+
+	rec = &enc->records[enc->num_records++];
+	rec->offset = enc->size;
+	rec->slot = 0;
+	rec->ready = 1;
+	return 0;
+}
+
+#define MEMOIZE(_obj, _record)\
+{\
+	int _r = memoize(enc, (_obj), &(_record));\
+	if(_r)\
+		return _r == 1 ? 0 : -1;\
+}
+
+
+static PyObject *
+get_global_name(PyObject *obj)
+{
+	// Return value: New Reference
+	// Determines the name under which find_global can locate obj. A __guid__
+	// is preferred (that is what EVE uses), but only if it resolves to obj.
+	PyObject *name, *module, *guid, *found;
+
+	if((name = PyDict_GetItem(global_names, obj)))
+	{
+		Py_INCREF(name);
+		return name;
+	}
+
+	if((guid = PyObject_GetAttrString(obj, "__guid__")) && PyString_Check(guid) && strchr(PyString_AS_STRING(guid), '.'))
+	{
+		// find_global temporarily modifies the string it is given.
+		name = PyString_FromStringAndSize(PyString_AS_STRING(guid), PyString_GET_SIZE(guid));
+		Py_DECREF(guid);
+		if(!name)
+			return NULL;
+
+		if((found = find_global(name)))
+		{
+			Py_DECREF(found);
+			if(found == obj)
+				goto done;
+		}
+		Py_DECREF(name);
+	}
+	else
+		Py_XDECREF(guid);
+	PyErr_Clear();
+
+	if(!(name = PyObject_GetAttrString(obj, "__name__")))
+		return NULL;
+
+	if(!(module = PyObject_GetAttrString(obj, "__module__")) || module == Py_None)
+	{
+		// functions defined in C extensions may not have a module.
+		Py_XDECREF(module);
+		PyErr_Clear();
+		module = PyString_FromString("__builtin__");
+	}
+
+	if(!PyString_Check(name) || !module || !PyString_Check(module))
+	{
+		if(module)
+			PyErr_Format(PyExc_TypeError, "cannot determine global name of %.100s object", obj->ob_type->tp_name);
+		Py_DECREF(name);
+		Py_XDECREF(module);
+		return NULL;
+	}
+
+	if(strcmp(PyString_AS_STRING(module), "__builtin__"))
+	{
+		// find_global tries the reverence package first, so the prefix is
+		// not needed (and EVE does not know about it).
+		char *m = PyString_AS_STRING(module);
+		if(!strncmp(m, "reverence.", 10))
+			m += 10;
+
+		found = PyString_FromFormat("%s.%s", m, PyString_AS_STRING(name));
+		Py_DECREF(name);
+		if(!(name = found))
+		{
+			Py_DECREF(module);
+			return NULL;
+		}
+	}
+	Py_DECREF(module);
+
+done:
+	if(PyDict_SetItem(global_names, obj, name) == -1)
+	{
+		Py_DECREF(name);
+		return NULL;
+	}
+	return name;
+}
+
+
+static int
+encode_global(struct Encoder *enc, PyObject *obj)
+{
+	PyObject *name;
+	int record;
+
+	MEMOIZE(obj, record);
+
+	if(!(name = get_global_name(obj)))
+		return -1;
+
+	WRITE_BYTE(TYPE_GLOBAL);
+	WRITE_LENGTH(PyString_GET_SIZE(name));
+	WRITE_BYTES(PyString_AS_STRING(name), PyString_GET_SIZE(name));
+	Py_DECREF(name);
+	return 0;
+}
+
+
+static int
+encode_string(struct Encoder *enc, PyObject *obj)
+{
+	Py_ssize_t length = PyString_GET_SIZE(obj);
+	PyObject *index;
+	int record;
+
+	if(length == 0)
+	{
+		WRITE_BYTE(TYPE_STRING0);
+		return 0;
+	}
+
+	if(length == 1)
+	{
+		WRITE_BYTE(TYPE_STRING1);
+		WRITE_BYTE(*PyString_AS_STRING(obj));
+		return 0;
+	}
+
+	if((index = PyDict_GetItem(string_table_rev, obj)))
+	{
+		WRITE_BYTE(TYPE_STRINGR);
+		WRITE_LENGTH(PyInt_AS_LONG(index));
+		return 0;
+	}
+
+	if(length >= MIN_SHARED_STRING)
+		MEMOIZE(obj, record);
+
+	// TYPE_STRING has the same overhead for short strings, but does not
+	// support the shared flag. TYPE_STRINGL does.
+	WRITE_BYTE(TYPE_STRINGL);
+	WRITE_LENGTH(length);
+	WRITE_BYTES(PyString_AS_STRING(obj), length);
+	return 0;
+}
+
+
+static int
+encode_unicode(struct Encoder *enc, PyObject *obj)
+{
+	PyObject *utf8;
+
+	if(!PyUnicode_GET_SIZE(obj))
+	{
+		WRITE_BYTE(TYPE_UNICODE0);
+		return 0;
+	}
+
+	if(!(utf8 = PyUnicode_AsUTF8String(obj)))
+		return -1;
+
+	if(enc_reserve(enc, 6 + PyString_GET_SIZE(utf8)) == -1)
+	{
+		Py_DECREF(utf8);
+		return -1;
+	}
+
+	WRITE_BYTE(TYPE_UTF8);
+	WRITE_LENGTH(PyString_GET_SIZE(utf8));
+	WRITE_BYTES(PyString_AS_STRING(utf8), PyString_GET_SIZE(utf8));
+	Py_DECREF(utf8);
+	return 0;
+}
+
+
+static int
+encode_integer(struct Encoder *enc, PY_LONG_LONG v)
+{
+	if(v >= -1 && v <= 1)
+	{
+		WRITE_BYTE(v == 0 ? TYPE_ZERO : (v == 1 ? TYPE_ONE : TYPE_MINUSONE));
+	}
+	else if(v >= -0x80 && v <= 0x7f)
+	{
+		WRITE_BYTE(TYPE_INT8);
+		WRITE_VALUE(int8_t, v);
+	}
+	else if(v >= -0x8000 && v <= 0x7fff)
+	{
+		WRITE_BYTE(TYPE_INT16);
+		WRITE_VALUE(int16_t, v);
+	}
+	else if(v >= -0x80000000LL && v <= 0x7fffffffLL)
+	{
+		WRITE_BYTE(TYPE_INT32);
+		WRITE_VALUE(int32_t, v);
+	}
+	else
+	{
+		WRITE_BYTE(TYPE_INT64);
+		WRITE_VALUE(int64_t, v);
+	}
+	return 0;
+}
 
-			container->free--;
-			if(container->free)
-				// still room in this container.
-				// break out of container handling to get next object for it.
-				break;
 
-			// this container is done, it is the next object to put into the
-			// container under it!
-			obj = container->obj;
+static int
+encode_long(struct Encoder *enc, PyObject *obj)
+{
+	PY_LONG_LONG v;
+	size_t nbytes;
+	int overflow;
 
-			// switch context to said older container
-			POP_CONTAINER;
-		}
+	v = PyLong_AsLongLongAndOverflow(obj, &overflow);
+	if(v == -1 && PyErr_Occurred())
+		return -1;
 
-		// we've processed the object. clear it for next one.
-		obj = NULL;
+	if(!overflow)
+	{
+		// INT64 is always decoded as a long, which preserves the type.
+		WRITE_BYTE(TYPE_INT64);
+		WRITE_VALUE(int64_t, v);
+		return 0;
 	}
 
-	// if we get here, we're out of data, but it's a "clean" eof; we ran out
-	// of data while expecting a new object...
-	error = "Not enough objects in stream";
+	if((nbytes = _PyLong_NumBits(obj)) == (size_t)-1 && PyErr_Occurred())
+		return -1;
+	nbytes = (nbytes >> 3) + 1;
+
+	WRITE_BYTE(TYPE_LONG);
+	WRITE_LENGTH(nbytes);
+	if(enc_reserve(enc, nbytes) == -1)
+		return -1;
+	if(_PyLong_AsByteArray((PyLongObject *)obj, (unsigned char *)enc->buf + enc->size, nbytes, 1, 1) == -1)
+		return -1;
+	enc->size += nbytes;
+	return 0;
+}
 
-fail:
-	PyErr_Format(UnmarshalError, "%s - type:0x%02x ctype:0x%02x len:%d share:%d pos:%d size:%d", error, type, container->type, (int)length, shared, (int)(s-stream), (int)(size));
 
-cleanup:
-	// on any error the current object we were working on will be unassociated
-	// with anything, decref it. if decode was succesful or an object failed to
-	// be created, it will be NULL anyway.
-	Py_XDECREF(obj);
+static int
+encode_float(struct Encoder *enc, PyObject *obj)
+{
+	double v = PyFloat_AS_DOUBLE(obj);
+	static const double zero = 0.0;
 
-	// same story for containers...
-	while(container->type)
+	// FLOAT0 would lose the sign of -0.0
+	if(!memcmp(&v, &zero, sizeof(double)))
 	{
-		Py_XDECREF(container->obj);
-		// possibly unassociated object for dict entry?
-		if(container->type == TYPE_DICT || container->type == TYPE_DICT_ITERATOR)
+		WRITE_BYTE(TYPE_FLOAT0);
+		return 0;
+	}
+
+	WRITE_BYTE(TYPE_FLOAT);
+	WRITE_VALUE(double, v);
+	return 0;
+}
+
+
+// writes the type token and length for a sequence
+static int
+encode_sequence_header(struct Encoder *enc, int type, Py_ssize_t length)
+{
+	if(type == TYPE_TUPLE)
+	{
+		if(length == 1)
+			type = TYPE_TUPLE1;
+		else if(length == 2)
+			type = TYPE_TUPLE2;
+	}
+	else if(type == TYPE_LIST)
+	{
+		if(length == 0)
+			type = TYPE_LIST0;
+		else if(length == 1)
+			type = TYPE_LIST1;
+	}
+
+	WRITE_BYTE(type);
+	if(type == TYPE_TUPLE || type == TYPE_LIST)
+		WRITE_LENGTH(length);
+	return 0;
+}
+
+
+static int
+encode_items(struct Encoder *enc, PyObject **items, Py_ssize_t length)
+{
+	Py_ssize_t i;
+
+	ENTER_CONTAINER;
+	for(i=0; i<length; i++)
+		if(encode_object(enc, items[i]) == -1)
+			return -1;
+	LEAVE_CONTAINER;
+	return 0;
+}
+
+
+static int
+encode_dict(struct Encoder *enc, PyObject *obj)
+{
+	PyObject *key, *value;
+	Py_ssize_t pos = 0;
+	Py_ssize_t length = PyDict_Size(obj);
+	int record;
+
+	MEMOIZE(obj, record);
+
+	WRITE_BYTE(TYPE_DICT);
+	WRITE_LENGTH(length);
+
+	ENTER_CONTAINER;
+	while(PyDict_Next(obj, &pos, &key, &value))
+	{
+		// counted dicts are stored as value, key pairs.
+		if(encode_object(enc, value) == -1 || encode_object(enc, key) == -1)
+			return -1;
+	}
+	LEAVE_CONTAINER;
+
+	if(PyDict_Size(obj) != length)
+	{
+		PyErr_SetString(PyExc_RuntimeError, "dictionary changed size during marshal");
+		return -1;
+	}
+	return 0;
+}
+
+
+// writes list and dict items following a NEWOBJ or REDUCE header.
+static int
+encode_iterator_items(struct Encoder *enc, PyObject *listitems, PyObject *dictitems)
+{
+	PyObject *iter, *item;
+
+	if(listitems && listitems != Py_None)
+	{
+		if(!(iter = PyObject_GetIter(listitems)))
+			return -1;
+		while((item = PyIter_Next(iter)))
 		{
-			Py_XDECREF(container->obj2);
+			if(encode_object(enc, item) == -1)
+			{
+				Py_DECREF(item);
+				Py_DECREF(iter);
+				return -1;
+			}
+			Py_DECREF(item);
+		}
+		Py_DECREF(iter);
+		if(PyErr_Occurred())
+			return -1;
+	}
+
+	WRITE_BYTE(TYPE_MARK);
+
+	if(dictitems && dictitems != Py_None)
+	{
+		if(!(iter = PyObject_GetIter(dictitems)))
+			return -1;
+		while((item = PyIter_Next(iter)))
+		{
+			// iterated dicts are stored as key, value pairs.
+			if(!PyTuple_Check(item) || PyTuple_GET_SIZE(item) != 2)
+			{
+				PyErr_SetString(PyExc_TypeError, "dict items iterator must return 2-tuples");
+				Py_DECREF(item);
+				Py_DECREF(iter);
+				return -1;
+			}
+			if(encode_object(enc, PyTuple_GET_ITEM(item, 0)) == -1 || encode_object(enc, PyTuple_GET_ITEM(item, 1)) == -1)
+			{
+				Py_DECREF(item);
+				Py_DECREF(iter);
+				return -1;
+			}
+			Py_DECREF(item);
 		}
+		Py_DECREF(iter);
+		if(PyErr_Occurred())
+			return -1;
+	}
+
+	WRITE_BYTE(TYPE_MARK);
+	return 0;
+}
+
 
-		POP_CONTAINER;
+static int
+encode_dbrow(struct Encoder *enc, PyDBRowObject *row)
+{
+	PyDBRowDescriptorObject *header = row->dbrow_header;
+	PyObject *packed, *item;
+	int record, i, offset;
+
+	MEMOIZE((PyObject *)row, record);
+	enc->records[record].ready = 0;
+
+	WRITE_BYTE(TYPE_DBROW);
+
+	ENTER_CONTAINER;
+	if(encode_object(enc, (PyObject *)header) == -1)
+		return -1;
+
+	if(!(packed = PyDBRow_Pack(row)))
+		return -1;
+
+	if(enc_reserve(enc, 5 + PyString_GET_SIZE(packed)) == -1)
+	{
+		Py_DECREF(packed);
+		return -1;
 	}
+	WRITE_LENGTH(PyString_GET_SIZE(packed));
+	WRITE_BYTES(PyString_AS_STRING(packed), PyString_GET_SIZE(packed));
+	Py_DECREF(packed);
+
+	enc->records[record].ready = 1;
 
-	if(shared_obj)
+	// the decoder expects exactly rd_num_objects objects.
+	offset = ALIGNED_PTR(header->rd_unpacked_size);
+	for(i=0; i<header->rd_num_objects; i++)
 	{
-		/* shared object list held a safety ref to all objects, decref em */
-		int i;
-		for(i=0; i<shared_mapsize; i++)
-			Py_XDECREF(shared_obj[i]);
+		item = NULL;
+		if(i < row->ob_size)
+			item = *(PyObject **)(&row->dbrow_data[offset + i * sizeof(void *)]);
 
-		/* and free the list */
-		PyMem_FREE(shared_obj);
+		if(encode_object(enc, item ? item : Py_None) == -1)
+			return -1;
+	}
+	LEAVE_CONTAINER;
+	return 0;
+}
+
+
+static int
+encode_instance(struct Encoder *enc, PyObject *obj)
+{
+	PyObject *name, *state, *__getstate__;
+	int record, result;
+
+	MEMOIZE(obj, record);
+	enc->records[record].ready = 0;
+
+	WRITE_BYTE(TYPE_INSTANCE);
+
+	ENTER_CONTAINER;
+	if(!(name = get_global_name((PyObject *)((PyInstanceObject *)obj)->in_class)))
+		return -1;
+
+	result = encode_object(enc, name);
+	Py_DECREF(name);
+	if(result == -1)
+		return -1;
+
+	enc->records[record].ready = 1;
+
+	if((__getstate__ = PyObject_GetAttrString(obj, "__getstate__")))
+	{
+		state = PyObject_CallObject(__getstate__, NULL);
+		Py_DECREF(__getstate__);
+		if(!state)
+			return -1;
 	}
+	else
+	{
+		PyErr_Clear();
+		if(!(state = PyObject_GetAttr(obj, py__dict__)))
+			return -1;
+	}
+
+	result = encode_object(enc, state);
+	Py_DECREF(state);
+	LEAVE_CONTAINER;
 	return result;
 }
 
 
-PyObject *
-marshal_Load(PyObject *self, PyObject *args, PyObject *kwds)
+// encodes anything else using the object's __reduce_ex__ method, the same
+// way pickle protocol 2 would.
+static int
+encode_reduce(struct Encoder *enc, PyObject *obj)
 {
-	PyObject *py_stream;
-	PyObject *py_callback = NULL;
-	PyObject *result;
+	PyObject *reduced, *callable, *args, *state = Py_None, *listitems = NULL, *dictitems = NULL;
+	PyObject *payload[3];
+	Py_ssize_t size;
+	int record;
+	int result = -1;
 
-	int skipcrc = 0;
+	if(PyDBRowDescriptor_Check(obj))
+	{
+		// DBRowDescriptor.__reduce_ex__ does not include its properties.
+		PyDBRowDescriptorObject *rd = (PyDBRowDescriptorObject *)obj;
+		if(rd->rd_properties)
+			reduced = Py_BuildValue("O(O)O", obj->ob_type, rd->rd_initarg, rd->rd_properties);
+		else
+			reduced = Py_BuildValue("O(O)", obj->ob_type, rd->rd_initarg);
+	}
+	else
+		reduced = PyObject_CallMethod(obj, "__reduce_ex__", "i", 2);
 
-	if(!PyArg_ParseTuple(args, "O|Oi:Load", &py_stream, &py_callback, &skipcrc))
-		return NULL;
+	if(!reduced)
+		return -1;
 
-	if(!PyString_Check(py_stream))
+	if(PyString_Check(reduced))
 	{
-		PyErr_SetString(PyExc_TypeError, "expected string argument");
-		return NULL;
+		// object is to be treated as a global
+		Py_DECREF(reduced);
+		return encode_global(enc, obj);
 	}
 
-	if(py_callback == Py_None)
-		py_callback = NULL;
+	if(!PyTuple_Check(reduced) || (size = PyTuple_GET_SIZE(reduced)) < 2 || size > 5)
+	{
+		PyErr_Format(PyExc_TypeError, "%.100s.__reduce_ex__ must return a string or a tuple of 2 to 5 elements", obj->ob_type->tp_name);
+		goto fail;
+	}
 
-	if(py_callback && !PyCallable_Check(py_callback))
+	callable = PyTuple_GET_ITEM(reduced, 0);
+	args = PyTuple_GET_ITEM(reduced, 1);
+	if(size > 2)
+		state = PyTuple_GET_ITEM(reduced, 2);
+	if(size > 3)
+		listitems = PyTuple_GET_ITEM(reduced, 3);
+	if(size > 4)
+		dictitems = PyTuple_GET_ITEM(reduced, 4);
+
+	if(!PyTuple_Check(args))
 	{
-		PyErr_SetString(PyExc_TypeError, "callback argument must be callable");
-		return NULL;
+		PyErr_Format(PyExc_TypeError, "%.100s.__reduce_ex__ arguments must be a tuple", obj->ob_type->tp_name);
+		goto fail;
 	}
 
-	result = marshal_Load_internal(py_stream, py_callback, skipcrc);
+	if((result = memoize(enc, obj, &record)))
+	{
+		result = result == 1 ? 0 : -1;
+		goto fail;
+	}
+	result = -1;
+	enc->records[record].ready = 0;
+
+	// the payload tuple is written inline; it's a temporary object, so there
+	// is no point in memoizing it.
+	if(callable == copyreg_newobj)
+	{
+		if(!PyTuple_GET_SIZE(args))
+		{
+			PyErr_SetString(PyExc_TypeError, "__newobj__ arglist is empty");
+			goto fail;
+		}
+
+		if(enc_reserve(enc, 1) == -1)
+			goto fail;
+		enc->buf[enc->size++] = TYPE_NEWOBJ;
+		payload[0] = args;
+		payload[1] = state;
+		size = (state == Py_None) ? 1 : 2;
+	}
+	else
+	{
+		if(enc_reserve(enc, 1) == -1)
+			goto fail;
+		enc->buf[enc->size++] = TYPE_REDUCE;
+		payload[0] = callable;
+		payload[1] = args;
+		payload[2] = state;
+		size = (state == Py_None) ? 2 : 3;
+	}
+
+	if(++enc->depth >= MAX_DEPTH)
+	{
+		PyErr_SetString(PyExc_ValueError, "object hierarchy too deep");
+		goto fail;
+	}
+	if(encode_sequence_header(enc, TYPE_TUPLE, size) == -1)
+		goto fail;
+	if(encode_items(enc, payload, size) == -1)
+		goto fail;
+
+	enc->records[record].ready = 1;
+
+	if(encode_iterator_items(enc, listitems, dictitems) == -1)
+		goto fail;
+	LEAVE_CONTAINER;
+
+	result = 0;
+fail:
+	Py_DECREF(reduced);
+	return result;
+}
+
+
+static int
+encode_object(struct Encoder *enc, PyObject *obj)
+{
+	PyTypeObject *type = obj->ob_type;
+	int record;
+
+	if(obj == Py_None)
+	{
+		WRITE_BYTE(TYPE_NONE);
+		return 0;
+	}
+
+	if(obj == Py_True || obj == Py_False)
+	{
+		WRITE_BYTE(obj == Py_True ? TYPE_TRUE : TYPE_FALSE);
+		return 0;
+	}
+
+	if(type == &PyString_Type)
+		return encode_string(enc, obj);
+
+	if(type == &PyInt_Type)
+		return encode_integer(enc, PyInt_AS_LONG(obj));
+
+	if(type == &PyTuple_Type)
+	{
+		if(!PyTuple_GET_SIZE(obj))
+		{
+			WRITE_BYTE(TYPE_TUPLE0);
+			return 0;
+		}
+		MEMOIZE(obj, record);
+		if(encode_sequence_header(enc, TYPE_TUPLE, PyTuple_GET_SIZE(obj)) == -1)
+			return -1;
+		return encode_items(enc, &PyTuple_GET_ITEM(obj, 0), PyTuple_GET_SIZE(obj));
+	}
+
+	if(type == &PyDBRow_Type)
+		return encode_dbrow(enc, (PyDBRowObject *)obj);
+
+	if(type == &PyUnicode_Type)
+		return encode_unicode(enc, obj);
+
+	if(type == &PyFloat_Type)
+		return encode_float(enc, obj);
+
+	if(type == &PyLong_Type)
+		return encode_long(enc, obj);
+
+	if(type == &PyList_Type)
+	{
+		Py_ssize_t length = PyList_GET_SIZE(obj);
+		MEMOIZE(obj, record);
+		if(encode_sequence_header(enc, TYPE_LIST, length) == -1)
+			return -1;
+		if(encode_items(enc, ((PyListObject *)obj)->ob_item, length) == -1)
+			return -1;
+		if(PyList_GET_SIZE(obj) != length)
+		{
+			PyErr_SetString(PyExc_RuntimeError, "list changed size during marshal");
+			return -1;
+		}
+		return 0;
+	}
+
+	if(type == &PyDict_Type)
+		return encode_dict(enc, obj);
+
+	if(PyInstance_Check(obj))
+		return encode_instance(enc, obj);
+
+	if(PyType_Check(obj) || PyClass_Check(obj) || PyFunction_Check(obj) || PyCFunction_Check(obj))
+		return encode_global(enc, obj);
+
+	return encode_reduce(enc, obj);
+}
+
+
+static PyObject *
+marshal_Save_internal(PyObject *obj)
+{
+	// Return value: New Reference
+	struct Encoder enc;
+	PyObject *result = NULL;
+	int32_t *map;
+	int i;
+
+	if(!copyreg_newobj)
+	{
+		PyObject *copy_reg;
+		if(!(copy_reg = PyImport_ImportModule("copy_reg")))
+			return NULL;
+		copyreg_newobj = PyObject_GetAttrString(copy_reg, "__newobj__");
+		Py_DECREF(copy_reg);
+		if(!copyreg_newobj)
+			return NULL;
+	}
+
+	enc.size = 0;
+	enc.allocated = 4096;
+	enc.num_records = 0;
+	enc.allocated_records = 256;
+	enc.shared_count = 0;
+	enc.depth = 0;
+	enc.buf = PyMem_MALLOC(enc.allocated);
+	enc.records = PyMem_MALLOC(enc.allocated_records * sizeof(struct SharedRecord));
+	enc.memo = PyDict_New();
+	enc.keepalive = PyList_New(0);
+
+	if(!enc.buf || !enc.records)
+	{
+		PyErr_NoMemory();
+		goto cleanup;
+	}
+	if(!enc.memo || !enc.keepalive)
+		goto cleanup;
+
+	// header; the shared object count is filled in afterwards.
+	enc.buf[enc.size++] = PROTOCOL_ID;
+	enc.size += 4;
+
+	if(encode_object(&enc, obj) == -1)
+		goto cleanup;
+
+	*(int32_t *)(enc.buf + 1) = enc.shared_count;
+
+	if(!(result = PyString_FromStringAndSize(NULL, enc.size + enc.shared_count * 4)))
+		goto cleanup;
+
+	memcpy(PyString_AS_STRING(result), enc.buf, enc.size);
+
+	// shared tokens are recorded in stream order, so the map is simply the
+	// slots in that order.
+	map = (int32_t *)(PyString_AS_STRING(result) + enc.size);
+	for(i=0; i<enc.num_records; i++)
+		if(enc.records[i].slot)
+			*map++ = enc.records[i].slot;
+
+cleanup:
+	if(enc.buf)
+		PyMem_FREE(enc.buf);
+	if(enc.records)
+		PyMem_FREE(enc.records);
+	Py_XDECREF(enc.memo);
+	Py_XDECREF(enc.keepalive);
 	return result;
 }
 
 
-PyObject *marshal_Save_internal(PyObject *string)
+PyObject *
+marshal_Save(PyObject *self, PyObject *args, PyObject *kwds)
 {
-	return NULL;	
+	PyObject *obj;
+
+	if(!PyArg_ParseTuple(args, "O:Save", &obj))
+		return NULL;
+
+	return marshal_Save_internal(obj);
 }
 
 
@@ -1184,6 +3742,22 @@ marshal_set_find_global_func(PyObject *self, PyObject *callable)
 	return Py_None;
 }
 
+PyObject *
+marshal_set_lazylist_func(PyObject *self, PyObject *callable)
+{
+	if(!PyCallable_Check(callable))
+	{
+		PyErr_SetString(PyExc_TypeError, "argument must be callable");
+		return NULL;
+	}
+
+	Py_XDECREF(lazylist_func);
+	lazylist_func = callable;
+	Py_INCREF(lazylist_func);
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
 PyObject *
 marshal_set_debug_func(PyObject *self, PyObject *callable)
 {
@@ -1204,8 +3778,13 @@ marshal_set_debug_func(PyObject *self, PyObject *callable)
 
 static struct PyMethodDef marshal_methods[] = {
 	{"Load", (PyCFunction)marshal_Load, METH_VARARGS|METH_KEYWORDS, NULL},
+	{"Save", (PyCFunction)marshal_Save, METH_VARARGS|METH_KEYWORDS, NULL},
+	{"iterload", (PyCFunction)marshal_iterload, METH_VARARGS|METH_KEYWORDS, NULL},
+	{"LoadHeader", (PyCFunction)marshal_LoadHeader, METH_VARARGS, NULL},
+	{"lazyload", (PyCFunction)marshal_lazyload, METH_VARARGS|METH_KEYWORDS, NULL},
 	{"_set_find_global_func", (PyCFunction)marshal_set_find_global_func, METH_O, NULL},
 	{"_set_debug_func", (PyCFunction)marshal_set_debug_func, METH_O, NULL},
+	{"_set_lazylist_func", (PyCFunction)marshal_set_lazylist_func, METH_O, NULL},
 	{ NULL, NULL }
 };
 
@@ -1225,6 +3804,14 @@ init_marshal(void)
 
 	PycString_IMPORT;
 
+	MarshalIterator_Type.ob_type = &PyType_Type;
+	if(PyType_Ready(&MarshalIterator_Type) < 0)
+		return NULL;
+
+	LazySequence_Type.ob_type = &PyType_Type;
+	if(PyType_Ready(&LazySequence_Type) < 0)
+		return NULL;
+
 	m = Py_InitModule("_blue.marshal", marshal_methods);
 	if(!m)
 		return NULL;
@@ -1258,10 +3845,16 @@ init_marshal(void)
 		goto fail;
 	if(!(string_table = PyList_New(0)))
 		goto fail;
+	if(!(string_table_rev = PyDict_New()))
+		goto fail;
+	if(!(global_names = PyDict_New()))
+		goto fail;
 	if(!(UnmarshalError = PyErr_NewException("reverence.blue.marshal.UnmarshalError", NULL, NULL)))
 		goto fail;
 
 	PyModule_AddObject(m, "_stringtable", (PyObject*)string_table);
+	Py_INCREF(string_table_rev);
+	PyModule_AddObject(m, "_stringtable_rev", (PyObject*)string_table_rev);
 	PyModule_AddObject(m, "UnmarshalError", UnmarshalError);
 
 #if MARSHAL_DEBUG
@@ -1320,6 +3913,8 @@ fail:
 	Py_XDECREF(pyappend);
 	Py_XDECREF(global_cache);
 	Py_XDECREF(string_table);
+	Py_XDECREF(string_table_rev);
+	Py_XDECREF(global_names);
 	Py_XDECREF(UnmarshalError);
 	return 0;
 }
@@ -16,6 +16,8 @@ import platform
 import time
 import cPickle
 import binascii
+import mmap
+import threading
 
 from . import config
 from . import _blue as blue  # can't simply import blue (circular import). only using marshal anyway.
@@ -25,6 +27,18 @@ __all__ = ["GetCacheFileName", "CacheMgr"]
 _join = os.path.join
 _exists = os.path.exists
 
+# the machocache folders that find() and FindCacheFile() look in.
+_cacheFolders = ("CachedObjects", "CachedMethodCalls", "MethodCallCachingDetails")
+
+# position of the version in the state of the cached object envelopes. The
+# second name of each is the one reverence's own marshal.Save() uses.
+_versionIndex = {
+	"objectCaching.CachedObject": 0,
+	"objectCaching.CachedMethodCallResult": 2,
+	"carbon.common.script.net.objectCaching.CachedObject": 0,
+	"carbon.common.script.net.objectCaching.CachedMethodCallResult": 2,
+}
+
 
 def GetCacheFileName(key):
 	"""Returns filename for specified object name."""
@@ -55,14 +69,254 @@ def _readfile(filename):
 		return f.read()
 
 
+def _loadfile(filename):
+	"""Decodes the marshal stream in specified file straight from a memory map."""
+	# marshal.Load does not lock the map (mmap only has the old buffer
+	# interface), which is fine because it is done with it before the map is
+	# closed. Decoders that hold on to the stream (iterload, lazyload) copy it.
+	with open(filename, "rb") as f:
+		try:
+			m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		except (ValueError, EnvironmentError):
+			# empty file, or a file that can't be mapped.
+			return blue.marshal.Load(f.read())
+	try:
+		return blue.marshal.Load(m)
+	finally:
+		m.close()
+
+
+def _iterfile(filename):
+	"""Yields the top-level items of the marshal stream in specified file as they are decoded."""
+	# iterload copies a mapped stream (see _loadfile), so just read the file.
+	for item in blue.marshal.iterload(_readfile(filename)):
+		yield item
+
+
+def _lazyfile(filename):
+	"""Returns the marshal stream in specified file as decoded by marshal.lazyload."""
+	# lazyload copies a mapped stream (see _loadfile), so just read the file.
+	return blue.marshal.lazyload(_readfile(filename))
+
+
+def _loadheader(filename, withstate=True):
+	"""Decodes the header of the marshal stream in specified file (see marshal.LoadHeader)."""
+	with open(filename, "rb") as f:
+		try:
+			m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		except (ValueError, EnvironmentError):
+			return blue.marshal.LoadHeader(f.read(), withstate)
+	try:
+		return blue.marshal.LoadHeader(m, withstate)
+	finally:
+		m.close()
+
+
+def _peekfile(filename):
+	"""Returns the key and version of the object in specified cache file."""
+	header = _loadheader(filename)
+	if header:
+		what, className, state = header
+		index = _versionIndex.get(className)
+		if index is not None and state is not None and index < len(state) and state[index] is not None:
+			return what, state[index]
+
+	# unknown envelope, or the version could not be decoded on its own.
+	what, obj = _loadfile(filename)
+	return what, getattr(obj, "version", None)
+
+
+
+def _loadfolder_worker(args):
+	# Loads a cache file in an IterCacheFolder() worker process and returns
+	# the result marshalled.
+	filename, func = args
+	from . import blue as bloo  # sets up the marshaller in this process.
+	what, obj = _loadfile(filename)
+	if func:
+		obj = func(what, obj)
+	return filename, bloo.marshal.Save((what, obj))
+
+
+def _newest(entries):
+	# returns the (path, version) with the highest version, or None. the
+	# first one wins if there are several.
+	newest = None
+	version = (0L, 0)
+	for entry in entries:
+		if entry[1] > version:
+			newest = entry
+			version = entry[1]
+	return newest
+
+
+
+class _CacheIndex(object):
+	"""Maps cache keys to the cache files holding them, with their versions.
+
+	A folder is only scanned again when its modification time changes, and
+	then only the files that changed are read. If filename is given, the
+	index is kept in that file between sessions.
+	"""
+
+	FORMAT = 1
+
+	def __init__(self, folders, filename=None):
+		self.folders = folders
+		self.filename = filename
+		self.folderTimes = {}  # folder: mtime at last scan
+		self.files = {}  # path: (mtime, size, key, version)
+		self.keys = {}  # key: [(path, version), ...]
+		self._lock = threading.Lock()
+
+		if filename:
+			try:
+				with open(filename, "rb") as f:
+					fmt, folders, self.folderTimes, self.files = cPickle.load(f)
+				if fmt != self.FORMAT or folders != self.folders:
+					raise ValueError("stale index")
+			except Exception:
+				# missing, unreadable or for other folders. start over.
+				self.folderTimes = {}
+				self.files = {}
+			self._build()
+
+
+	def _build(self):
+		# entries of a key are listed in the order of the folders.
+		keys = {}
+		order = self.folders.index
+		for path in sorted(self.files, key=lambda path: order(os.path.dirname(path))):
+			mtime, size, key, version = self.files[path]
+			try:
+				keys.setdefault(key, []).append((path, version))
+			except TypeError:
+				pass  # unhashable key. find() will probe for it instead.
+		self.keys = keys
+
+
+	def _scan(self, folder):
+		files = self.files
+		prefix = _join(folder, "")
+		old = set(path for path in files if path.startswith(prefix))
+
+		try:
+			names = os.listdir(folder)
+		except EnvironmentError:
+			names = []
+
+		for name in names:
+			if name.endswith(".cache"):
+				path = _join(folder, name)
+				if self._update(path):
+					old.discard(path)
+
+		for path in old:
+			del files[path]
+
+
+	def _update(self, path):
+		# reads the key and version of a file, unless its entry is current.
+		# returns False if the file is gone.
+		try:
+			st = os.stat(path)
+		except EnvironmentError:
+			return False
+		entry = self.files.get(path)
+		if not (entry and entry[:2] == (st.st_mtime, st.st_size)):
+			try:
+				key, version = _peekfile(path)
+			except Exception:
+				key = version = None  # not a (readable) cache file
+			self.files[path] = (st.st_mtime, st.st_size, key, version)
+		return True
+
+
+	def _current(self, path):
+		# true if the entry of path matches the file.
+		try:
+			st = os.stat(path)
+		except EnvironmentError:
+			return False
+		entry = self.files.get(path)
+		return bool(entry) and entry[:2] == (st.st_mtime, st.st_size)
+
+
+	def refresh(self):
+		"""Rescans the folders that changed since the last refresh."""
+		with self._lock:
+			changed = False
+			for folder in self.folders:
+				try:
+					mtime = os.stat(folder).st_mtime
+				except EnvironmentError:
+					mtime = None
+				if mtime != self.folderTimes.get(folder, -1):
+					self._scan(folder)
+					self.folderTimes[folder] = mtime
+					changed = True
+
+			if changed:
+				self._build()
+				if self.filename:
+					self._save()
+
+
+	def _save(self):
+		tempname = "%s.%d.tmp" % (self.filename, os.getpid())
+		try:
+			with open(tempname, "wb") as f:
+				cPickle.dump((self.FORMAT, self.folders, self.folderTimes, self.files), f, cPickle.HIGHEST_PROTOCOL)
+			if os.name == "nt" and _exists(self.filename):
+				os.remove(self.filename)
+			os.rename(tempname, self.filename)
+		except (EnvironmentError, cPickle.PicklingError, TypeError):
+			# not being able to keep the index is no reason to fail.
+			try:
+				os.remove(tempname)
+			except EnvironmentError:
+				pass
+
+
+	def lookup(self, key):
+		"""Returns list of (path, version) of the cache files holding key,
+		or None if key can't be indexed, or its files changed since."""
+		self.refresh()
+		try:
+			entries = self.keys.get(key, [])
+		except TypeError:
+			return None
+
+		# files overwritten in place don't change the folder's mtime, so
+		# check the files themselves as well.
+		stale = [path for path, version in entries if not self._current(path)]
+		if stale:
+			with self._lock:
+				for path in stale:
+					if not self._update(path):
+						self.files.pop(path, None)
+				self._build()
+				if self.filename:
+					self._save()
+			# the file by that name may now hold the key in another folder.
+			return None
+
+		return entries
+
+
 
 class CacheMgr:
 	"""Interface to an EVE Installation's cache and bulkdata."""
 
+	# If set, the index of cache files used by find() and FindCacheFile() is
+	# kept in this file, so that it need not be built again every session.
+	cacheIndexPath = None
+
 	def __init__(self, eve):
 		self.eve = eve
 		self.cfg = None
 		self._time_load = 0.0
+		self._index = None
 
 		self.machocache = eve.paths.machocache
 		
@@ -75,25 +329,77 @@ class CacheMgr:
 		return GetCacheFileName(key)
 
 
-	def LoadCacheFolder(self, name, filter="*.cache"):
-		"""Loads all .cache files from specified folder. Returns a dict keyed on object name."""
+	def LoadCacheFolder(self, name, filter="*.cache", callback=None):
+		"""Loads all .cache files from specified folder. Returns a dict keyed on object name.
+		See IterCacheFolder() for the callback argument."""
 
 		# Note that this method is used mainly for debugging and testing,
 		# and is subject to change without notice.
 		crap = {}
-		for filename in glob.glob(_join(name, filter)):
-			what, obj = blue.marshal.Load(_readfile(filename))
+		for what, obj in self.IterCacheFolder(name, filter, callback=callback):
 			crap[what] = obj
 		return crap
 
 
+	def IterCacheFolder(self, name, filter="*.cache", processes=1, func=None, callback=None):
+		"""Yields (key, object) of all .cache files in specified folder.
+
+		If func is given, it is called as func(key, object) and its result
+		is yielded instead of the object. If processes is not 1, this is
+		done by that many worker processes (None means one per CPU), and the
+		results are yielded in the order they are done. func must then be a
+		module level function, and its results are sent back in marshal
+		format. It should therefore do the bulk of the work, such as turning
+		the object into text; merely decoding the files in the workers gains
+		nothing, so without func they are always loaded here.
+
+		A callback function can be provided which will be called as
+		callback(current, total, filename) after each file.
+		"""
+		filenames = glob.glob(_join(name, filter))
+		total = len(filenames)
+
+		if processes == 1 or not func:
+			for current, filename in enumerate(filenames):
+				what, obj = _loadfile(filename)
+				if callback:
+					callback(current, total, filename)
+				yield what, (func(what, obj) if func else obj)
+			return
+
+		import multiprocessing
+		pool = multiprocessing.Pool(processes)
+		try:
+			results = pool.imap_unordered(_loadfolder_worker, [(filename, func) for filename in filenames])
+			for current, (filename, data) in enumerate(results):
+				what, obj = blue.marshal.Load(data)
+				if callback:
+					callback(current, total, filename)
+				yield what, obj
+		except:
+			pool.terminate()
+			raise
+		else:
+			pool.close()
+		finally:
+			pool.join()
+
+
 	def _loadobject(self, key, canraise=False, folder=None):
 		name = _join(self.machocache, folder, self.GetCacheFileName(key))
 		if not canraise:
 			if not _exists(name):
 				return None
 
-		what, obj = blue.marshal.Load(_readfile(name))
+		# check the key before decoding the whole thing. the state is not
+		# needed for that, so it isn't scanned.
+		header = _loadheader(name, False)
+		if header and header[0] != key:
+			if canraise:
+				raise RuntimeError("Hash collision: Wanted '%s' but got '%s'" % (key, header[0]))
+			return None
+
+		what, obj = _loadfile(name)
 		if what != key:
 			# Oops. We did not get what we asked for...
 			if canraise:
@@ -116,56 +422,86 @@ class CacheMgr:
 		return self._loadobject(key, False, "CachedObjects")
 
 
-	def LoadBulk(self, bulkID):
-		"""Loads bulkdata for the specified bulkID"""
+	def LoadBulk(self, bulkID, lazy=False):
+		"""Loads bulkdata for the specified bulkID. If lazy is true, the rows
+		are decoded when they are accessed; a rowset keeps its class, a plain
+		list or tuple comes back as a read-only sequence (see marshal.lazyload)."""
 		for folder in self.bulkdata_paths:
 			if folder is not None:
 				cacheName = _join(folder, str(bulkID)+".cache2")
 				if _exists(cacheName):
 					# No version check required.
 					_t = time.clock()
-					obj = blue.marshal.Load(_readfile(cacheName))
+					obj = (_lazyfile if lazy else _loadfile)(cacheName)
 					self._time_load += (time.clock() - _t)
 					return obj
 
 
+	def IterBulk(self, bulkID):
+		"""Iterates over the rows of bulkdata for the specified bulkID while
+		they are decoded, without building the entire rowset in memory."""
+		cacheName = self.findbulk(bulkID)
+		if cacheName:
+			return _iterfile(cacheName)
+
+
+	def _lookup(self, key):
+		# returns list of (path, version) of the files holding key, in the
+		# order of the cache folders, or None if key isn't indexable.
+		if self._index is None:
+			self._index = _CacheIndex([_join(self.machocache, folder) for folder in _cacheFolders], self.cacheIndexPath)
+		return self._index.lookup(key)
+
+
+	def _candidates(self, key, useIndex=True):
+		# returns the cache file name for key, and the (path, version) of the
+		# files that hold it.
+		entries = self._lookup(key) if useIndex else None
+		if entries:
+			return os.path.basename(entries[0][0]), entries
+
+		fileName = self.GetCacheFileName(key)
+		if entries is None:
+			# key can't be indexed, or the index is out of date. check the
+			# files by that name.
+			entries = []
+			for folder in _cacheFolders:
+				cacheName = _join(self.machocache, folder, fileName)
+				if _exists(cacheName):
+					what, version = _peekfile(cacheName)
+					if what == key:
+						entries.append((cacheName, version))
+		return fileName, entries
+
+
 	def FindCacheFile(self, key):
 		"""Attempts to locate a cache file in any of the cache locations."""
-		fileName = self.GetCacheFileName(key)
-		_machocache = self.machocache
-		for cacheName in [
-			_join(_machocache, "CachedObjects", fileName),
-			_join(_machocache, "CachedMethodCalls", fileName),
-			_join(_machocache, "MethodCallCachingDetails", fileName),
-		]:
-			if _exists(cacheName):
-				return cacheName
-		return None
+		entries = self._candidates(key)[1]
+		return entries[0][0] if entries else None
 
 
-	def find(self, key):
-		"""Locates and loads a cache object. will check version and contents."""
-		fileName = self.GetCacheFileName(key)
-		obj = (key, None)
-		version = (0L, 0)
-		_machocache = self.machocache
-		for cacheName in [
-			_join(_machocache, "CachedObjects", fileName),
-			_join(_machocache, "CachedMethodCalls", fileName),
-			_join(_machocache, "MethodCallCachingDetails", fileName),
-		]:
-			if _exists(cacheName):
-				blurb = _readfile(cacheName)
-				_t = time.clock()
-				what, obj2 = blue.marshal.Load(blurb)
-				self._time_load += (time.clock() - _t)
+	def peek(self, key):
+		"""Returns (filename, version) of the newest cache file holding the
+		specified object, without loading it, or None if there is none."""
+		return _newest(self._candidates(key)[1])
 
-				if what == key:
-					if obj2.version > version:
-						obj = (what, obj2)
-						version = obj2.version
 
-		return fileName, obj
+	def find(self, key):
+		"""Locates and loads a cache object. will check version and contents."""
+		for useIndex in (True, False):
+			fileName, entries = self._candidates(key, useIndex)
+			newest = _newest(entries)
+			if not newest:
+				break
+			_t = time.clock()
+			what, obj = _loadfile(newest[0])
+			self._time_load += (time.clock() - _t)
+			if what == key:
+				return fileName, (what, obj)
+			# the file changed after it was checked. look again without
+			# the index.
+
+		return fileName, (key, None)
 
 
 	def findbulk(self, bulkID):
@@ -15,12 +15,21 @@ class CachedMethodCallResult:
 	__guid__ = "objectCaching.CachedMethodCallResult"
 	__passbyvalue__ = 1
 
+	def __getstate__(self):
+		return (self.details, self.result, self.version)
+
 	def __setstate__(self, state):
 		self.details, self.result, self.version = state
 
-	def GetResult(self):
-		if isinstance(self.result, util.CachedObject):
-			return self.result.GetCachedObject()
+	def GetResult(self, lazy=False):
+		"""Returns the result of the call. If lazy is true, a list or rowset
+		result has its items decoded when they are accessed; a rowset keeps
+		its class, a plain list or tuple comes back as a read-only sequence
+		(see marshal.lazyload)."""
+		if isinstance(self.result, CachedObject):
+			return self.result.GetCachedObject(lazy)
+		elif lazy:
+			return blue.marshal.lazyload(self.result)
 		else:
 			return blue.marshal.Load(self.result)
 
@@ -40,7 +49,13 @@ class CachedObject:
 	def __setstate__(self,state):
 		self.version, self.object, self.nodeID, self.shared, self.pickle, self.isCompressed, self.objectID = state
 
-	def GetCachedObject(self):
+	def GetCachedObject(self, lazy=False):
+		# a lazily decoded object is not kept, as it still needs the pickle.
+		if self.object is None and lazy and self.pickle is not None:
+			if self.isCompressed:
+				return blue.marshal.lazyload(zlib.decompress(self.pickle))
+			return blue.marshal.lazyload(self.pickle)
+
 		if self.object is None:
 			if self.pickle is None:
 				raise RuntimeError, "Wtf? no object?"
@@ -53,3 +68,24 @@ class CachedObject:
 
 	GetObject = GetCachedObject
 
+
+
+if __name__ == "__main__":
+	# round-trips both envelope classes through blue.marshal.
+	from reverence.carbon.common.script.net import objectCaching
+
+	for isCompressed in (0, 1):
+		obj = objectCaching.CachedObject()
+		obj.version, obj.object, obj.nodeID, obj.shared, obj.pickle, obj.isCompressed, obj.objectID = \
+			(130000000000000000L, 1), [(1, u"x"), None], 123, 1, None, isCompressed, "key"
+		res = objectCaching.CachedMethodCallResult()
+		res.details, res.result, res.version = {"versionCheck": "run"}, obj, [(130000000000000000L, 1), None]
+
+		loaded = blue.marshal.Load(blue.marshal.Save(res))
+		assert (loaded.details, loaded.version) == (res.details, res.version)
+		cached = loaded.result
+		assert (cached.version, cached.nodeID, cached.shared, cached.isCompressed, cached.objectID) == \
+			(obj.version, obj.nodeID, obj.shared, obj.isCompressed, obj.objectID)
+		assert loaded.GetResult() == [(1, u"x"), None]
+
+	print "ok"
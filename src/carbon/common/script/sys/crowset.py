@@ -1,3 +1,73 @@
+import collections
+import itertools
+import operator
+
+from reverence import _blue as blue
+
+
+# numpy dtypes for DBRowDescriptor column types. Columns of any other type
+# end up in object arrays.
+_dtypes = {
+	2: "i2",    # DBTYPE_I2
+	3: "i4",    # DBTYPE_I4
+	4: "f4",    # DBTYPE_R4
+	5: "f8",    # DBTYPE_R8
+	6: "f8",    # DBTYPE_CY
+	11: "?",    # DBTYPE_BOOL
+	16: "i1",   # DBTYPE_I1
+	17: "u1",   # DBTYPE_UI1
+	18: "u2",   # DBTYPE_UI2
+	19: "u4",   # DBTYPE_UI4
+	20: "i8",   # DBTYPE_I8
+	21: "u8",   # DBTYPE_UI8
+	64: "i8",   # DBTYPE_FILETIME
+}
+
+def RowsToColumns(rows, names, descriptor=None, columns=None):
+	"""Packs rows into an OrderedDict of numpy arrays, one per column.
+
+	names are the column names of rows. The DBRowDescriptor (taken from the
+	first row if not given) determines the dtypes; columns containing NULLs
+	or of a non-numeric type become object arrays. If columns is given, only
+	those are returned.
+	"""
+	import numpy
+
+	if descriptor is None and rows and type(rows[0]) is blue.DBRow:
+		descriptor = rows[0].__header__
+
+	if descriptor is not None:
+		types = descriptor.columns
+		numColumns = len(types)
+		types = dict(types)
+	else:
+		types = {}
+		numColumns = len(names)
+
+	count = len(rows)
+	result = collections.OrderedDict()
+	for i, name in enumerate(names):
+		if columns is not None and name not in columns:
+			continue
+
+		# properties added to the descriptor are not in the row data itself.
+		get = operator.itemgetter(i) if i < numColumns else operator.attrgetter(name)
+
+		dtype = _dtypes.get(types.get(name))
+		if dtype:
+			try:
+				result[name] = numpy.fromiter(itertools.imap(get, rows), dtype, count)
+				continue
+			except (TypeError, ValueError):
+				pass
+
+		result[name] = a = numpy.empty(count, object)
+		for j, row in enumerate(rows):
+			a[j] = get(row)
+
+	return result
+
+
 class CIndexedRowset(dict):
 	__guid__ = "dbutil.CIndexedRowset"
     
@@ -24,6 +94,10 @@ class CRowset(list):
 		list.__init__(self, rows)
 		self.header = header
 
+	def to_columns(self, columns=None):
+		"""Returns OrderedDict of numpy arrays holding the columns of the rowset."""
+		return RowsToColumns(self, self.header.Keys(), self.header, columns)
+
 	def Sort(self, columnName, caseInsensitive = False):
 		ix = self.header.Keys().index(columnName)
 		if caseInsensitive:
@@ -16,10 +16,15 @@ Parts of code inspired by or based on EVE Online, with permission from CCP.
 import sys
 import os
 import time
+import mmap
+import struct
 import sqlite3
 import glob
 import logging
 import json
+import threading
+import collections
+import cPickle
 
 from . import _blue as blue
 from . import const, util
@@ -45,29 +50,237 @@ _solarSystemObjectRowDescriptor = blue.DBRowDescriptor((
 ))
 
 
-class FSDLiteStorage(dict):
-	def __init__(self, path, rowclass=None):
+class FSDLiteIndex(object):
+	"""Secondary index of an FSDLite table, mapping index keys to rows."""
+
+	def __init__(self, storage, keys):
+		self._storage = storage
+		self._keys = keys  # str(key) -> primary key
+
+	def primaryKey(self, key):
+		try:
+			return self._keys[str(key)]
+		except KeyError:
+			raise KeyError(key)
+
+	def __getitem__(self, key):
+		return self._storage[self.primaryKey(key)]
+
+	def get(self, key, default=None):
+		primaryKey = self._keys.get(str(key))
+		if primaryKey is None:
+			return default
+		return self._storage[primaryKey]
+
+	def get_many(self, keys, default=None):
+		"""Returns list of rows for keys, with default for keys not found."""
+		storage = self._storage
+		lookup = self._keys.get
+		result = []
+		for key in keys:
+			primaryKey = lookup(str(key))
+			result.append(default if primaryKey is None else storage[primaryKey])
+		return result
+
+	def __contains__(self, key):
+		return str(key) in self._keys
+
+	def __len__(self):
+		return len(self._keys)
+
+
+class _FSDLiteBase(object):
+	# Functionality shared by the FSDLite storage classes.
+
+	_indexes = None
+
+	def _query(self, sql, *args):
+		with self._lock:
+			return self._db.execute(sql, args).fetchall()
+
+	def by(self, name):
+		"""Returns the named secondary index (FSDLiteIndex) of this table.
+		All indexes are read from the database on first use."""
+		indexes = self._indexes
+		if indexes is None:
+			keys = {}
+			for row in self._query("SELECT key, * FROM indexes"):
+				indexName, _, key = row[0].partition(".")
+				d = keys.get(indexName)
+				if d is None:
+					d = keys[indexName] = {}
+				if key not in d:
+					d[key] = int(row[2])
+			indexes = self._indexes = dict((indexName, FSDLiteIndex(self, d)) for indexName, d in keys.iteritems())
+		try:
+			return indexes[name]
+		except KeyError:
+			raise KeyError("No such index: %s" % name)
+
+	def index(self, name, key, row=True):
+		try:
+			primaryKey = self.by(name).primaryKey(key)
+		except KeyError:
+			return None
+		if row:
+			return self[primaryKey]
+		return primaryKey
+
+	def Get(self, key):
+		return self._rowclass(self[key])
+
+	def __iter__(self):
+		return (self._rowclass(x) for x in self.itervalues())
+
+
+class FSDLiteStorage(_FSDLiteBase, dict):
+	def __init__(self, path, rowclass=None, rows=None):
 		dict.__init__(self)
 		self._rowclass = rowclass
-		self._db = db = sqlite3.connect(path)
+		self._db = db = sqlite3.connect(path, check_same_thread=False)
 		db.row_factory = sqlite3.Row
+		self._lock = threading.Lock()
+
+		if rows is not None:
+			# decoded already (by a prime() worker process)
+			self.update(rows)
+			return
 
 		loads = json.loads
 		for primaryKey, data in db.execute("SELECT key,value FROM cache"):
 			self[int(primaryKey)] = loads(data)
 
-	def index(self, name, key, row=True):
-		for row in self._db.execute("SELECT * FROM indexes WHERE key = ?", ((name + "." + str(key)),) ):
-			if row:
-				return self[int(row[1])]
-			return int(row[1])
-		return None
 
-	def Get(self, key):
-		return self._rowclass(self[key])
+class LazyFSDLiteStorage(_FSDLiteBase):
+	"""Read-only FSDLiteStorage work-alike that decodes rows when they are
+	accessed, keeping the most recently used cacheSize rows around.
+	"""
+
+	_fetchsize = 1000
+
+	def __init__(self, path, rowclass=None, cacheSize=1000):
+		self._rowclass = rowclass
+		self._db = sqlite3.connect(path, check_same_thread=False)
+		self._lock = threading.Lock()
+		self._cache = collections.OrderedDict()
+		self._cacheSize = cacheSize
+
+	def _stream(self, sql):
+		# yields rows of query, fetching them in batches.
+		with self._lock:
+			cursor = self._db.execute(sql)
+		while True:
+			with self._lock:
+				rows = cursor.fetchmany(self._fetchsize)
+			if not rows:
+				break
+			for row in rows:
+				yield row
+
+	def __getitem__(self, key):
+		cache = self._cache
+		with self._lock:
+			try:
+				data = cache.pop(key)
+			except KeyError:
+				row = self._db.execute("SELECT value FROM cache WHERE key = ?", (str(key),)).fetchone()
+				if row is None:
+					raise KeyError(key)
+				data = json.loads(row[0])
+				if len(cache) >= self._cacheSize:
+					cache.popitem(False)
+			cache[key] = data
+			return data
+
+	def get(self, key, default=None):
+		try:
+			return self[key]
+		except KeyError:
+			return default
+
+	def __contains__(self, key):
+		return key in self._cache or bool(self._query("SELECT 1 FROM cache WHERE key = ?", str(key)))
+
+	has_key = __contains__
+
+	def __len__(self):
+		return self._query("SELECT COUNT(*) FROM cache")[0][0]
+
+	def iterkeys(self):
+		return (int(key) for (key,) in self._stream("SELECT key FROM cache"))
+
+	def iteritems(self):
+		loads = json.loads
+		return ((int(key), loads(data)) for (key, data) in self._stream("SELECT key,value FROM cache"))
+
+	def itervalues(self):
+		loads = json.loads
+		return (loads(data) for (data,) in self._stream("SELECT value FROM cache"))
+
+	def keys(self):
+		return list(self.iterkeys())
+
+	def items(self):
+		return list(self.iteritems())
+
+	def values(self):
+		return list(self.itervalues())
+
+
+# Config instance of a prime() worker process.
+_worker_cfg = None
+
+def _prime_worker_init(evekw, settings):
+	global _worker_cfg
+	from . import blue as bloo
+	_worker_cfg = bloo.EVE(**evekw).cfg
+	for name, value in settings.iteritems():
+		setattr(_worker_cfg, name, value)
+
+def _prime_worker(tableName):
+	# Loads a table in a prime() worker process and returns it marshalled.
+	return tableName, _worker_cfg._dumptable(tableName)
+
+
+# Config snapshot file format:
+#   header  - magic, version, offset of the index
+#   tables  - blue.marshal streams of tables as returned by Config._prefetch
+#   index   - blue.marshal stream of (key, {tableName: (offset, size)})
+_SNAPSHOT_MAGIC = "RVSNAP"
+_SNAPSHOT_VERSION = 1
+_snapshotHeader = struct.Struct("<6sHQ")
+
+class _Snapshot(object):
+	# Provides tables from a snapshot file to _memoize.
+
+	def __init__(self, path, key):
+		with open(path, "rb") as f:
+			m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		try:
+			if m.size() < _snapshotHeader.size:
+				raise ValueError("Not a snapshot file: %s" % path)
+			magic, version, indexOffset = _snapshotHeader.unpack_from(m)
+			if magic != _SNAPSHOT_MAGIC:
+				raise ValueError("Not a snapshot file: %s" % path)
+			self.valid = version == _SNAPSHOT_VERSION
+			if self.valid:
+				snapshotKey, self.index = blue.marshal.Load(buffer(m, indexOffset))
+				self.valid = snapshotKey == key
+		except:
+			m.close()
+			raise
+		self._map = m
+
+	def __contains__(self, tableName):
+		return tableName in self.index
+
+	def load(self, cfg, tableName):
+		offset, size = self.index[tableName]
+		return cfg._restore(tableName, blue.marshal.Load(buffer(self._map, offset, size)))
+
+	def close(self):
+		self._map.close()
 
-	def __iter__(self):
-		return (self._rowclass(x) for x in self.itervalues())
 
 # Warning: Code below may accidentally your whole brain.
 
@@ -76,21 +289,49 @@ class _memoize(object):
 	# decorates and replace the attribute value (which is the getter instance)
 	# with the value returned by that method. Used to implement the
 	# load-on-access mechanism 
+	#
+	# Loading is thread-safe; every attribute (or group of attributes that
+	# are loaded together, see __loadgroups__) has its own lock, so a
+	# value is only ever loaded once, without blocking access to others.
 
 	__slots__ = ["method"]
 
+	_guard = threading.Lock()
+
 	def __init__(self, func):
 		self.method = func
 
+	def _lock(self, obj, name):
+		group = getattr(obj, "__loadgroups__", {}).get(name, name)
+		with self._guard:
+			locks = obj.__dict__.get("_memoize_locks")
+			if locks is None:
+				locks = obj._memoize_locks = {}
+			lock = locks.get(group)
+			if lock is None:
+				lock = locks[group] = threading.RLock()
+			return lock
+
 	def __get__(self, obj, type=None):
 		if obj is None:
 			# class attribute (descriptor itself)
 			return self
 		else:
 			# instance attribute (replaced by value)
-			value = self.method(obj)
-			setattr(obj, self.method.func_name, value)
-			return value
+			name = self.method.func_name
+			with self._lock(obj, name):
+				# may have been loaded while waiting for the lock.
+				try:
+					return obj.__dict__[name]
+				except KeyError:
+					pass
+				snapshot = obj.__dict__.get("_snapshot")
+				if snapshot is not None and name in snapshot:
+					value = snapshot.load(obj, name)
+				else:
+					value = self.method(obj)
+				setattr(obj, name, value)
+				return value
 
 
 def _loader(attrName):
@@ -112,7 +353,9 @@ def _loader(attrName):
 			# FSDLite loader
 			ver, rem, (dbfilename, rowClass) = entry
 			#return FSDLiteStorage(os.path.join(self.eve.paths.root, "bin", "staticdata", dbfilename), rowClass)
-			return FSDLiteStorage(self.eve.ResFile().resolvepath("res:/staticdata/%s" % dbfilename), rowClass)
+			if self.fsdliteCacheSize:
+				return LazyFSDLiteStorage(self._fsdlitepath(dbfilename), rowClass, self.fsdliteCacheSize)
+			return FSDLiteStorage(self._fsdlitepath(dbfilename), rowClass)
 			
 	method.func_name = attrName
 	return method
@@ -140,9 +383,9 @@ class Config(object):
 
 	EVE's database is available as attributes of instances of this class.
     Tables are transparently loaded from bulkdata/cache upon accessing such an
-    attribute. Because this automatic loading scheme is NOT thread-safe, the
-    prime() method should be called prior to allowing other threads access to
-    the instance.
+    attribute. Loading is thread-safe; each table is loaded once, by the first
+    thread to access it. The prime() method can be used to load everything
+    in advance.
     """
 
 	__containercategories__ = (
@@ -308,6 +551,41 @@ class Config(object):
 	)
 
 
+	# If set, FSDLite tables are not decoded entirely when loaded, but a row
+	# at a time when accessed, keeping this many decoded rows in memory.
+	fsdliteCacheSize = None
+
+	# If set, the parsed FSD schemas are cached in this folder, keyed by the
+	# hash of the schema file in resfileindex.txt, so that the YAML need not
+	# be parsed again until the schema changes.
+	fsdSchemaCachePath = None
+
+	# If set, the localization pickles are converted to language packs in this
+	# folder, from which messages and labels are decoded as they are used.
+	localizationPackPath = None
+
+	# Settings above, which prime() passes on to its worker processes.
+	__settings__ = ("fsdliteCacheSize", "fsdSchemaCachePath", "localizationPackPath")
+
+
+	# Tables the custom loaders of which require other tables. prime() will
+	# not load these until the tables they depend on are available.
+	__dependencies__ = {
+		"eveowners"                   : ("factions", "npccorporations"),
+		"evelocations"                : ("mapRegionCache", "mapConstellationCache", "mapSystemCache"),
+	}
+
+
+	# Tables that are loaded together by a custom loader, mapped to the name
+	# of the table they share a load lock with.
+	__loadgroups__ = {
+		"invmetatypesByTypeID"        : "invmetatypes",
+		"invcontrabandTypesByType"    : "invcontrabandTypesByFaction",
+		"schematicsByType"            : "schematicstypemap",
+		"schematicsByPin"             : "schematicspinmap",
+	}
+
+
 	# Custom table loader methods follow
 	@_memoize
 	def blueprints(self):
@@ -353,7 +631,7 @@ class Config(object):
 			id_ = row.corporationID
 			d[id_] = DBRow(rd, [id_, row.corporationName, const.typeCorporation, 0, row.corporationNameID])
 
-		for row in self.cache.LoadBulk(const.cacheChrNpcCharacters):
+		for row in self.cache.IterBulk(const.cacheChrNpcCharacters):
 			id_ = row.characterID
 			npcName = self._localization.GetImportantByMessageID(id_) or row.characterName
 			d[id_] = DBRow(rd, [id_, row.characterName, bloodlinesToTypes[row.bloodlineID], row.gender, row.characterNameID])
@@ -389,11 +667,11 @@ class Config(object):
 				c = item.center
 				d[itemID] = DBRow(rd, [itemID, _trans(item.nameID), c.x, c.y, c.z, item.nameID])
 
-		# code below requires the partially completed table.
-		self.evelocations = rs
-
 #		# This stuff below takes 12 seconds on my i7.
 #		# TODO: find solution (dynamic lookup, I suppose ...)
+#		# The name formatters look up the partially completed table as
+#		# cfg.evelocations. It must not be published before rs.lines is set
+#		# though, as other threads read it without taking the load lock.
 #
 #		# get stars, planets, belts and moons.
 #		for row in self.localdb.execute("SELECT * FROM celestials"):
@@ -509,7 +787,7 @@ class Config(object):
 
 	@_memoize
 	def _localization(self):
-		return localization.Localization(self.eve, self._languageID, cfgInstance=self)
+		return localization.Localization(self.eve, self._languageID, cfgInstance=self, packPath=self.localizationPackPath)
 
 	@_memoize
 	def _averageMarketPrice(self):
@@ -598,18 +876,71 @@ class Config(object):
 			bloo.ResFile = _rf
 
 
-	def _loadfsddata(self, staticName, schemaName, cacheNum, optimize):
-		# Custom FileStaticData loader.
-		# Grabs schema and binary blob from .stuff file.
-		res = self.eve.ResFile()
+	def _fsdlitepath(self, dbfilename):
+		return self.eve.ResFile().resolvepath("res:/staticdata/%s" % dbfilename)
 
-		schema = None
+
+	def _loadfsdschema(self, staticName, schemaName, optimize):
+		# Loads the (unprepared) schema for FSD static data, if it has one.
 		if staticName:
 			resFileName = "res:/staticdata/%s.schema" % schemaName
+			cacheFileName = self._fsdschemacachefile(resFileName, schemaName, optimize)
+			if cacheFileName:
+				try:
+					with open(cacheFileName, "rb") as f:
+						return cPickle.load(f)
+				except Exception:
+					pass  # not there, or unusable. parse it again.
+
+			res = self.eve.ResFile()
 			if res.Open(resFileName):
 				schema = fsd.LoadSchema(res.Read())
 				if optimize:
 					schema = fsd.OptimizeSchema(schema)
+				if cacheFileName:
+					self._savefsdschema(cacheFileName, schema)
+				return schema
+		return None
+
+
+	def _fsdschemacachefile(self, resFileName, schemaName, optimize):
+		# Returns name of schema cache file for the current version of the
+		# schema file, or None if there is to be no caching.
+		if not self.fsdSchemaCachePath:
+			return None
+		try:
+			filehash = self.eve.rescache.filehash(resFileName)
+		except EnvironmentError:
+			return None  # no index
+		if not filehash:
+			return None
+		return os.path.join(self.fsdSchemaCachePath, "%s-%s%s.schema" % (schemaName, filehash, "-opt" if optimize else ""))
+
+
+	def _savefsdschema(self, cacheFileName, schema):
+		# Writes parsed schema to cache. Failing that is not a problem.
+		tempname = "%s.%d.tmp" % (cacheFileName, os.getpid())
+		try:
+			if not os.path.isdir(self.fsdSchemaCachePath):
+				os.makedirs(self.fsdSchemaCachePath)
+			with open(tempname, "wb") as f:
+				cPickle.dump(schema, f, cPickle.HIGHEST_PROTOCOL)
+			if os.name == "nt" and os.path.exists(cacheFileName):
+				os.remove(cacheFileName)
+			os.rename(tempname, cacheFileName)
+		except EnvironmentError:
+			if os.path.exists(tempname):
+				os.remove(tempname)
+
+
+	def _loadfsddata(self, staticName, schemaName, cacheNum, optimize, schema=None):
+		# Custom FileStaticData loader.
+		# Grabs schema and binary blob from .stuff file.
+		# (schema may be passed if it was loaded already)
+		if schema is None:
+			schema = self._loadfsdschema(staticName, schemaName, optimize)
+
+		res = self.eve.ResFile()
 
 		resFileName = "res:/staticdata/%s.static" % staticName
 		if not res.Open(resFileName):
@@ -632,7 +963,7 @@ class Config(object):
 		if schema.get('multiIndex'):
 			# Disk-based access for multi index tables because only the
 			# FSD_MultiIndex class can handle them properly.
-			return fsd.LoadIndexFromFile(res.fh, schema, cacheNum, offset=offset)
+			return fsd.LoadIndexFromFile(res.fh, schema, cacheNum, offset=offset, mapped=True)
 
 		# any other table will use memory-based access because they are pretty
 		# small anyway, and they are considerably faster when used like this.
@@ -647,7 +978,12 @@ class Config(object):
 			rs = table.GroupedBy(primaryKey)
 			return rs
 
-		obj = self.cache.LoadBulk(bulkID)
+		if issubclass(storageClass, IndexedRowLists):
+			# no need to hold the entire rowset in memory while indexing it.
+			obj = self.cache.IterBulk(bulkID)
+		else:
+			obj = self.cache.LoadBulk(bulkID)
+
 		if obj is None:
 			raise RuntimeError("Unable to load '%s' (bulkID:%d)" % (tableName, bulkID))
 		
@@ -682,14 +1018,192 @@ class Config(object):
 		return rs
 
 
-	def prime(self, tables=None, callback=None, debug=False, onlyFSD=False):
+	def _prefetch(self, tableName):
+		# Does the expensive part of loading a table, returning something that
+		# can be marshalled. Used by prime() worker processes.
+		entry = self._tables[tableName]
+		if len(entry) == 4:
+			# FSD tables are loaded from the resfiles directly, so only the
+			# schema is worth doing elsewhere.
+			(staticName, schemaName, optimize) = entry[2]
+			return self._loadfsdschema(staticName, schemaName, optimize)
+
+		table = getattr(self, tableName)
+		if len(entry) == 3:
+			return dict(table.iteritems())
+		return table
+
+
+	def _dumptable(self, tableName):
+		# Returns the result of _prefetch() for table in marshal format.
+		data = self._prefetch(tableName)
+		if not isinstance(data, (IndexRowset, FilterRowset)):
+			return blue.marshal.Save(data)
+
+		# the reference to this instance can't go along.
+		cfg = data.cfg
+		data.cfg = None
+		try:
+			return blue.marshal.Save(data)
+		finally:
+			data.cfg = cfg
+
+
+	def _restore(self, tableName, data):
+		# Counterpart of _prefetch(); returns table set up from its result.
+		entry = self._tables[tableName]
+		if len(entry) == 4:
+			ver, rem, (staticName, schemaName, optimize), cacheNum = entry
+			return self._loadfsddata(staticName, schemaName, cacheNum, optimize=optimize, schema=data)
+		if len(entry) == 3:
+			ver, rem, (dbfilename, rowClass) = entry
+			return FSDLiteStorage(self._fsdlitepath(dbfilename), rowClass, rows=data)
+		if isinstance(data, (IndexRowset, FilterRowset)):
+			data.cfg = self
+		return data
+
+
+	def _prime_parallel(self, tables, callback, debug, processes):
+		# returns the tables left for the caller to load.
+		import multiprocessing
+
+		# split tables into those that can be loaded by worker processes and
+		# those that must be loaded here (custom loaders and derived tables).
+		tasks = []
+		local = []
+		snapshot = self.__dict__.get("_snapshot") or ()
+		for tableName in tables:
+			entry = self._tables[tableName]
+			if tableName in snapshot:
+				local.append(tableName)
+			elif (len(entry) == 3 and not self.fsdliteCacheSize) \
+			or (len(entry) == 4 and "_loadfsddata" not in self.__dict__) \
+			or (len(entry) == 6 and type(entry[2]) is not str):
+				tasks.append(tableName)
+			else:
+				local.append(tableName)
+
+		if not tasks:
+			# no point in starting workers.
+			return local
+
+		current = 0
+		total = len(tasks) + len(local)
+		pending = set(tasks)
+
+		settings = dict((name, getattr(self, name)) for name in self.__settings__)
+
+		pool = multiprocessing.Pool(processes, _prime_worker_init, (self.eve._initargs, settings))
+		try:
+			results = pool.imap_unordered(_prime_worker, tasks)
+			while pending or local:
+				# like prime(), the callback is called before a table is
+				# loaded (or for tables from workers, restored) here.
+				for tableName in local:
+					if not pending.intersection(self.__dependencies__.get(tableName, ())):
+						local.remove(tableName)
+						if callback:
+							callback(current, total, tableName)
+							current += 1
+						if debug:
+							print >>sys.stderr, "  priming:", tableName
+						getattr(self, tableName)
+						break
+				else:
+					tableName, data = results.next()
+					pending.discard(tableName)
+					if callback:
+						callback(current, total, tableName)
+						current += 1
+					if debug:
+						print >>sys.stderr, "  priming:", tableName, "(%d bytes)" % len(data)
+					setattr(self, tableName, self._restore(tableName, blue.marshal.Load(data)))
+		except:
+			pool.terminate()
+			raise
+		else:
+			pool.close()
+		finally:
+			pool.join()
+
+		return ()
+
+
+	def _snapshotkey(self):
+		# identifies the data a snapshot is made from.
+		files = []
+		for folder in self.cache.bulkdata_paths:
+			for fileName in sorted(glob.glob(os.path.join(folder, "*.cache2"))):
+				files.append((fileName, int(os.path.getmtime(fileName))))
+		resfileindex = os.path.join(self.eve.paths.root, "resfileindex.txt")
+		if os.path.exists(resfileindex):
+			files.append((resfileindex, int(os.path.getmtime(resfileindex))))
+		return (self.protocol, tuple(files))
+
+
+	def save_snapshot(self, path):
+		"""Writes all tables loaded so far to a snapshot file that can be
+		loaded with load_snapshot() by other instances of the same EVE version.
+		"""
+		tables = [tableName for tableName in sorted(self.tables) if tableName in self.__dict__]
+		if "_loadfsddata" in self.__dict__:
+			# tables loaded by ccplib can't be restored.
+			tables = [tableName for tableName in tables if len(self._tables[tableName]) != 4]
+
+		index = {}
+		tempname = "%s.%d.tmp" % (path, os.getpid())
+		try:
+			with open(tempname, "wb") as f:
+				f.write(_snapshotHeader.pack(_SNAPSHOT_MAGIC, _SNAPSHOT_VERSION, 0))
+				for tableName in tables:
+					data = self._dumptable(tableName)
+					index[tableName] = (f.tell(), len(data))
+					f.write(data)
+				indexOffset = f.tell()
+				f.write(blue.marshal.Save((self._snapshotkey(), index)))
+				f.seek(0)
+				f.write(_snapshotHeader.pack(_SNAPSHOT_MAGIC, _SNAPSHOT_VERSION, indexOffset))
+
+			if os.name == "nt" and os.path.exists(path):
+				os.remove(path)
+			os.rename(tempname, path)
+		except:
+			if os.path.exists(tempname):
+				os.remove(tempname)
+			raise
+
+
+	def load_snapshot(self, path):
+		"""Makes tables available from snapshot file created by save_snapshot().
+		The tables are decoded from the memory-mapped file when first accessed.
+		Returns False if the snapshot is out of date, or not compatible.
+		"""
+		snapshot = _Snapshot(path, self._snapshotkey())
+		if not snapshot.valid:
+			snapshot.close()
+			return False
+
+		# (a previous snapshot is left for the garbage collector to close,
+		# in case another thread is still loading from it)
+		self._snapshot = snapshot
+		return True
+
+
+	def prime(self, tables=None, callback=None, debug=False, onlyFSD=False, processes=1, materializeFSD=False):
 		"""Loads the tables named in the tables sequence. If no tables are
 specified, it will load all supported ones. A callback function can be provided
 which will be called as func(current, total, tableName).
 
-		This method should be used in the following situations:
-		- The ConfigMgr instance is going to be used in a multi-threaded app.
-		- The Application wants to load all data at once instead of on access.
+		If processes is not 1, the bulkdata, FSD and FSDLite tables are loaded
+		by that many worker processes (None means one per CPU) and sent back in
+		marshal format. Custom loaders still run in the calling process.
+
+		If materializeFSD is true, the FSD tables are decoded entirely into
+		plain dicts, tuples and named tuples (see fsd.materialize), which
+		makes accessing them considerably faster at the cost of memory.
+
+		This method should be used when the application wants to load all
+		data at once instead of on access.
 		"""
 
 		if debug:
@@ -711,6 +1225,14 @@ which will be called as func(current, total, tableName).
 				if invalid:
 					raise ValueError("Unknown table(s): %s" % ", ".join(invalid))
 
+			fsdTables = [tableName for tableName in tables if len(self._tables[tableName]) == 4]
+
+			if processes != 1:
+				# tables loaded already need no further attention.
+				tables = [tableName for tableName in tables if tableName not in self.__dict__ \
+					and (not onlyFSD or len(self._tables[tableName]) == 4)]
+				tables = self._prime_parallel(tables, callback, debug, processes)
+
 			current = 0
 			total = len(tables)
 		
@@ -727,6 +1249,12 @@ which will be called as func(current, total, tableName).
 				# now simply trigger the property's getters
 				getattr(self, tableName)
 
+			if materializeFSD:
+				for tableName in fsdTables:
+					if debug:
+						print >>sys.stderr, "  materializing:", tableName
+					self.__dict__[tableName] = fsd.materialize(getattr(self, tableName))
+
 		finally:
 			if debug:
 				self._debug = False
@@ -10,9 +10,12 @@ Part of this code is inspired by or based on EVE Online.
 Used with permission from CCP.
 """
 
+import itertools
+
 from reverence import _blue as blue
 
 from reverence.carbon.common.script.sys.row import Row
+from reverence.carbon.common.script.sys.crowset import RowsToColumns
 
 def RowsInit(rows, columns):
 	header = None
@@ -145,6 +148,10 @@ class Rowset:
 		rs.SortBy(column, reverse)
 		return rs
 
+	def to_columns(self, columns=None):
+		"""Returns OrderedDict of numpy arrays holding the columns of the rowset."""
+		return RowsToColumns(self.lines, self.header, columns=columns)
+
 	def Select(self, *columns, **options):
 		if len(columns) == 1:
 			i = self.header.index(columns[0])
@@ -232,9 +239,12 @@ class IndexedRowLists(dict):
 	__slots__ = ("header",)
 
 	def __init__(self, rows=[], keys=None):
-		if rows:
-			self.header = rows[0].__header__.Keys()
-		self.InsertMany(keys, rows)
+		# rows can be any iterable, e.g. a bulkdata stream from CacheMgr.IterBulk
+		rows = iter(rows)
+		for first in rows:
+			self.header = first.__header__.Keys()
+			self.InsertMany(keys, itertools.chain((first,), rows))
+			break
 
 	def Insert(self, keys, row):
 		self.InsertMany(keys, [row])
@@ -346,6 +356,15 @@ class FilterRowset:
 		ret = Rowset(self.header, self.items.values(), self.RowClass)
 		return ret.Sort(colname)
 
+	def to_columns(self, columns=None):
+		"""Returns OrderedDict of numpy arrays holding the columns of all rows
+		in the rowset."""
+		if self.idName2:
+			lines = [line for group in self.items.itervalues() for line in group.itervalues()]
+		else:
+			lines = [line for group in self.items.itervalues() for line in group]
+		return RowsToColumns(lines, self.header, columns=columns)
+
 	def __iter__(self):
 		return (self[key] for key in self.iterkeys())
 
@@ -14,14 +14,20 @@ Used with permission from CCP.
 # So apparently CCP added yet another static data format, using YAML for the
 # schema and binary blobs for data.
 #
-# Also, this stuff should totally be implemented in C.
+# The list and dict containers and the object offset tables are implemented
+# in C (see _pyFSD). The Python versions here are used if nativeDecoders is
+# turned off.
 #
 
 import struct
 import collections
-import os
+import mmap
+import threading
 import cPickle
 import itertools
+import keyword
+import operator
+import re
 
 try:
 	import yaml
@@ -33,10 +39,19 @@ import pyFSD
 from reverence import _pyFSD
 _uint32 = _pyFSD._uint32_from  # used for decoding in the various containers
 _make_offsets_table = _pyFSD._make_offsets_table
+_object_offsets = _pyFSD._object_offsets
 _unpack_from = struct.unpack_from
 
 FLOAT_PRECISION_DEFAULT = 'single'
 
+# Build lookup acceleration structures for dict/index footers (direct tables
+# or Eytzinger layouts for integer keys, hash tables for other keys).
+accelerateFooters = True
+
+# Use the C implementations of the list and dict containers, and of the offset
+# table setup of objects. Takes effect for schemas prepared afterwards.
+nativeDecoders = True
+
 
 #-----------------------------------------------------------------------------
 # Schema Loaders
@@ -329,6 +344,8 @@ class _VariableSizedList(object):
 		return "<VariableSizedList(values:%s,size:%d)>" % (self.itemSchema['type'], self.count)
 
 def FSD_List(data, offset, schema):
+	if nativeDecoders:
+		return _pyFSD.FsdList(data, offset, schema)
 	return (_FixedSizeList if 'fixedItemSize' in schema else _VariableSizedList)(data, offset, schema['itemTypes'], schema.get('length'))
 
 
@@ -365,6 +382,17 @@ def Load_Enum(data, offset, schema):
 class _DictFooter(object):
 	def __init__(self, data, offset, schema):
 		self.footer = FSD_List(data, offset, schema)
+		self._lookup = None
+		if accelerateFooters:
+			self.Get = self._HashGet
+
+	def _HashGet(self, key):
+		# decodes the whole footer into a dict on first use, rather than an
+		# FSD_Object for every probe of a binary search.
+		lookup = self._lookup
+		if lookup is None:
+			lookup = self._lookup = dict(self.iteritems())
+		return lookup.get(key)
 
 	def Get(self, key):
 		minIndex = 0
@@ -404,7 +432,10 @@ class FSD_Dict(object):
 		if schema['keyTypes']['type'] in 'int':
 			hassize = ('size' in schema['keyFooter']['itemTypes']['attributes']) if ('keyFooter' in schema) else True
 			self.footer = pyFSD.FsdUnsignedIntegerKeyMap()
-			self.footer.Initialize(data, footerOffset, hassize, True)
+			if type(data) is not str:
+				# keymap needs a string. (data is memory mapped)
+				data, footerOffset = data[footerOffset:endOfFooter+4], 0
+			self.footer.Initialize(data, footerOffset, hassize, True, 0, accelerateFooters)
 		else:
 			self.footer = _DictFooter(data, footerOffset, schema['keyFooter'])
 		self.valueSchema = schema['valueTypes']
@@ -442,6 +473,14 @@ class FSD_Dict(object):
 			return default
 		return self.loader(self.data, self.offset + v[0], self.valueSchema)
 
+	def get_many(self, keys, default=None):
+		"""Returns list of values for keys, with default for keys not found."""
+		if not hasattr(self.footer, "GetMany"):
+			return [self.get(key, default) for key in keys]
+		offsets, sizes = self.footer.GetMany(keys)
+		d = self.data; a = self.offset; s = self.valueSchema; loader = self.loader
+		return [default if offset == -1 else loader(d, a+offset, s) for offset in offsets]
+
 	def keys(self):
 		return list(self.footer.iterkeys())
 
@@ -465,9 +504,42 @@ class FSD_Dict(object):
 	GetIfExists = get
 
 
+# The disk-based containers share the file they read from, so they only ever
+# access it through one of these, which do not depend on a file position.
+
+class _SharedFile(object):
+	# Serializes positioned reads on a file.
+
+	def __init__(self, f):
+		self.file = f
+		self._lock = threading.Lock()
+
+	def pread(self, offset, size):
+		with self._lock:
+			self.file.seek(offset)
+			return self.file.read(size)
+
+
+class _MappedFile(object):
+	# Positioned reads on a memory map of a file.
+
+	def __init__(self, m):
+		self.map = m
+
+	def pread(self, offset, size):
+		return self.map[offset:offset+size]
+
+
 class FSD_Index(object):
+	# Disk-based dict. Items are read from the file when accessed, or decoded
+	# from the file's memory map if it is given as a _MappedFile (see
+	# LoadIndexFromFile). Instances are safe to share between threads.
+	# A falsy cacheSize disables caching of items in mapped mode.
 
 	def __init__(self, f, cacheSize, schema, offset=0, offsetToFooter=0):
+		if not hasattr(f, "pread"):
+			f = _SharedFile(f)
+		mapped = isinstance(f, _MappedFile)
 		self.file = f
 		self.cacheSize = cacheSize
 		self.offset = offset = offset+4 if offset else 0
@@ -475,25 +547,25 @@ class FSD_Index(object):
 		self.header = schema['header']
 
 		# read the footer blob and put it in an appropriate container
-		f.seek(offset)
-		self.fileSize = _uint32(f.read(4))
-
-		f.seek(offset + self.fileSize)
-		footerSize = self.footerSize = _uint32(f.read(4))
+		self.fileSize = _uint32(f.pread(offset, 4))
+		footerSize = self.footerSize = _uint32(f.pread(offset + self.fileSize, 4))
+		footer = f.pread(offset + self.fileSize - footerSize, footerSize)
 
-		f.seek(-(4+footerSize), os.SEEK_CUR)
 		if schema['keyTypes']['type'] == 'int':
 			self.footer = pyFSD.FsdUnsignedIntegerKeyMap()
-			self.footer.Initialize(f.read(footerSize))
+			self.footer.Initialize(footer, 0, True, False, 0, accelerateFooters)
 		else:
-			self.footer = _DictFooter(f.read(footerSize), 0, schema['keyFooter'])
+			self.footer = _DictFooter(footer, 0, schema['keyFooter'])
 
-		self.cache = collections.OrderedDict()
+		self.cache = None if (mapped and not cacheSize) else collections.OrderedDict()
+		self._cachelock = threading.Lock()
 
 		s = self.valueSchema = schema['valueTypes']
 		self._load = s['loader']
 		if (s.get('buildIndex', False)) and (s['type'] == 'dict'):
 			self._getitem = self.__GetIndex__ 
+		elif mapped:
+			self._getitem = self.__GetMappedItem__
 		else:
 			self._getitem = self.__GetItem__
 
@@ -518,26 +590,40 @@ class FSD_Index(object):
 		return v
 
 	def __getitem__(self, key):
-		v = self.cache.pop(key, self)  # abusing self
-		if v is self:
-			# item wasnt cached. grab it and do so.
+		if self.cache is None:
 			try:
 				itemOffset, itemSize = self._Search(key)
 			except TypeError:
-				# can be thrown by _Search returning None or being passed wrong type
 				raise KeyError('Key (%s) not found' % str(key))
+			return self._getitem(itemOffset, itemSize)
 
-			v = self._getitem(itemOffset, itemSize)
+		cache = self.cache
+		with self._cachelock:
+			v = cache.pop(key, self)  # abusing self
+			if v is not self:
+				cache[key] = v
+				return v
 
-			if len(self.cache) > self.cacheSize:
-				self.cache.popitem(last=False)
+		# item wasnt cached. grab it and do so.
+		try:
+			itemOffset, itemSize = self._Search(key)
+		except TypeError:
+			# can be thrown by _Search returning None or being passed wrong type
+			raise KeyError('Key (%s) not found' % str(key))
 
-		self.cache[key] = v
+		v = self._getitem(itemOffset, itemSize)
+
+		with self._cachelock:
+			if len(cache) > (self.cacheSize or 0):
+				cache.popitem(last=False)
+			cache[key] = v
 		return v
 
 	def __GetItem__(self, offset, size):
-		self.file.seek(self.offset+offset)
-		return self._load(self.file.read(size), 0, self.valueSchema)
+		return self._load(self.file.pread(self.offset+offset, size), 0, self.valueSchema)
+
+	def __GetMappedItem__(self, offset, size):
+		return self._load(self.file.map, self.offset+offset, self.valueSchema)
 
 	def __GetIndex__(self, offset, size):
 		return FSD_Index(self.file, self.cacheSize, self.valueSchema, offset=self.offset+offset)
@@ -557,6 +643,19 @@ class FSD_Index(object):
 		except (KeyError, IndexError):
 			return default
 
+	def get_many(self, keys, default=None):
+		"""Returns list of values for keys, with default for keys not found.
+		Items are read in file order, and bypass the item cache."""
+		if not hasattr(self.footer, "GetMany"):
+			return [self.get(key, default) for key in keys]
+		offsets, sizes = self.footer.GetMany(keys)
+		_get = self._getitem
+		result = [default] * len(offsets)
+		for i in sorted(xrange(len(offsets)), key=offsets.__getitem__):
+			if offsets[i] != -1:
+				result[i] = _get(offsets[i], sizes[i])
+		return result
+
 	def __repr__(self):
 		return "<FSD_Index(type:%s,size:%s)" % (self.valueSchema['type'], len(self.footer))
 
@@ -575,29 +674,31 @@ class _subindex(object):
 		self.valueSchema = valueSchema
 		self.fsdindex = self.valueSchema.get("buildIndex", False)
 		self.loader = self.valueSchema["loader"]
+		self._map = f.map if isinstance(f, _MappedFile) else None
 
 		# aliases for speed
 		self._getkey = self.offsetTable.Get
-		self._seek = self.file.seek
-		self._read = self.file.read
+		self._pread = self.file.pread
+
+	def _item(self, offsetAndSize):
+		if self.fsdindex:
+			# (mapped indices go without cache, see FSD_Index)
+			return FSD_Index(self.file, 100 if self._map is None else None, self.valueSchema, offset=offsetAndSize[0], offsetToFooter=offsetAndSize[0]+offsetAndSize[1])
+		if self._map is not None:
+			return self.loader(self._map, offsetAndSize[0], self.valueSchema)
+		return self.loader(self._pread(offsetAndSize[0], offsetAndSize[1]), 0, self.valueSchema)
 
 	def __getitem__(self, key):
 		offsetAndSize = self._getkey(key)
 		if offsetAndSize is None:
 			raise KeyError('Key (%s) not found in subindex' % str(key))
-		if self.fsdindex:
-			return FSD_Index(self.file, 100, self.valueSchema, offset=offsetAndSize[0], offsetToFooter=offsetAndSize[0]+offsetAndSize[1])
-		self._seek(offsetAndSize[0])
-		return self.loader(self._read(offsetAndSize[1]), 0, self.valueSchema)
+		return self._item(offsetAndSize)
 
 	def get(self, key, default=None):
 		offsetAndSize = self._getkey(key)
 		if offsetAndSize is None:
 			return default
-		if self.fsdindex:
-			return FSD_Index(self.file, 100, self.valueSchema, offset=offsetAndSize[0], offsetToFooter=offsetAndSize[0]+offsetAndSize[1])
-		self._seek(offsetAndSize[0])
-		return self.loader(self._read(offsetAndSize[1]), 0, self.valueSchema)
+		return self._item(offsetAndSize)
 
 	def iterkeys(self)    : return self.offsetTable.iterkeys()
 	def itervalues(self)  : return (self[key] for key in self.offsetTable.iterkeys())
@@ -654,19 +755,17 @@ class FSD_MultiIndex(FSD_Index):
 
 	def __init__(self, f, cacheSize, schema, offset=0, offsetToFooter=0):
 		FSD_Index.__init__(self, f, cacheSize, schema, offset, offsetToFooter)
+		f = self.file
 
-		f.seek(offset + self.fileSize - self.footerSize)
-		attributeLookupTableSize = _uint32(f.read(4))
-
-		f.seek(-(4+attributeLookupTableSize), os.SEEK_CUR)
-		attributeLookupTable = f.read(attributeLookupTableSize)
+		attributeLookupTableOffset = offset + self.fileSize - self.footerSize
+		attributeLookupTableSize = _uint32(f.pread(attributeLookupTableOffset, 4))
+		attributeLookupTable = f.pread(attributeLookupTableOffset - attributeLookupTableSize, attributeLookupTableSize)
 
 		# create the subindices
 		subindices = {}
 		for index, offsetAndSize in load(attributeLookupTable, 0, schema['subIndexOffsetLookup']).iteritems():
-			f.seek(offset + 4 + offsetAndSize.offset)
 			offsetTable = pyFSD.FsdUnsignedIntegerKeyMap()
-			offsetTable.Initialize(f.read(offsetAndSize.size), 0, True, False, offset+8)
+			offsetTable.Initialize(f.pread(offset + 4 + offsetAndSize.offset, offsetAndSize.size), 0, True, False, offset+8, accelerateFooters)
 			subindices[index] = _subindex(f, offsetTable, schema['indexableSchemas'][index]['valueTypes'])
 
 		# assign either indexgroup or subindex to relevant attributes.
@@ -682,82 +781,80 @@ class FSD_MultiIndex(FSD_Index):
 
 
 class FSD_Object(object):
-
-	def __init__(self, data, offset, schema):
-		self.__data__ = data
-		self.__offset__ = offset
-		self.attributes = schema['attributes']
-		self._get_schema = schema['attributes'].get
-
+	# Base class of the object classes PrepareSchema generates for each object
+	# schema (see _ObjectClass). The fixed size attributes with scalar values
+	# are decoded into slots when the object is created, the others are read
+	# from the data when accessed.
+
+	__slots__ = ("__data__", "__offset__", "_offsets")
+
+	# set on the generated classes
+	__schema__ = None
+	attributes = {}
+	_getters = {}
+	_getter_list = []
+	_tuple = None  # see materialize()
+
+	def _make_offsets(self):
+		schema = self.__schema__
 		if 'size' in schema:
 			# fixed size object. skip all the scary stuff.
-			self._get_offset = schema['constantAttributeOffsets'].get
-		else:
-			# variable sized object. figure out what optional attributes we have.
-			if schema['optionalValueLookups']:
-				attr_bits = _uint32(data, offset + schema['endOfFixedSizeData'])
-				if attr_bits:
-					# some attribute bits are set. figure out what attributes are actually there ...
-					_oa = schema.get(attr_bits)
-					if not _oa:
-						lookup = schema['optionalValueLookups'].get
-						# filter out optional attributes that are not given
-						_oa = schema[attr_bits] = \
-							[attr for attr in schema['attributesWithVariableOffsets'] if lookup(attr, -1) & attr_bits]
-				else:
-					# no attribute bits set, so this set is going to be empty anyway.
-					_oa = ()
-
+			return schema['constantAttributeOffsets']
+
+		# variable sized object. figure out what optional attributes we have.
+		data = self.__data__
+		offset = self.__offset__
+		if schema['optionalValueLookups']:
+			attr_bits = _uint32(data, offset + schema['endOfFixedSizeData'])
+			if attr_bits:
+				# some attribute bits are set. figure out what attributes are actually there ...
+				_oa = schema.get(attr_bits)
+				if not _oa:
+					lookup = schema['optionalValueLookups'].get
+					# filter out optional attributes that are not given
+					_oa = schema[attr_bits] = \
+						[attr for attr in schema['attributesWithVariableOffsets'] if lookup(attr, -1) & attr_bits]
 			else:
-				# looks like there's just the required attributes.
-				_oa = schema['attributesWithVariableOffsets']
+				# no attribute bits set, so this set is going to be empty anyway.
+				_oa = ()
 
-			if _oa:
-				_offsets = _make_offsets_table(_oa, data, offset, schema['endOfFixedSizeData'] + 4)
-				_offsets.update(schema['constantAttributeOffsets'])
-				self._get_offset = _offsets.get
-			else:
-				self._get_offset = schema['constantAttributeOffsets'].get
+		else:
+			# looks like there's just the required attributes.
+			_oa = schema['attributesWithVariableOffsets']
 
+		if _oa:
+			_offsets = _make_offsets_table(_oa, data, offset, schema['endOfFixedSizeData'] + 4)
+			_offsets.update(schema['constantAttributeOffsets'])
+			return _offsets
+		return schema['constantAttributeOffsets']
 
 	def __getitem__(self, key):
-		schema = self._get_schema(key)
-		if schema is None:
+		get = self._getters.get(key)
+		if get is None:
 			raise KeyError("Attribute '%s' is not in the schema for this object." % key)
-
-		off = self._get_offset(key)
-		if off is None:
-			if 'default' in schema:
-				return schema['default']
-			raise schema['KeyError']
-		return schema['loader'](self.__data__, self.__offset__ + off, schema)
+		try:
+			return get(self)
+		except AttributeError:
+			raise self.attributes[key]['KeyError']
 
 	def __getattr__(self, key):
-		schema = self._get_schema(key)
-		if schema is None:
+		# only attributes that could not be made properties end up here.
+		get = self._getters.get(key)
+		if get is None:
 			raise AttributeError("Attribute '%s' is not in the schema for this object." % key)
-
-		off = self._get_offset(key)
-		if off is None:
-			if 'default' in schema:
-				return schema['default']
-			raise schema['AttributeError']
-		return schema['loader'](self.__data__, self.__offset__ + off, schema)
-
+		return get(self)
 
 	def __str__(self):
 		# detailed representation
 		header = self.attributes
-		_getoffset = self._get_offset
+		getters = self._getters
 		stuff = []
 		_a = stuff.append
-		for attr, schema in header.iteritems():
-			offset = _getoffset(attr)
-			if offset is None:
-				v = schema.get("default", self)
-				v = "NULL" if v is self else repr(v)
-			else:
-				v = repr(schema['loader'](self.__data__, self.__offset__ + offset, schema))
+		for attr in header:
+			try:
+				v = repr(getters[attr](self))
+			except AttributeError:
+				v = "NULL"
 			_a(v)
 
 		return "FSD_Object(" + ','.join(map(u"%s:%s".__mod__, zip(header, stuff))) + ")"
@@ -767,6 +864,104 @@ class FSD_Object(object):
 		return "<FSD_Object(" + ','.join(map(u"%s:%s".__mod__, ((k, v['type']) for k,v in self.attributes.iteritems()) )) + ")>"
 
 
+# struct codes of the loaders that can be replaced by unpacking the value.
+_structCodes = {
+	_pyFSD._int32_from: "i",
+	_pyFSD._uint32_from: "I",
+	_pyFSD._float_from: "f",
+	_pyFSD._double_from: "d",
+}
+
+_identifier = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_reservedNames = frozenset(dir(FSD_Object))
+
+_objectInitTemplate = """def __init__(self, data, offset, schema):
+	self.__data__ = data
+	self.__offset__ = offset
+	self._offsets = None
+	%s
+"""
+
+def _fixedgetter(loader, offset, schema):
+	def get(self):
+		return loader(self.__data__, self.__offset__ + offset, schema)
+	return get
+
+def _nativeoffsets(self):
+	return _object_offsets(self.__data__, self.__offset__, self.__schema__)
+
+def _variablegetter(name, loader, schema):
+	def get(self):
+		offsets = self._offsets
+		if offsets is None:
+			offsets = self._offsets = self._make_offsets()
+		offset = offsets.get(name)
+		if offset is None:
+			if 'default' in schema:
+				return schema['default']
+			raise schema['AttributeError']
+		return loader(self.__data__, self.__offset__ + offset, schema)
+	return get
+
+def _ObjectClass(schema):
+	# Returns FSD_Object subclass specialized for (prepared) object schema.
+	attributes = schema['attributes']
+	constantOffsets = schema.get('constantAttributeOffsets', {})
+
+	namespace = {
+		'__schema__': schema,
+		'attributes': attributes,
+	}
+
+	def usable(name):
+		return type(name) is str and _identifier.match(name) and not keyword.iskeyword(name) \
+			and not name.startswith("__") and name not in _reservedNames
+
+	# fixed size scalars are unpacked in one go, into slots.
+	fmt = ["<"]
+	slots = []
+	pos = 0
+	for name, offset in sorted(constantOffsets.iteritems(), key=lambda kv: kv[1]):
+		code = _structCodes.get(attributes[name]['loader'])
+		if code is None or offset < pos or not usable(name):
+			continue
+		if offset > pos:
+			fmt.append("%dx" % (offset - pos))
+		fmt.append(code)
+		pos = offset + struct.calcsize("<" + code)
+		slots.append(name)
+
+	getters = {}
+	for name, attrschema in attributes.iteritems():
+		if name in slots:
+			getters[name] = operator.attrgetter(name)
+			continue
+		loader = attrschema['loader']
+		if name in constantOffsets:
+			get = _fixedgetter(loader, constantOffsets[name], attrschema)
+		else:
+			get = _variablegetter(name, loader, attrschema)
+		getters[name] = get
+		if usable(name):
+			namespace[name] = property(get)
+
+	namespace['_getters'] = getters
+	namespace['_getter_list'] = [getters[name] for name in attributes]
+	namespace['__slots__'] = tuple(slots)
+	if nativeDecoders:
+		namespace['_make_offsets'] = _nativeoffsets
+
+	if slots:
+		code = "%s, = _unpack(data, offset)" % ", ".join("self." + name for name in slots)
+		scope = {'_unpack': struct.Struct("".join(fmt)).unpack_from}
+	else:
+		code = "pass"
+		scope = {}
+	exec _objectInitTemplate % code in scope
+	namespace['__init__'] = scope['__init__']
+
+	return type("FSD_Object", (FSD_Object,), namespace)
+
 
 _loaders = {
 	# scalars
@@ -798,10 +993,146 @@ _loaders = {
 }
 
 
+def _NativeDict(data, offset, schema):
+	return _pyFSD.FsdDict(data, offset, schema, accelerateFooters)
+
 def load(data, offset, schema):
 	return schema['loader'](data, offset, schema)
 
 
+#-----------------------------------------------------------------------------
+# Materialization
+#-----------------------------------------------------------------------------
+
+class FSD_MaterializedDict(dict):
+	# Plain dict of decoded items, with the accessors of the FSD containers.
+	# Materialized multi-index tables also get their indices as attributes.
+
+	Get = dict.__getitem__
+	GetIfExists = dict.get
+
+	def get_many(self, keys, default=None):
+		"""Returns list of values for keys, with default for keys not found."""
+		get = self.get
+		return [get(key, default) for key in keys]
+
+
+class _Missing(object):
+	# value of optional attributes that are not there in materialized objects.
+	__slots__ = ()
+	def __repr__(self):
+		return "NULL"
+
+_missing = _Missing()
+
+def _optionalgetter(index, name):
+	def get(self):
+		v = tuple.__getitem__(self, index)
+		if v is _missing:
+			raise AttributeError("Object instance does not have attribute '%s'" % name)
+		return v
+	return get
+
+def _TupleClass(names, optional=()):
+	# Returns namedtuple class with fields names, that can also be indexed by
+	# name. Attributes in optional raise AttributeError/KeyError if missing.
+	base = collections.namedtuple("FSD_Tuple", names, rename=True)
+	index = dict((name, i) for i, name in enumerate(names))
+
+	def __getitem__(self, key):
+		if type(key) is str:
+			try:
+				v = tuple.__getitem__(self, index[key])
+			except KeyError:
+				raise KeyError("Attribute '%s' is not in the schema for this object." % key)
+			if v is _missing:
+				raise KeyError("Object instance does not have attribute '%s'" % key)
+			return v
+		return tuple.__getitem__(self, key)
+
+	namespace = {'__slots__': (), '__getitem__': __getitem__}
+	for name in optional:
+		i = index[name]
+		namespace[base._fields[i]] = property(_optionalgetter(i, name))
+
+	return type("FSD_Tuple", (base,), namespace)
+
+_vectorTuples = {}
+
+def _materialize_object(obj, depth):
+	cls = type(obj)
+	tupleClass = cls.__dict__.get("_tuple")
+	if tupleClass is None:
+		attributes = cls.attributes
+		# attributes that are not at a constant offset may be missing.
+		constant = cls.__schema__.get('constantAttributeOffsets', ())
+		optional = [name for name, schema in attributes.iteritems() if name not in constant and 'default' not in schema]
+		tupleClass = cls._tuple = _TupleClass(attributes.keys(), optional)
+
+	values = []
+	_a = values.append
+	for get in cls._getter_list:
+		try:
+			v = get(obj)
+		except AttributeError:
+			_a(_missing)
+			continue
+		_a(v if type(v) in _plainTypes else _materialize(v, depth))
+	return tuple.__new__(tupleClass, values)
+
+def _materialize_vector(vec, depth):
+	aliases = vec.schema['aliases']
+	names = tuple(sorted(aliases, key=aliases.get))
+	tupleClass = _vectorTuples.get(names)
+	if tupleClass is None:
+		tupleClass = _vectorTuples[names] = _TupleClass(names)
+	return tuple.__new__(tupleClass, vec.data)
+
+def _materialize_list(lst, depth):
+	s = lst.itemSchema
+	if s['type'] in _typeSizes or s['type'] in ('string', 'resPath', 'unicode', 'enum'):
+		# no further decoding required.
+		return tuple(lst)
+	return tuple([_materialize(v, depth) for v in lst])
+
+def _materialize_dict(d, depth):
+	result = FSD_MaterializedDict()
+	for key, v in d.iteritems():
+		result[key] = v if type(v) in _plainTypes else _materialize(v, depth)
+	if isinstance(d, FSD_MultiIndex):
+		for name in d._indices:
+			setattr(result, name, _materialize_dict(getattr(d, name), depth))
+	return result
+
+_plainTypes = frozenset((int, long, float, bool, str, unicode, tuple, type(None)))
+
+_materializers = {
+	_pyFSD.FsdList: _materialize_list,
+	_FixedSizeList: _materialize_list,
+	_VariableSizedList: _materialize_list,
+	FSD_NamedVector: _materialize_vector,
+	_pyFSD.FsdDict: _materialize_dict,
+	FSD_Dict: _materialize_dict,
+}
+
+def _materialize(v, depth):
+	if depth is not None:
+		if depth <= 0:
+			return v
+		depth -= 1
+
+	func = _materializers.get(type(v))
+	if func:
+		return func(v, depth)
+	if isinstance(v, FSD_Object):
+		return _materialize_object(v, depth)
+	if isinstance(v, FSD_MaterializedDict) or type(v) in _plainTypes:
+		return v
+	if hasattr(v, "iteritems"):
+		return _materialize_dict(v, depth)
+	return v
+
+
 #-----------------------------------------------------------------------------
 # Exposed stuff
 #-----------------------------------------------------------------------------
@@ -833,6 +1164,8 @@ def PrepareSchema(schema):
 
 	elif t == 'list':
 		PrepareSchema(schema['itemTypes'])
+		if nativeDecoders:
+			schema['loader'] = _pyFSD.FsdList
 
 	elif t == 'dict':
 		PrepareSchema(schema['keyTypes'])
@@ -849,6 +1182,9 @@ def PrepareSchema(schema):
 			# apparently this info is gone from some fsd dicts in Rubicon
 			schema['header'] = ()
 
+		if nativeDecoders and schema['keyTypes']['type'] == 'int':
+			schema['loader'] = _NativeDict
+
 	elif t == 'object':
 		if "endOfFixedSizeData" not in schema:
 			schema["endOfFixedSizeData"] = 0
@@ -858,6 +1194,8 @@ def PrepareSchema(schema):
 			attrschema['AttributeError'] = AttributeError("Object instance does not have attribute '%s'" % key)
 			attrschema['KeyError'] = KeyError("Object instance does not have attribute '%s'" % key)
 
+		schema['loader'] = _ObjectClass(schema)
+
 	elif t == 'binary':
 		PrepareSchema(schema["schema"])
 
@@ -898,10 +1236,31 @@ def LoadFromString(dataString, optimizedSchema=None):
 		return load(dataString, 0, optimizedSchema)
 
 
-def LoadIndexFromFile(f, optimizedSchema, cacheItems=None, offset=0):
+def LoadIndexFromFile(f, optimizedSchema, cacheItems=None, offset=0, mapped=False):
+	"""Returns disk-based index on the data in file f. If mapped is true, the
+	items are decoded from a memory map of the file instead of read from it.
+	"""
+	if mapped:
+		try:
+			f = _MappedFile(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+		except (ValueError, EnvironmentError):
+			pass  # can't be mapped; fall back to reading it.
+
+	if not hasattr(f, "pread"):
+		f = _SharedFile(f)
+
 	if optimizedSchema.get("multiIndex", False):
 		return FSD_MultiIndex(f, cacheItems, optimizedSchema, offset=offset)
 	return FSD_Index(f, cacheItems, optimizedSchema, offset=offset)
 
 
 
+
+
+def materialize(container, depth=None):
+	"""Returns FSD container decoded entirely into plain Python structures;
+	FSD_MaterializedDict for dicts and indices, tuples for lists, and named
+	tuples for objects. If depth is given, only that many levels of nested
+	containers are decoded.
+	"""
+	return _materialize(container, depth)
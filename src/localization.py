@@ -19,6 +19,13 @@ Used with permission from CCP.
 import os
 import cPickle
 import gc
+import hashlib
+import mmap
+import struct
+import threading
+
+from . import _blue as blue
+from . import _pyFSD
 
 debug = False
 
@@ -77,9 +84,188 @@ class NumericPropertyHandler(BasePropertyHandler):
 	__id__ = 9
 
 
+#-----------------------------------------------------------------------------
+# Language packs
+#-----------------------------------------------------------------------------
+#
+# Indexed versions of the localization pickles, which are memory-mapped and
+# only decode the entries that are looked up. Each pack file starts with a
+# header and a key (the hashes of the pickles it was made from), followed by
+#
+# - messages: count, (messageID, offset, size) entries sorted by messageID,
+#   and the marshalled messages.
+# - labels: count, offsets of the labels, their messageIDs, and the labels,
+#   sorted.
+
+_PACK_MAGIC = "RVLOCP"
+_PACK_VERSION = 1
+_packHeader = struct.Struct("<6sHH")
+
+_uint32 = struct.Struct("<I")
+_uint32pair = struct.Struct("<II")
+
+_labelResNames = (
+	"res:/localization/localization_main.pickle",
+	"res:/localizationfsd/localization_fsd_main.pickle",
+)
+
+def _messageResNames(languageID):
+	return (
+		"res:/localization/localization_%s.pickle" % languageID,
+		"res:/localizationfsd/localization_fsd_%s.pickle" % languageID,
+	)
+
+
+def _loadmessages(res, languageID):
+	# returns dict of messageID: (text, ?, tokens) for language.
+	resMain, resFSD = _messageResNames(languageID)
+	x, data = cPickle.loads(res.Open(resMain).read())
+	data.update(cPickle.loads(res.Open(resFSD).read())[1])
+	return data
+
+
+def _loadlabels(res):
+	# returns dict of label: messageID.
+	labels = {}
+	for resname in _labelResNames:
+		unPickledObject = cPickle.loads(res.Open(resname).read())
+		for messageID, dataRow in unPickledObject['labels'].iteritems():
+			fp = dataRow['FullPath']
+			label = fp + '/' + dataRow['label'] if fp else dataRow['label']
+			labels[label.encode('ascii')] = messageID
+	return labels
+
+
+def _writepack(path, key, chunks):
+	tempname = "%s.%d.tmp" % (path, os.getpid())
+	with open(tempname, "wb") as f:
+		f.write(_packHeader.pack(_PACK_MAGIC, _PACK_VERSION, len(key)))
+		f.write(key)
+		for chunk in chunks:
+			f.write(chunk)
+	if os.name == "nt" and os.path.exists(path):
+		os.remove(path)
+	os.rename(tempname, path)
+
+
+def _messagechunks(messages):
+	ids = sorted(messages)
+	blobs = map(blue.marshal.Save, map(messages.__getitem__, ids))
+	entries = []
+	offset = 0
+	for messageID, blob in zip(ids, blobs):
+		entries.append(struct.pack("<III", messageID, offset, len(blob)))
+		offset += len(blob)
+	return [_uint32.pack(len(ids))] + entries + blobs
+
+
+def _labelchunks(labels):
+	names = sorted(labels)
+	offsets = [0]
+	for label in names:
+		offsets.append(offsets[-1] + len(label))
+	return [
+		_uint32.pack(len(names)),
+		struct.pack("<%dI" % len(offsets), *offsets),
+		struct.pack("<%dI" % len(names), *map(labels.__getitem__, names)),
+	] + names
+
+
+class _Pack(object):
+	# memory-mapped pack file; valid is false if it is missing, or was not
+	# made from the pickles identified by key.
+
+	def __init__(self, path, key):
+		self.valid = False
+		try:
+			with open(path, "rb") as f:
+				self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		except (EnvironmentError, ValueError):
+			return
+
+		m = self.map
+		if len(m) >= _packHeader.size:
+			magic, version, keyLength = _packHeader.unpack_from(m, 0)
+			pos = _packHeader.size + keyLength
+			if magic == _PACK_MAGIC and version == _PACK_VERSION and m[_packHeader.size:pos] == key:
+				self._setup(pos)
+				self.valid = True
+
+
+class _MessagePack(_Pack):
+
+	chunks = staticmethod(_messagechunks)
+
+	def _setup(self, pos):
+		count = _uint32.unpack_from(self.map, pos)[0]
+		end = pos + 4 + count*12
+		self.index = _pyFSD.FsdUnsignedIntegerKeyMap()
+		self.index.Initialize(self.map[pos:end], 0, True, False, end)
+
+	def get(self, messageID, default=None):
+		if not 0 <= messageID <= 0xFFFFFFFF:
+			# the keymap would truncate it.
+			return default
+		try:
+			offsetAndSize = self.index.Get(messageID)
+		except (ValueError, OverflowError):
+			return default
+		if offsetAndSize is None:
+			return default
+		offset, size = offsetAndSize
+		return blue.marshal.Load(self.map[offset:offset+size])
+
+
+class _LabelPack(_Pack):
+
+	chunks = staticmethod(_labelchunks)
+
+	def _setup(self, pos):
+		self.count = count = _uint32.unpack_from(self.map, pos)[0]
+		self.offsets = pos + 4
+		self.messageIDs = self.offsets + 4*(count+1)
+		self.labels = self.messageIDs + 4*count
+
+	def _label(self, i):
+		start, end = _uint32pair.unpack_from(self.map, self.offsets + 4*i)
+		return self.map[self.labels+start:self.labels+end]
+
+	def get(self, label, default=None):
+		if type(label) is unicode:
+			try:
+				label = label.encode('ascii')
+			except UnicodeError:
+				return default
+
+		# binary search
+		lo = 0
+		hi = self.count
+		while lo < hi:
+			mid = (lo+hi) // 2
+			if self._label(mid) < label:
+				lo = mid + 1
+			else:
+				hi = mid
+		if lo < self.count and self._label(lo) == label:
+			return _uint32.unpack_from(self.map, self.messageIDs + 4*lo)[0]
+		return default
+
+
+#-----------------------------------------------------------------------------
+
 class Localization(object):
+	"""Translations of EVE's static content.
+
+	If packPath is given, the localization pickles are converted to language
+	packs in that folder, from which messages are decoded as needed. This also
+	makes GetByMessageID() and GetByLabel() honour their languageID argument,
+	opening the language pack concerned when first used.
+	"""
 
-	def __init__(self, eve, languageID="en-us", cfgInstance=None):
+	# number of compiled message templates kept by _format().
+	templateCacheSize = 10000
+
+	def __init__(self, eve, languageID="en-us", cfgInstance=None, packPath=None):
 		self.cfg = cfgInstance or cfg
 
 		self._propertyHandlers = {}
@@ -87,82 +273,188 @@ class Localization(object):
 			if isinstance(cls, type) and issubclass(cls, BasePropertyHandler):
 				self._propertyHandlers[cls.__id__] = cls(self, cfgInstance)
 
-		res = eve.ResFile()
+		self.eve = eve
+		self.languageID = languageID
+		self.packPath = packPath
 
-		def _loadlanguage(languageID):
-			x, data = cPickle.loads(res.Open("res:/localization/localization_%s.pickle" % languageID).read())
-			data.update(cPickle.loads(res.Open("res:/localizationfsd/localization_fsd_%s.pickle" % languageID).read())[1])
-			return data
+		self._templates = {}
 
-		self.languageID = languageID
+		if packPath:
+			# everything is loaded on demand.
+			self._packs = {}
+			self._lock = threading.Lock()
+			return
+
+		res = eve.ResFile()
 
 		# load primary language
-		self.primary = _loadlanguage(languageID)
+		self.primary = _loadmessages(res, languageID)
 
 		# if the primary language isn't english, load the english pack as fallback
 		if languageID != "en-us":
-			self.fallback = _loadlanguage("en-us")
+			self.fallback = _loadmessages(res, "en-us")
 		else:
 			self.fallback = None
 
-		self.languageLabels = {}
-
 		# load labels
-		for resname in (
-			"res:/localization/localization_main.pickle",
-			"res:/localizationfsd/localization_fsd_main.pickle",
-		):
-			unPickledObject = cPickle.loads(res.Open(resname).read())
-			for messageID, dataRow in unPickledObject['labels'].iteritems():
-				fp = dataRow['FullPath']
-				label = fp + '/' + dataRow['label'] if fp else dataRow['label']
-				self.languageLabels[label.encode('ascii')] = messageID
+		self.languageLabels = _loadlabels(res)
 
 		# clean up some stuff immediately (frees ~4MB)
-		del unPickledObject
 		gc.collect()
 
 
-	def _format(self, fmt, param, languageID):
-		raw, noclue, tokens = fmt
+	def _pack(self, name, resNames, packClass, load):
+		# returns the named language pack, building it if necessary.
+		pack = self._packs.get(name)
+		if pack is None:
+			with self._lock:
+				pack = self._packs.get(name)
+				if pack is None:
+					pack = self._packs[name] = self._openpack(name, resNames, packClass, load)
+		return pack
+
+
+	def _openpack(self, name, resNames, packClass, load):
 		try:
-			for token, data in tokens.iteritems():
+			hashes = map(self.eve.rescache.filehash, resNames)
+		except EnvironmentError:
+			hashes = None  # no index
+
+		if not (hashes and all(hashes)):
+			# can't tell if a pack is up to date, so don't use one.
+			return load(self.eve.ResFile())
+
+		# the key goes in the file name as well, so that installs of different
+		# versions can share the folder without overwriting each other's packs.
+		key = ",".join(hashes)
+		path = os.path.join(self.packPath, "localization_%s-%s.rvpack" % (name, hashlib.md5(key).hexdigest()))
+
+		pack = packClass(path, key)
+		if pack.valid:
+			return pack
+
+		data = load(self.eve.ResFile())
+		try:
+			if not os.path.isdir(self.packPath):
+				os.makedirs(self.packPath)
+			_writepack(path, key, packClass.chunks(data))
+		except EnvironmentError:
+			# can't write the pack, so keep what was loaded instead.
+			return data
+
+		pack = packClass(path, key)
+		return pack if pack.valid else data
+
+
+	def _message(self, messageID, languageID):
+		tr = self._pack(languageID, _messageResNames(languageID), _MessagePack, lambda res: _loadmessages(res, languageID)).get(messageID)
+		if tr is None and languageID != "en-us":
+			tr = self._message(messageID, "en-us")
+		return tr
+
+
+	def _compile(self, fmt):
+		# turns message into a format string with a %s for each token, the
+		# (getter, variableName, kwargs) of the distinct tokens, and for each
+		# %s the index of the token to insert there.
+		raw, noclue, tokens = fmt
+
+		replacements = []
+		found = []
+		for token, data in tokens.iteritems():
+			try:
 				handler = self._propertyHandlers[data['variableType']]
-				getter = getattr(handler, data['propertyName'] or "default")
-				replacement = getter(param[data['variableName']], languageID, **data['kwargs'])
-				raw = raw.replace(token, unicode(replacement))
+			except KeyError:
+				if debug:
+					print "NO HANDLER FOR:"
+					print "- token:", token
+					print "- data:", data
+					print "- format:", raw
+				raise
+			pos = raw.find(token)
+			if pos == -1:
+				continue
+			while pos != -1:
+				found.append((pos, token, len(replacements)))
+				pos = raw.find(token, pos+len(token))
+			replacements.append((getattr(handler, data['propertyName'] or "default"), data['variableName'], data['kwargs']))
+		found.sort()
+
+		parts = []
+		order = []
+		pos = 0
+		for start, token, index in found:
+			if start < pos:
+				continue  # overlaps previous token
+			parts.append(raw[pos:start].replace("%", "%%"))
+			parts.append("%s")
+			order.append(index)
+			pos = start + len(token)
+		parts.append(raw[pos:].replace("%", "%%"))
+
+		return u"".join(parts), tuple(replacements), tuple(order)
+
+
+	def _format(self, messageID, fmt, param, languageID):
+		# the raw text is part of the key, as the message can come from the
+		# primary or fallback language.
+		key = (messageID, fmt[0])
+		template = self._templates.get(key)
+		if template is None:
+			template = self._compile(fmt)
+			if self.templateCacheSize:
+				templates = self._templates
+				while len(templates) >= self.templateCacheSize:
+					try:
+						templates.popitem()
+					except KeyError:
+						break
+				templates[key] = template
+
+		text, replacements, order = template
+		if not order:
+			return fmt[0]
+
+		try:
+			values = [getter(param[variableName], languageID, **kwargs) for getter, variableName, kwargs in replacements]
 		except KeyError:
 			if debug:
-				print "NO HANDLER FOR:"
-				print "- token:", token
-				print "- data:", data
+				print "NO PARAMETER FOR:"
+				print "- format:", fmt[0]
 				print "- param:", param
-				print "- format:", raw
 			raise
 
-		return raw
+		return text % tuple([values[i] for i in order])
 
 
 	def GetByMessageID(self, messageID, languageID=None, **kwarg):
 		if messageID is None:
 			return ""
 
-		tr = self.primary.get(messageID, False)
-		if tr == False and self.fallback:
-			tr = self.fallback.get(messageID)
+		if self.packPath:
+			tr = self._message(messageID, languageID or self.languageID)
+		else:
+			tr = self.primary.get(messageID, False)
+			if tr == False and self.fallback:
+				tr = self.fallback.get(messageID)
 		if tr:
 			if kwarg or tr[2]:
-				return self._format(tr, kwarg, languageID)
+				return self._format(messageID, tr, kwarg, languageID)
 			return tr[0]
 
 		return "<NO TEXT, messageID=%d, param=%s>" % (messageID, kwarg)
 
 
 	def GetByLabel(self, label, languageID=None, **kwarg):
-		try:
-			messageID = self.languageLabels[label]
-		except KeyError:
-			return '[no label: %s]' % label
+		if self.packPath:
+			messageID = self._pack("labels", _labelResNames, _LabelPack, _loadlabels).get(label)
+			if messageID is None:
+				return '[no label: %s]' % label
+		else:
+			try:
+				messageID = self.languageLabels[label]
+			except KeyError:
+				return '[no label: %s]' % label
 
 		return self.GetByMessageID(messageID, languageID, **kwarg)
 
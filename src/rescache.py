@@ -53,6 +53,13 @@ class ResourceCache(object):
 		return fullPath
 					
 
+	def filehash(self, name):
+		"""Returns hash of the named resource according to the index, or None
+		if the index does not have it."""
+		row = self._index.get(name.lower())
+		return row[2] if row else None
+
+
 	@_memoize
 	def _index(self):
 		d = {}